@@ -0,0 +1,2 @@
+#Standalone benchmark scripts, run from the project root, e.g. ###python -m benchmarks.page_views###
+#They run against a throwaway in-memory test database, so they neither need nor touch elearning_db.sqlite3
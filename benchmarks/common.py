@@ -0,0 +1,61 @@
+import os
+import statistics
+import sys
+import time
+
+import django
+
+#Shared set up for the benchmark scripts. Boots django with the project settings, swaps the external services
+#(Redis channel layer and Celery broker) for in-process equivalents and creates an empty test database.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elearning.settings')
+
+BENCHMARK_SETTINGS = {
+    'SECURE_SSL_REDIRECT': False,
+    'SESSION_COOKIE_SECURE': False,
+    'CSRF_COOKIE_SECURE': False,
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    'LOBBY_HISTORY_REDIS_URL': None,
+    #The benchmarks time the requests themselves, server_timing.py measures the sampled request overhead
+    'SERVER_TIMING_SAMPLE_RATE': 0,
+}
+
+def setup_django(database_name=None, **extra_settings):
+    #database_name is a file for the test database, which is in memory otherwise
+    django.setup()
+
+    from django.test.utils import override_settings, setup_test_environment
+    from django.db import connection
+    from elearning.celery import app
+
+    override_settings(**{**BENCHMARK_SETTINGS, **extra_settings}).enable()
+    setup_test_environment()
+    #Tasks triggered while setting up data run inline rather than being sent to a broker
+    app.conf.task_always_eager = True
+    if database_name:
+        connection.settings_dict['TEST']['NAME'] = database_name
+    connection.creation.create_test_db(verbosity=0, keepdb=False)
+
+def measure(fn, repeat=50, warmup=3):
+    #Returns timings of fn in milliseconds
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def summarize(timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {'p50': statistics.median(ordered), 'p95': p95, 'mean': statistics.fmean(ordered)}
+
+def print_row(label, timings, width=48):
+    stats = summarize(timings)
+    print(f"{label:<{width}} p50 {stats['p50']:8.2f} ms   p95 {stats['p95']:8.2f} ms")
@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import json
+import platform
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+
+from benchmarks.common import setup_django, summarize
+
+#Benchmark of every route in elearning_base/urls.py (traditional views and api endpoints) against a database seeded with the
+#seed_data command at several sizes. For each route it records p50/p95 latency, SQL query count, SQL time and the response
+#payload size, and writes them to a JSON file. A saved results file can be used as the baseline to flag regressions.
+#Requests run through the django test client, every request runs in a transaction that is rolled back afterwards so the
+#create/update/delete endpoints can be repeated against the same data.
+#
+#   python -m benchmarks.endpoints --sizes 1000 5000 --output results.json
+#   python -m benchmarks.endpoints --sizes 1000 --compare baseline.json
+#   python -m benchmarks.endpoints --input results.json --compare baseline.json
+
+#Group permissions of the shipped database (assigned through the admin, so a fresh database does not have them)
+GROUP_PERMISSIONS = {'Teachers': ['add_course'], 'Students': ['add_feedback', 'add_enrollments']}
+
+#File of the benchmarked resumable upload, already sent in full so it can be finalized
+UPLOAD_CONTENT = b'Benchmark upload content'
+
+def route(method, user, kwargs=None, data=None, query=None, format=None, label=None):
+    #user is the role making the request - 'teacher', 'student', 'throwaway' or None (anonymous)
+    #query is a dict of query parameters, or a function of the context returning one
+    return {'method': method, 'user': user, 'kwargs': kwargs or (lambda ctx: {}), 'data': data, 'query': query, 'format': format, 'label': label}
+
+#One or more benchmarked requests per url name, every url name in elearning_base/urls.py must be covered
+ROUTES = {
+    #Traditional views
+    'home': [route('get', 'student')],
+    'login': [
+        route('get', None),
+        route('post', None, data=lambda ctx: {'username': ctx['student'].username, 'password': ctx['password']}, label='login (POST)'),
+    ],
+    'user_profile': [route('get', 'student', lambda ctx: {'user_id': ctx['teacher'].user_id})],
+    'register': [route('get', None)],
+    'logout': [route('post', 'student')],
+    'swagger_logout': [route('get', 'student')],
+    'update_profile': [route('get', 'student')],
+    'search': [route('get', 'student', query={'query': 'python'})],
+    'create_course': [route('get', 'teacher')],
+    'course_page': [route('get', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'enrolled_taught_courses': [route('get', 'student')],
+    'enrolled_students': [route('get', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'notifications': [route('get', 'student')],
+    'lobby': [route('get', 'student')],
+    #A course file, the benchmarked upload's
+    'protected_media': [route('get', 'teacher', lambda ctx: {'path': ctx['upload'].name})],
+
+    #Create
+    'create_user_api': [route('post', None, format='multipart', data=lambda ctx: {
+        'username': 'bench_new_user', 'email': 'bench_new_user@example.com', 'password': ctx['password'],
+        'first_name': 'Bench', 'last_name': 'User', 'is_teacher': False, 'date_of_birth': '2000-01-01',
+    })],
+    'create_status_update': [route('post', 'student', format='json', data=lambda ctx: {'status': 'Benchmark status update'})],
+    'create_course_api': [route('post', 'teacher', format='multipart', data=lambda ctx: {'course_title': 'Benchmark course', 'description': 'Benchmark course description'})],
+    'create_feedback': [route('post', 'student', lambda ctx: {'course_id': ctx['course'].course_id}, format='json', data=lambda ctx: {'feedback': 'Benchmark feedback'})],
+    'create_enrollment': [route('post', 'student', lambda ctx: {'course_id': ctx['other_course'].course_id}, format='json', data=lambda ctx: {})],
+    'create_enrollments': [route('post', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id}, format='json', data=lambda ctx: ctx['enrolled_usernames'])],
+    'create_course_activity': [route('post', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id}, format='json', data=lambda ctx: {
+        'activity_title': 'Benchmark activity', 'description': 'Benchmark activity description', 'activity_type': 'LECTURE',
+    })],
+    'create_course_activity_material': [route('post', 'teacher', lambda ctx: {'activity_id': ctx['activity'].activity_id}, format='multipart', data=lambda ctx: {
+        'material_title': 'Benchmark material', 'description': 'Benchmark material description', 'video_link': 'https://example.com/video',
+    })],
+    'create_upload': [route('post', 'teacher', format='json', data=lambda ctx: {
+        'target': 'MATERIAL', 'course_activity': ctx['activity'].activity_id, 'filename': 'benchmark.pdf', 'size': len(UPLOAD_CONTENT),
+        'checksum': hashlib.sha256(UPLOAD_CONTENT).hexdigest(), 'material_title': 'Benchmark upload', 'description': 'Benchmark upload description',
+    })],
+    'upload_chunk': [route('get', 'teacher', lambda ctx: {'upload_id': ctx['upload'].upload_id})],
+    'finalize_upload': [route('post', 'teacher', lambda ctx: {'upload_id': ctx['upload'].upload_id})],
+
+    #Update
+    'update_blocked_status': [route('patch', 'teacher', lambda ctx: {'enrollment_id': ctx['enrollment'].enrollment_id}, format='json', data=lambda ctx: {'blocked': True})],
+    'update_submission_grades': [route('post', 'teacher', lambda ctx: {'activity_id': ctx['activity'].activity_id}, format='json', data=lambda ctx: [
+        {'student': username, 'grade': 80} for username in ctx['enrolled_usernames']
+    ])],
+    'update_notification_read': [route('patch', 'student', lambda ctx: {'notification_id': ctx['notification'].notification_id}, format='json', data=lambda ctx: {'read': True})],
+    'mark_notifications_read': [route('post', 'student', format='json', data=lambda ctx: {'notification_ids': ctx['notification_ids']})],
+    'update_user_api': [route('patch', 'student', lambda ctx: {'user_id': ctx['student'].user_id}, format='multipart', data=lambda ctx: {'bio': 'Benchmark bio'})],
+
+    #Get
+    'get_status_updates': [route('get', 'student', lambda ctx: {'user_id': ctx['student'].user_id})],
+    'get_enrolled_courses': [route('get', 'student', lambda ctx: {'user_id': ctx['student'].user_id})],
+    'get_courses_taught': [route('get', 'teacher', lambda ctx: {'user_id': ctx['teacher'].user_id})],
+    'get_search_results': [route('get', 'teacher', lambda ctx: {'search_query': 'python'})],
+    'get_available_courses': [route('get', 'student')],
+    'get_enrolled_students': [route('get', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'get_course_feedback': [route('get', 'student', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'get_gradebook': [route('get', 'teacher', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'get_course_activities_with_materials': [route('get', 'student', lambda ctx: {'course_id': ctx['course'].course_id})],
+    'get_notifications': [route('get', 'student', lambda ctx: {'user_id': ctx['student'].user_id})],
+    'get_latest_lobby_messages': [route('get', 'student')],
+    'get_lobby_history': [
+        route('get', 'student'),
+        route('get', 'student', query=lambda ctx: {'cursor': ctx['lobby_cursor']}, label='get_lobby_history (middle page)'),
+    ],
+    'get_user_api': [route('get', 'student', lambda ctx: {'user_id': ctx['teacher'].user_id})],
+
+    #Delete
+    'delete_status_update': [route('delete', 'student', lambda ctx: {'status_id': ctx['status_update'].status_id})],
+    'delete_course_activity': [route('delete', 'teacher', lambda ctx: {'activity_id': ctx['activity'].activity_id})],
+    'delete_user_api': [route('delete', 'throwaway', lambda ctx: {'user_id': ctx['throwaway'].user_id})],
+}
+
+def check_coverage():
+    from elearning_base.urls import urlpatterns
+    names = {pattern.name for pattern in urlpatterns if pattern.name}
+    missing = sorted(names - ROUTES.keys())
+    if missing:
+        sys.exit(f"Routes without a benchmark in ROUTES: {', '.join(missing)}")
+
+def seed(size, seed):
+    from django.core.cache import cache
+    from django.core.management import call_command
+    call_command('flush', interactive=False, verbosity=0)
+    #Seeding again recreates the same course ids and creation times, trees cached for the previous data set would be served
+    cache.clear()
+    call_command(
+        'seed_data', '--end-date=2024-06-01', seed=seed, users=size, courses=max(10, size // 10), lobby_messages=size, stdout=StringIO(),
+    )
+
+def build_context(password):
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.models import Group, Permission
+    from django.db.models import Count
+    from django.core.files.storage import default_storage
+    from elearning_base.models import Course, CourseActivity, Enrollments, LobbyMessage, Notification, StatusUpdate, Upload
+    from elearning_base.pagination import encode_cursor
+    from elearning_base import uploads
+
+    User = get_user_model()
+    for group_name, codenames in GROUP_PERMISSIONS.items():
+        Group.objects.get(name=group_name).permissions.add(*Permission.objects.filter(content_type__app_label='elearning_base', codename__in=codenames))
+
+    #The most popular course and one of its students, the heaviest realistic case for most pages
+    course = Course.objects.annotate(enrollment_count=Count('enrollments')).order_by('-enrollment_count', 'course_id').first()
+    enrollment = Enrollments.objects.filter(course=course, blocked=False).order_by('enrollment_id').first()
+    student = enrollment.student
+    activity = CourseActivity.objects.filter(course=course).order_by('activity_id').first() \
+        or CourseActivity.objects.create(course=course, activity_title='Benchmark lecture', description='Description')
+    upload = uploads.start(course.teacher, activity, Upload.MATERIAL, 'benchmark.pdf', size=len(UPLOAD_CONTENT), checksum=hashlib.sha256(UPLOAD_CONTENT).hexdigest(),
+                           material_title='Benchmark finalized upload', description='Description')
+    with open(default_storage.path(upload.name), 'wb') as f:
+        f.write(UPLOAD_CONTENT)
+    Upload.objects.filter(pk=upload.pk).update(offset=len(UPLOAD_CONTENT))
+    ctx = {
+        'password': password,
+        'course': course,
+        'teacher': course.teacher,
+        'enrollment': enrollment,
+        'student': student,
+        'other_course': Course.objects.exclude(enrollments__student=student).order_by('course_id').first(),
+        'activity': activity,
+        'upload': upload,
+        'notification': Notification.objects.filter(recipient=student, read=False).order_by('notification_id').first()
+            or Notification.objects.create(recipient=student, title='Benchmark', message='Benchmark'),
+        'notification_ids': list(Notification.objects.filter(recipient=student).values_list('notification_id', flat=True)[:100]),
+        'status_update': StatusUpdate.objects.filter(user=student).order_by('status_id').first()
+            or StatusUpdate.objects.create(user=student, status='Benchmark'),
+        'enrolled_usernames': list(Enrollments.objects.filter(course=course).values_list('student__username', flat=True)[:500]),
+        'throwaway': User.objects.create_user(username='bench_throwaway', email='bench_throwaway@example.com', password=password),
+        #Cursor of a lobby history page half way back
+        'lobby_cursor': encode_cursor(LobbyMessage.objects.order_by('-created_at', '-pk')[LobbyMessage.objects.count() // 2], 'created_at'),
+    }
+    return ctx
+
+@contextmanager
+def sql_recorder(connection):
+    stats = {'queries': 0, 'sql_ms': 0.0}
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats['queries'] += 1
+            stats['sql_ms'] += (time.perf_counter() - start) * 1000
+    with connection.execute_wrapper(wrapper):
+        yield stats
+
+def run_route(client, url, spec, ctx, repeat, warmup):
+    from django.db import connection, transaction
+
+    data = spec['data'](ctx) if spec['data'] else None
+    def request():
+        kwargs = {'data': data, 'format': spec['format']} if spec['format'] else ({'data': data} if data is not None else {})
+        if spec['query']:
+            kwargs['data'] = spec['query'](ctx) if callable(spec['query']) else spec['query']
+        response = getattr(client, spec['method'])(url, **kwargs)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    timings, samples = [], []
+    for i in range(warmup + repeat):
+        with transaction.atomic():
+            with sql_recorder(connection) as stats:
+                start = time.perf_counter()
+                response, body = request()
+                elapsed = (time.perf_counter() - start) * 1000
+            transaction.set_rollback(True)
+        if i >= warmup:
+            timings.append(elapsed)
+            samples.append((stats['queries'], stats['sql_ms'], len(body), response.status_code))
+
+    summary = summarize(timings)
+    #Query count, payload and status are the same on every repetition, SQL time is averaged like the latency
+    queries, _, payload, status_code = samples[-1]
+    return {
+        'status': status_code,
+        'p50_ms': round(summary['p50'], 3),
+        'p95_ms': round(summary['p95'], 3),
+        'queries': queries,
+        'sql_ms': round(sum(sample[1] for sample in samples) / len(samples), 3),
+        'bytes': payload,
+    }
+
+def run(args, media_root):
+    setup_django(MEDIA_ROOT=media_root)
+    check_coverage()
+
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    results = []
+    for size in args.sizes:
+        started = time.perf_counter()
+        seed(size, args.seed)
+        ctx = build_context('Seed-password1!')
+        print(f"\nsize {size} users (seeded in {time.perf_counter() - started:.1f}s)")
+        print(f"{'endpoint':<44} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'sql ms':>8} {'bytes':>9}")
+
+        for name, specs in ROUTES.items():
+            for spec in specs:
+                label = spec['label'] or name
+                if args.only and not any(pattern in label for pattern in args.only):
+                    continue
+                url = reverse(name, kwargs=spec['kwargs'](ctx))
+                #A client per route, so the cookies a route sets (logout, login) do not affect the others.
+                #Exceptions in a view are recorded as a 500 rather than stopping the run (swagger_logout only works with DEBUG on)
+                client = APIClient(raise_request_exception=False)
+                if spec['user']:
+                    client.force_login(ctx[spec['user']])
+                result = run_route(client, url, spec, ctx, args.repeat, args.warmup)
+                results.append({'size': size, 'endpoint': label, 'method': spec['method'].upper(), **result})
+                flag = '' if result['status'] < 400 else '  <- unexpected status'
+                print(f"{label:<44} {result['status']:>6} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['queries']:>8} {result['sql_ms']:>8.2f} {result['bytes']:>9}{flag}")
+
+    import django
+    return {
+        'meta': {
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sizes': args.sizes,
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+def compare(baseline, current, threshold, min_ms):
+    #A result regresses if its latency grows by more than threshold (and min_ms), its query count grows or its payload
+    #grows by more than threshold. Returns the regressions as printable rows.
+    previous = {(row['size'], row['endpoint']): row for row in baseline['results']}
+    regressions = []
+    for row in current['results']:
+        before = previous.get((row['size'], row['endpoint']))
+        if not before:
+            continue
+        reasons = []
+        if row['p50_ms'] > before['p50_ms'] * (1 + threshold) and row['p50_ms'] - before['p50_ms'] > min_ms:
+            reasons.append(f"p50 {before['p50_ms']:.2f} -> {row['p50_ms']:.2f} ms")
+        if row['queries'] > before['queries']:
+            reasons.append(f"queries {before['queries']} -> {row['queries']}")
+        if row['bytes'] > before['bytes'] * (1 + threshold):
+            reasons.append(f"bytes {before['bytes']} -> {row['bytes']}")
+        if row['status'] != before['status']:
+            reasons.append(f"status {before['status']} -> {row['status']}")
+        if reasons:
+            regressions.append(f"size {row['size']:>7}  {row['endpoint']:<44} {', '.join(reasons)}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000], help='Number of seeded users, courses and lobby messages scale with it')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='+', help='Only benchmark endpoints whose name contains one of these')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--input', help='Compare an existing results file instead of running the benchmark')
+    parser.add_argument('--compare', help='Baseline results file to flag regressions against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative latency/payload growth flagged as a regression')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='Latency growth below this many ms is never flagged')
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input) as f:
+            current = json.load(f)
+    else:
+        #The seeded images and the uploads the routes write go to a throwaway directory, not the project's MEDIA_ROOT
+        with tempfile.TemporaryDirectory() as media_root:
+            current = run(args, media_root)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+            print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold, args.min_ms)
+        print(f"\n{len(regressions)} regression(s) against {args.compare}")
+        for regression in regressions:
+            print(regression)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
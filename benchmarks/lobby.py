@@ -0,0 +1,55 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from benchmarks.common import setup_django, summarize
+
+#Latency of a public lobby message, from the client sending it to the client receiving the broadcast, with the message
+#written before the broadcast ("write-through") and written afterwards in batches (lobby_buffer.py, "write-behind").
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    logging.getLogger('elearning_base.lobby_buffer').setLevel(logging.WARNING)
+
+    from channels.auth import AuthMiddlewareStack
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from django.contrib.auth import get_user_model
+    from django.test.utils import override_settings
+    from elearning_base.lobby_buffer import lobby_buffer
+    from elearning_base.models import LobbyMessage
+    from elearning_base.routing import websocket_urlpatterns
+
+    user = get_user_model().objects.create_user(username='bench_user', password='Bench-pass1!', email='bench_user@test.com')
+
+    async def run():
+        communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), 'ws/lobby/')
+        communicator.scope['user'] = user
+        await communicator.connect()
+        timings = []
+        start = time.perf_counter()
+        for i in range(args.messages):
+            sent = time.perf_counter()
+            await communicator.send_json_to({'message': f'Message {i}'})
+            await communicator.receive_json_from()
+            timings.append((time.perf_counter() - sent) * 1000)
+        await lobby_buffer.flush()
+        total = time.perf_counter() - start
+        await communicator.disconnect()
+        return timings, total
+
+    for label, write_behind in (('write-through', False), ('write-behind', True)):
+        with override_settings(LOBBY_WRITE_BEHIND=write_behind):
+            timings, total = asyncio.run(run())
+        stats = summarize(timings)
+        written = LobbyMessage.objects.count()
+        LobbyMessage.objects.all().delete()
+        print(f"{label:<16} p50 {stats['p50']:6.2f} ms   p95 {stats['p95']:6.2f} ms   {args.messages / total:8.0f} msg/s   {written} written")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import time
+
+from benchmarks.common import setup_django
+
+#Benchmark of the new activity notification fan-out at different enrollment sizes.
+#"legacy" reproduces the previous approach - the signal enqueued one task per enrolled student and each task re-fetched
+#the student and course and created a single Notification row. "fan-out" is the single course-level task used now.
+#Enqueue time is the time spent in the request (the post_save signal), worker time is the time spent running the task(s).
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--broker', default='memory://', help='Broker the tasks are enqueued to, e.g. redis://localhost:6379/0')
+    args = parser.parse_args()
+
+    setup_django()
+
+    from celery import shared_task
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from elearning.celery import app
+    from elearning_base.models import Course, CourseActivity, Enrollments, Notification
+    from elearning_base.tasks import send_new_activity_notification
+
+    User = get_user_model()
+
+    @shared_task(name='benchmarks.legacy_send_new_activity_notification')
+    def legacy_send_new_activity_notification(student_id, course, activity_title):
+        student = User.objects.get(user_id=student_id)
+        course = Course.objects.get(course_id=course)
+        notification = Notification.objects.create(title="New Activity", recipient=student, message=f"New activity {activity_title} added course '{course.course_title}'")
+        async_to_sync(get_channel_layer().group_send)(
+            f"new_activity_notifications_{course.course_id}_{student.user_id}",
+            {"type": "new.notification", "message": notification.message, "title": notification.title}
+        )
+
+    def legacy_signal(activity):
+        student_ids = Enrollments.objects.filter(course=activity.course).values_list('student', flat=True)
+        for student_id in student_ids:
+            legacy_send_new_activity_notification.delay(student_id, activity.course.course_id, activity.activity_title)
+
+    teacher = User.objects.create_user(username='bench_teacher', password='Bench-pass1!', email='bench_teacher@test.com', is_teacher=True)
+
+    print(f"broker: {args.broker}")
+    print(f"{'students':>8} | {'approach':<8} | {'tasks':>6} | {'enqueue ms':>10} | {'worker ms':>10} | {'worker queries':>14}")
+    for size in args.sizes:
+        course = Course.objects.create(course_title=f'Course {size}', description='Description', teacher=teacher)
+        students = User.objects.bulk_create([User(username=f'student_{size}_{i}', email=f'student_{size}_{i}@test.com') for i in range(size)])
+        Enrollments.objects.bulk_create([Enrollments(course=course, student=student) for student in students])
+
+        app.conf.task_always_eager = False
+        app.conf.broker_url = args.broker
+
+        #Legacy - one task per student
+        activity = CourseActivity.objects.bulk_create([CourseActivity(course=course, activity_title='Legacy', description='Description')])[0]
+        start = time.perf_counter()
+        legacy_signal(activity)
+        legacy_enqueue = (time.perf_counter() - start) * 1000
+        student_ids = list(Enrollments.objects.filter(course=course).values_list('student', flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for student_id in student_ids:
+                legacy_send_new_activity_notification(student_id, course.course_id, activity.activity_title)
+            legacy_worker = (time.perf_counter() - start) * 1000
+        print(f"{size:>8} | {'legacy':<8} | {size:>6} | {legacy_enqueue:>10.1f} | {legacy_worker:>10.1f} | {len(queries):>14}")
+
+        #Course-level fan-out - the post_save signal enqueues a single task
+        start = time.perf_counter()
+        activity = CourseActivity.objects.create(course=course, activity_title='Fan-out', description='Description')
+        fan_out_enqueue = (time.perf_counter() - start) * 1000
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            send_new_activity_notification(activity.activity_id)
+            fan_out_worker = (time.perf_counter() - start) * 1000
+        print(f"{size:>8} | {'fan-out':<8} | {1:>6} | {fan_out_enqueue:>10.1f} | {fan_out_worker:>10.1f} | {len(queries):>14}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import json
+
+from benchmarks.common import setup_django, measure, print_row
+
+#Before/after benchmark of the data gathering for the home and course pages.
+#"before" is the previous approach of the views - calling the @api_view function and json.loads'ing the JsonResponse
+#"after" is the service layer call the views make now. The full page render through the test client is also reported.
+
+def build_dataset(enrollments, status_updates, activities, materials_per_activity, feedback):
+    from django.contrib.auth import get_user_model
+    from elearning_base.models import Course, Enrollments, StatusUpdate, CourseActivity, CourseActivityMaterial, Feedback
+
+    User = get_user_model()
+    teacher = User.objects.create_user(username='bench_teacher', password='Bench-pass1!', email='bench_teacher@test.com', is_teacher=True)
+    student = User.objects.create_user(username='bench_student', password='Bench-pass1!', email='bench_student@test.com', is_teacher=False)
+
+    #Bulk inserts do not fire the post_save signals, so no notifications are generated while setting up
+    courses = Course.objects.bulk_create([
+        Course(course_title=f'Course {i}', description=f'Description {i}', teacher=teacher) for i in range(enrollments)
+    ])
+    Enrollments.objects.bulk_create([Enrollments(course=course, student=student) for course in courses])
+    StatusUpdate.objects.bulk_create([StatusUpdate(user=student, status=f'Status {i}') for i in range(status_updates)])
+
+    course = courses[0]
+    course_activities = CourseActivity.objects.bulk_create([
+        CourseActivity(course=course, activity_title=f'Activity {i}', description=f'Description {i}') for i in range(activities)
+    ])
+    CourseActivityMaterial.objects.bulk_create([
+        CourseActivityMaterial(course_activity=activity, material_title=f'Material {j}', description='Description', video_link='https://example.com/video')
+        for activity in course_activities for j in range(materials_per_activity)
+    ])
+    others = User.objects.bulk_create([
+        User(username=f'feedback_student_{i}', email=f'feedback_student_{i}@test.com') for i in range(feedback)
+    ])
+    Feedback.objects.bulk_create([Feedback(course=course, student=other, feedback='Great course!') for other in others])
+    return teacher, student, course
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--enrollments', type=int, default=20)
+    parser.add_argument('--status-updates', type=int, default=50)
+    parser.add_argument('--activities', type=int, default=30)
+    parser.add_argument('--materials', type=int, default=3)
+    parser.add_argument('--feedback', type=int, default=100)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.test import Client, RequestFactory
+    from elearning_base import api, services, views
+
+    teacher, student, course = build_dataset(args.enrollments, args.status_updates, args.activities, args.materials, args.feedback)
+
+    factory = RequestFactory()
+    def make_request(path, user):
+        request = factory.get(path)
+        request.user = user
+        return request
+
+    home_request = make_request('/', student)
+    course_request = make_request(f'/course/{course.course_id}/', teacher)
+
+    def home_before():
+        json.loads(api.get_status_updates(home_request, student.user_id).content)
+        json.loads(api.get_enrolled_courses(home_request, student.user_id).content)
+
+    def home_after():
+        services.get_status_updates_page(home_request, student, page_size=views.PROFILE_PAGE_SIZE)
+        services.get_enrolled_courses_page(home_request, student, page_size=views.PROFILE_PAGE_SIZE)
+
+    def course_before():
+        json.loads(api.get_course_feedback(course_request, course.course_id).content)
+        json.loads(api.get_course_activities_with_materials(course_request, course.course_id).content)
+
+    def course_after():
+        services.get_course_feedback_page(course_request, course, page_size=views.FEEDBACK_PAGE_SIZE)
+        if services.can_view_course_activities(teacher, course):
+            services.get_course_activities_data(course_request, course)
+
+    student_client = Client()
+    student_client.force_login(student)
+    teacher_client = Client()
+    teacher_client.force_login(teacher)
+
+    print(f"home: {args.status_updates} status updates, {args.enrollments} enrollments | "
+          f"course: {args.activities} activities x {args.materials} materials, {args.feedback} feedback")
+    print_row('home data - api function + json.loads (before)', measure(home_before, args.repeat))
+    print_row('home data - service layer (after)', measure(home_after, args.repeat))
+    print_row('home page - full request (after)', measure(lambda: student_client.get('/'), args.repeat))
+    print_row('course data - api function + json.loads (before)', measure(course_before, args.repeat))
+    print_row('course data - service layer (after)', measure(course_after, args.repeat))
+    print_row('course page - full request (after)', measure(lambda: teacher_client.get(f'/course/{course.course_id}/'), args.repeat))
+
+if __name__ == '__main__':
+    main()
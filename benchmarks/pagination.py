@@ -0,0 +1,48 @@
+import argparse
+
+from benchmarks.common import setup_django, measure, print_row
+
+#Benchmark of the notifications inbox for a user with a large number of unread notifications.
+#"full list" is the previous approach - serializing every unread notification and paginating the list in python,
+#"keyset" fetches only the rendered page (pagination.py), reported for the first page and a page deep into the list.
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--notifications', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth import get_user_model
+    from django.core.paginator import Paginator
+    from django.test import RequestFactory
+    from elearning_base.models import Notification
+    from elearning_base.serializers import NotificationSerializer
+    from elearning_base.services import get_notifications_page
+
+    User = get_user_model()
+    user = User.objects.create_user(username='bench_user', password='Bench-pass1!', email='bench_user@test.com')
+    Notification.objects.bulk_create([
+        Notification(recipient=user, title='New Activity', message=f'Notification {i}') for i in range(args.notifications)
+    ], batch_size=5000)
+    request = RequestFactory().get('/')
+    request.user = user
+
+    def full_list():
+        notifications = Notification.objects.filter(recipient=user, read=False).order_by('-created_at')
+        data = NotificationSerializer(notifications, many=True, context={'request': request}).data
+        return Paginator(data, 20).get_page(1)
+
+    #Cursor of a page half way through the list
+    cursor = None
+    for _ in range(args.notifications // 40):
+        cursor = get_notifications_page(request, user, cursor, page_size=20).next_cursor
+
+    print(f"{args.notifications} unread notifications, 20 per page")
+    print_row('full list + Paginator (page 1)', measure(full_list, repeat=max(1, args.repeat // 4), warmup=1))
+    print_row('keyset (page 1)', measure(lambda: get_notifications_page(request, user, page_size=20), repeat=args.repeat))
+    print_row('keyset (middle page)', measure(lambda: get_notifications_page(request, user, cursor, page_size=20), repeat=args.repeat))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import random
+
+from benchmarks.common import setup_django, measure, print_row
+
+#Benchmark of the search endpoint data on a large dataset.
+#"icontains" is the previous approach - unbounded case-insensitive containment filters (full table scans) returning every
+#match, "fts" is the ranked, paginated FTS5 search in elearning_base/search.py.
+
+WORDS = ['python', 'algebra', 'history', 'physics', 'design', 'data', 'music', 'biology', 'finance', 'networks',
+         'chemistry', 'drawing', 'writing', 'statistics', 'marketing', 'robotics', 'poetry', 'geology', 'ethics', 'cooking']
+
+def build_dataset(users, courses):
+    from django.contrib.auth import get_user_model
+    from elearning_base.models import Course
+    from elearning_base import search
+
+    User = get_user_model()
+    rng = random.Random(0)
+    teachers = User.objects.bulk_create([
+        User(username=f'teacher_{i}', email=f'teacher_{i}@test.com', first_name=rng.choice(WORDS), last_name=f'Smith{i}', is_teacher=True)
+        for i in range(max(1, users // 100))
+    ], batch_size=2000)
+    User.objects.bulk_create([
+        User(username=f'{rng.choice(WORDS)}_student_{i}', email=f'student_{i}@test.com', first_name='Student', last_name=f'Jones{i}')
+        for i in range(users)
+    ], batch_size=2000)
+    Course.objects.bulk_create([
+        Course(course_title=f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}', description=' '.join(rng.choices(WORDS, k=30)), teacher=rng.choice(teachers))
+        for i in range(courses)
+    ], batch_size=2000)
+    #Bulk inserts do not fire the indexing signals
+    search.rebuild_index()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--courses', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.contrib.auth import get_user_model
+    from django.test import RequestFactory
+    from elearning_base.models import Course
+    from elearning_base.serializers import CourseSerializer, UserProfileSerializer
+    from elearning_base.services import get_search_results_data
+
+    User = get_user_model()
+    build_dataset(args.users, args.courses)
+    request = RequestFactory().get('/')
+    request.user = User.objects.filter(is_teacher=True).first()
+
+    def icontains(query):
+        courses = Course.objects.filter(course_title__icontains=query)
+        teachers = User.objects.filter(username__icontains=query, is_teacher=True)
+        students = User.objects.filter(username__icontains=query, is_teacher=False)
+        return {
+            'courses': CourseSerializer(courses, many=True, context={'request': request}).data,
+            'teachers': UserProfileSerializer(teachers, many=True, context={'request': request}).data,
+            'students': UserProfileSerializer(students, many=True, context={'request': request}).data,
+        }
+
+    print(f"{args.users} students, {args.courses} courses")
+    for query in ['python', 'phys', 'robotics stat', 'student_99']:
+        legacy = icontains(query)
+        legacy_count = sum(len(results) for results in legacy.values())
+        print_row(f"icontains '{query}' ({legacy_count} rows)", measure(lambda: icontains(query), repeat=args.repeat))
+        print_row(f"fts '{query}' (page 1)", measure(lambda: get_search_results_data(request, query), repeat=args.repeat))
+
+if __name__ == '__main__':
+    main()
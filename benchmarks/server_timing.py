@@ -0,0 +1,45 @@
+import argparse
+import logging
+
+from benchmarks.common import setup_django, measure, print_row
+
+#Overhead of ServerTimingMiddleware. Each page is requested with the middleware sampling no requests (what most
+#production requests see) and every request (query wrapper, timed blocks, header and log line).
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50, help='Notifications, status updates and enrollments of the user')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    #The log line is still formatted, only not written out
+    logging.getLogger('elearning_base.middleware').handlers = [logging.NullHandler()]
+
+    from django.contrib.auth import get_user_model
+    from django.test.utils import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from elearning_base.models import Course, Enrollments, Notification, StatusUpdate
+
+    User = get_user_model()
+    user = User.objects.create_user(username='bench_user', password='Bench-pass1!', email='bench_user@test.com')
+    teacher = User.objects.create_user(username='bench_teacher', password='Bench-pass1!', email='bench_teacher@test.com', is_teacher=True)
+    courses = Course.objects.bulk_create([Course(course_title=f'Course {i}', description='Description', teacher=teacher) for i in range(args.rows)])
+    Enrollments.objects.bulk_create([Enrollments(course=course, student=user) for course in courses])
+    Notification.objects.bulk_create([Notification(recipient=user, title='New Activity', message=f'Notification {i}') for i in range(args.rows)])
+    StatusUpdate.objects.bulk_create([StatusUpdate(user=user, status=f'Status {i}') for i in range(args.rows)])
+
+    client = APIClient()
+    client.force_login(user)
+    pages = {
+        'home (view)': reverse('home'),
+        'get_notifications (api)': reverse('get_notifications', kwargs={'user_id': user.user_id}),
+    }
+    for label, url in pages.items():
+        for rate in (0, 1):
+            with override_settings(SERVER_TIMING_SAMPLE_RATE=rate):
+                print_row(f'{label}, sample rate {rate}', measure(lambda: client.get(url), repeat=args.repeat, warmup=5))
+
+if __name__ == '__main__':
+    main()
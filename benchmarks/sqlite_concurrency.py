@@ -0,0 +1,179 @@
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import setup_django
+
+#Throughput of a mixed load on a SQLite database file, with the default SQLite settings ("default" - rollback journal,
+#connections closed after every request) and the production profile in settings.py ("production" - SQLITE_PRAGMAS and
+#CONN_MAX_AGE). For --duration seconds, at the same time:
+#  http readers    - GET list endpoints (notifications, course activities, status updates)
+#  http writers    - POST create_status_update
+#  consumers       - lobby messages sent through ChatConsumer, written one by one (LOBBY_WRITE_BEHIND off)
+#  tasks           - new activity notification fan-outs (one bulk insert of a notification per enrolled student)
+#Each runs in its own threads with its own connections, as the web server threads, consumers and celery workers do (the
+#workers are separate processes in production). "locked" counts the operations failing with "database is locked".
+#Each profile runs in a subprocess with a new database file, the journal mode is a property of the file.
+
+PROFILES = {
+    'default': {'env': {'DB_CONN_MAX_AGE': '0'}, 'settings': {'SQLITE_PRAGMAS': {'journal_mode': 'DELETE'}}},
+    'production': {'env': {}, 'settings': {}},
+}
+KINDS = ['http readers', 'http writers', 'consumers', 'tasks']
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--consumers', type=int, default=2)
+    parser.add_argument('--tasks', type=int, default=1)
+    parser.add_argument('--students', type=int, default=200, help='Students enrolled in the course, notified by each task')
+    parser.add_argument('--profile', choices=PROFILES, help='Run a single profile in this process')
+    args = parser.parse_args()
+
+    if args.profile:
+        run_profile(args)
+        return
+
+    print(f"{'profile':<18} {'kind':<14} {'ops/s':>9} {'p95 ms':>9} {'locked':>7}")
+    for profile in PROFILES:
+        command = [sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--profile', profile] + [
+            f'--{option}={getattr(args, option)}' for option in ('duration', 'readers', 'writers', 'consumers', 'tasks', 'students')
+        ]
+        subprocess.run(command, env={**os.environ, **PROFILES[profile]['env']}, check=True)
+
+def run_profile(args):
+    directory = tempfile.mkdtemp()
+    setup_django(database_name=os.path.join(directory, 'benchmark.sqlite3'), LOBBY_WRITE_BEHIND=False, **PROFILES[args.profile]['settings'])
+
+    from channels.auth import AuthMiddlewareStack
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, close_old_connections, connection
+    from django.test import Client
+    from django.urls import reverse
+    from elearning_base.models import Course, CourseActivity, Enrollments, Notification, StatusUpdate
+    from elearning_base.routing import websocket_urlpatterns
+    from elearning_base.tasks import send_new_activity_notification
+
+    User = get_user_model()
+    teacher = User.objects.create_user(username='bench_teacher', password='Bench-pass1!', email='bench_teacher@test.com', is_teacher=True)
+    course = Course.objects.create(course_title='Benchmark course', description='Description', teacher=teacher)
+    students = User.objects.bulk_create([User(username=f'bench_student_{i}', email=f'bench_student_{i}@test.com') for i in range(args.students)])
+    Enrollments.objects.bulk_create([Enrollments(course=course, student=student) for student in students])
+    Notification.objects.bulk_create([Notification(recipient=student, title='Benchmark', message='Message') for student in students for _ in range(5)])
+    StatusUpdate.objects.bulk_create([StatusUpdate(user=student, status='Status') for student in students[:20] for _ in range(5)])
+    CourseActivity.objects.bulk_create([CourseActivity(course=course, activity_title=f'Activity {i}', description='Description') for i in range(10)])
+    journal_mode = connection.cursor().execute('PRAGMA journal_mode').fetchone()[0]
+    connection.close()
+
+    deadline = time.perf_counter() + args.duration
+    ops, locked, timings, lock = Counter(), Counter(), {kind: [] for kind in KINDS}, threading.Lock()
+
+    def record(kind, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except OperationalError:
+            with lock:
+                locked[kind] += 1
+            return
+        with lock:
+            ops[kind] += 1
+            timings[kind].append((time.perf_counter() - start) * 1000)
+
+    def http_reader(i):
+        client = Client()
+        student = students[i % len(students[:20])]
+        client.force_login(student)
+        urls = [
+            reverse('get_notifications', kwargs={'user_id': student.user_id}),
+            reverse('get_course_activities_with_materials', kwargs={'course_id': course.course_id}),
+            reverse('get_status_updates', kwargs={'user_id': student.user_id}),
+        ]
+        n = 0
+        while time.perf_counter() < deadline:
+            record('http readers', lambda: client.get(urls[n % len(urls)]))
+            n += 1
+
+    def http_writer(i):
+        client = Client()
+        client.force_login(students[i])
+        url = reverse('create_status_update')
+        while time.perf_counter() < deadline:
+            record('http writers', lambda: client.post(url, {'status': 'Benchmark status'}, content_type='application/json'))
+
+    def consumer(i):
+        async def connect():
+            communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), 'ws/lobby/')
+            communicator.scope['user'] = students[i]
+            await communicator.connect()
+            return communicator
+
+        async def run():
+            communicator = await connect()
+            n = 0
+            while time.perf_counter() < deadline:
+                message = f'Benchmark message {i} {n}'
+                n += 1
+                start = time.perf_counter()
+                try:
+                    await communicator.send_json_to({'message': message})
+                    #Messages of the other consumers are broadcast to this one too
+                    while (await communicator.receive_json_from(timeout=30))['message'] != message:
+                        pass
+                except OperationalError:
+                    #The consumer failed writing the message, connected again as a client would
+                    with lock:
+                        locked['consumers'] += 1
+                    communicator = await connect()
+                    continue
+                with lock:
+                    ops['consumers'] += 1
+                    timings['consumers'].append((time.perf_counter() - start) * 1000)
+            await communicator.disconnect()
+        asyncio.run(run())
+
+    def task(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            #As a celery worker does around every task
+            close_old_connections()
+            activity = CourseActivity.objects.bulk_create([CourseActivity(course=course, activity_title=f'Task {i} {n}', description='Description')])[0]
+            record('tasks', lambda: send_new_activity_notification(activity.activity_id))
+            close_old_connections()
+            n += 1
+
+    def run_thread(target, i):
+        try:
+            target(i)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run_thread, args=(target, i)) for target, count in (
+        (http_reader, args.readers), (http_writer, args.writers), (consumer, args.consumers), (task, args.tasks)
+    ) for i in range(count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    from benchmarks.common import summarize
+    label = f"{args.profile} ({journal_mode})"
+    for kind in KINDS:
+        p95 = summarize(timings[kind])['p95'] if timings[kind] else 0
+        print(f"{label:<18} {kind:<14} {ops[kind] / elapsed:9.1f} {p95:9.1f} {locked[kind]:7}")
+    print(f"{label:<18} {'total':<14} {sum(ops.values()) / elapsed:9.1f} {'':>9} {sum(locked.values()):7}")
+
+if __name__ == '__main__':
+    main()
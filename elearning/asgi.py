@@ -16,6 +16,7 @@ import elearning_base.urls
 from django.core.asgi import get_asgi_application
 
 from elearning_base.routing import websocket_urlpatterns 
+from elearning_base.lobby_buffer import lifespan
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'elearning.settings')
 
@@ -27,6 +28,8 @@ import elearning_base.routing
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': AllowedHostsOriginValidator(
-        AuthMiddlewareStack(URLRouter(elearning_base.routing.websocket_urlpatterns)))
+        AuthMiddlewareStack(URLRouter(elearning_base.routing.websocket_urlpatterns))),
+    #Flushes the buffered lobby messages on shutdown
+    'lifespan': lifespan,
 })
 
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'elearning_base.middleware.ServerTimingMiddleware',
+    'elearning_base.middleware.PrimaryAfterWriteMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,9 +90,39 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'elearning_db.sqlite3',
+        #Connections are kept open between requests (and database_sync_to_async calls) for this many seconds, rather than
+        #opened, configured (SQLITE_PRAGMAS) and closed every time. Checked before reuse.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+#Read replica (elearning_base/db_router.py) - the read-only views read from it when DATABASE_REPLICA_NAME is set. Locally a
+#second SQLite file, kept up to date with the sync_replica management command.
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+DATABASE_REPLICA = None
+if DATABASE_REPLICA_NAME:
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': DATABASE_REPLICA_NAME, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICA = 'replica'
+DATABASE_ROUTERS = ['elearning_base.db_router.PrimaryReplicaRouter']
+#Reads of a client stay on the primary for this long after it wrote something, the replica may not have its changes yet
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
+#Pragmas set on every new SQLite connection (elearning_base/signals.py), for the web server threads, the websocket
+#consumers and the celery workers writing to the database at the same time.
+#WAL lets readers carry on while a write is in progress, and with synchronous NORMAL a commit only waits for the WAL write
+#(a power loss can lose the last transactions, but never corrupts the database). A connection finding the database
+#locked by a writer retries for busy_timeout ms instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    #Reads through a memory map of up to 256 MiB of the file rather than read() calls
+    'mmap_size': 256 * 1024 * 1024,
+    #Page cache of each connection, negative is KiB - 64 MiB
+    'cache_size': -64 * 1024,
+}
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 #Paths where static files are stored and served from
@@ -102,6 +135,26 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 #Paths where media files are stored and served from
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+#Media files are served by views.protected_media to the users allowed to read them (elearning_base/media.py), and the bytes
+#sent by the web server in front of Django with 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd), or by
+#Django itself with 'python'. For nginx MEDIA_ACCEL_REDIRECT_LOCATION is an internal location aliased to MEDIA_ROOT:
+#  location /protected-media/ { internal; alias /path/to/media/; }
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'python')
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
+
+#Course material files and images and submissions are saved to the course_files storage. With CONTENT_ADDRESSED_STORAGE
+#on it stores each file once under its SHA-256 digest in MEDIA_ROOT/blobs (elearning_base/storage.py), however many
+#materials and submissions have the same content, rather than a copy per upload. Files already uploaded keep their paths.
+CONTENT_ADDRESSED_STORAGE = os.environ.get('CONTENT_ADDRESSED_STORAGE', 'False') == 'True'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    'course_files': {
+        'BACKEND': 'elearning_base.storage.ContentAddressedStorage' if CONTENT_ADDRESSED_STORAGE else 'django.core.files.storage.FileSystemStorage',
+    },
+}
+#Unreferenced blobs are deleted daily (tasks.collect_blobs) once this old, a blob just saved may not have its row yet
+BLOB_GC_GRACE_HOURS = 24
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -154,6 +207,26 @@ SWAGGER_LOGOUT_URL = 'swagger_logout'
 #Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 
+#Periodic tasks, run by celery beat
+CELERY_BEAT_SCHEDULE = {
+    'trim-lobby-messages': {
+        'task': 'elearning_base.tasks.trim_lobby_messages',
+        'schedule': 60 * 60 * 24,
+    },
+    'purge-notifications': {
+        'task': 'elearning_base.tasks.purge_notifications',
+        'schedule': 60 * 60 * 24,
+    },
+    'expire-uploads': {
+        'task': 'elearning_base.tasks.expire_uploads',
+        'schedule': 60 * 60,
+    },
+    'collect-blobs': {
+        'task': 'elearning_base.tasks.collect_blobs',
+        'schedule': 60 * 60 * 24,
+    },
+}
+
 #Channels settings
 CHANNEL_LAYERS = {
     'default': {
@@ -164,6 +237,14 @@ CHANNEL_LAYERS = {
     }
 }
 
+#Cache settings
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    }
+}
+
 #Swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -174,4 +255,88 @@ SWAGGER_SETTINGS = {
     'USE_SESSION_AUTH': True,
     'LOGIN_URL': LOGIN_URL,
     'LOGOUT_URL': SWAGGER_LOGOUT_URL,
-}
\ No newline at end of file
+}
+
+#Lobby settings
+#Lobby messages can be broadcast first and written in batches (lobby_buffer.py), rather than one INSERT before each
+#broadcast. Off by default: Daphne sends no lifespan shutdown, so the messages waiting in the buffer are lost when the
+#process is stopped by a signal (a deploy restart) - only turn it on under a server which shuts the application down cleanly
+LOBBY_WRITE_BEHIND = os.environ.get('LOBBY_WRITE_BEHIND', 'False') == 'True'
+#A batch is written once this many messages are waiting, or this many seconds after its first message
+LOBBY_BUFFER_MAX_SIZE = 100
+LOBBY_BUFFER_FLUSH_INTERVAL = 0.5
+#A failed write is retried after a backoff of at most this many seconds, and at most this many messages are kept meanwhile
+LOBBY_BUFFER_RETRY_MAX_INTERVAL = 30
+LOBBY_BUFFER_MAX_PENDING = 10000
+#The latest messages are kept in a capped Redis list (lobby_history.py), at least as many as can be waiting in the buffer
+LOBBY_HISTORY_REDIS_URL = 'redis://127.0.0.1:6379/2'
+LOBBY_HISTORY_SIZE = 100
+#Older messages are deleted daily (tasks.trim_lobby_messages), this many rows per delete
+LOBBY_MESSAGE_RETENTION_DAYS = 90
+LOBBY_RETENTION_BATCH_SIZE = 1000
+
+#Notification settings
+#Read notifications older than this are deleted daily (tasks.purge_notifications, notification_retention.py), this many rows
+#per delete. Unread notifications are kept.
+NOTIFICATION_RETENTION_DAYS = 180
+NOTIFICATION_RETENTION_BATCH_SIZE = 1000
+#JSON lines file the deleted notifications are appended to, None to only delete them
+NOTIFICATION_ARCHIVE_PATH = os.environ.get('NOTIFICATION_ARCHIVE_PATH')
+
+#Image settings
+#Widths of the resized copies of the uploaded profile, course and material images (image_derivatives.py), each saved in
+#the original's format and as WebP by a background task after the upload
+IMAGE_DERIVATIVE_WIDTHS = {'thumbnail': 192, 'medium': 640}
+IMAGE_DERIVATIVE_QUALITY = 80
+
+#Upload settings
+#Largest file accepted by the resumable uploads (uploads.py), and how long an unfinished upload is kept since its last chunk
+#before it is deleted (tasks.expire_uploads)
+UPLOAD_MAX_SIZE = 5 * 1024 ** 3
+UPLOAD_EXPIRY_HOURS = 24
+
+#Grading settings
+#Rows of a bulk grading file (grading.py) looked up and written together, and the most row errors reported back
+GRADING_BATCH_SIZE = 500
+GRADING_MAX_ERRORS = 1000
+
+#Enrollment import settings
+#Usernames of a bulk enrollment (enrollment_import.py) looked up and inserted together, and the most accepted per request
+ENROLLMENT_IMPORT_BATCH_SIZE = 500
+ENROLLMENT_IMPORT_MAX_USERNAMES = 5000
+
+#Request timing settings
+#Fraction of the requests measured by ServerTimingMiddleware (Server-Timing header and a log line), 0 turns it off
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', '0.05'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'elearning_base': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+#Test runs use an in-process cache rather than the shared Redis one (the lobby history included), no request timings are
+#sampled (the middleware tests turn sampling on) and the app's info logging is left out of the test output
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    LOBBY_HISTORY_REDIS_URL = None
+    SERVER_TIMING_SAMPLE_RATE = 0
+    #Replica mirroring the test database, routed to in the tests that turn DATABASE_REPLICA on
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICA = None
+    LOGGING['loggers']['elearning_base']['level'] = 'WARNING'
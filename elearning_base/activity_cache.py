@@ -0,0 +1,81 @@
+import time
+from django.core.cache import cache
+
+#Cache of the serialized activity tree of a course (its activities with their materials), the payload of the course page
+#and of the get_course_activities_with_materials endpoint.
+#The tree is only cached per course - who may see it (teacher, enrolled and not blocked) is checked on every request by the
+#callers, before the tree is read.
+#
+#Cache keys carry a per-course version which the post_save/post_delete signals of CourseActivity and CourseActivityMaterial
+#bump (signals.py), so a change only invalidates the trees of its own course. A tree is stored under the version read
+#before it was built, so a tree built from data a concurrent write has since changed is never read back.
+#The tree is cached with host-relative file/image urls (serialized without a request), made absolute for each request when
+#it is read - keying it by the Host header instead would let any client add entries with made up hosts.
+#Keys include the creation time of the course as well as its id, ids are reused after the database is flushed.
+#
+#Hits and misses are counted in the cache as well, shared by all the processes, see the activity_cache_stats command.
+
+KEY_PREFIX = 'course_activities'
+#Trees are evicted after a day without changes, versions are kept until the cache evicts them
+TREE_TIMEOUT = 60 * 60 * 24
+HITS_KEY = f'{KEY_PREFIX}:hits'
+MISSES_KEY = f'{KEY_PREFIX}:misses'
+#Url fields of the serialized materials
+URL_FIELDS = ('file', 'image', 'thumbnail_url', 'thumbnail_webp_url', 'medium_url', 'medium_webp_url')
+
+def version_key(course_id):
+    return f'{KEY_PREFIX}:{course_id}:version'
+
+def get_version(course_id):
+    #A new version starts at the current time rather than 1, so trees stored under an evicted version are not read again
+    key = version_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+def get_tree(request, course, build):
+    #Returns the cached tree of the course, or builds (build(), with relative urls), caches and returns it, with the urls
+    #made absolute for the request
+    version = get_version(course.course_id)
+    key = f'{KEY_PREFIX}:{course.course_id}:{course.created_at.timestamp()}:{version}'
+    tree = cache.get(key)
+    if tree is not None:
+        count(HITS_KEY)
+    else:
+        count(MISSES_KEY)
+        tree = list(build())
+        cache.set(key, tree, TREE_TIMEOUT)
+    return absolute_urls(request, tree)
+
+def absolute_urls(request, tree):
+    return [
+        {**activity, 'activity_materials': [
+            {**material, **{field: request.build_absolute_uri(material[field]) for field in URL_FIELDS if material.get(field)}}
+            for material in activity['activity_materials']
+        ]}
+        for activity in tree
+    ]
+
+def invalidate(course_id):
+    try:
+        cache.incr(version_key(course_id))
+    except ValueError:
+        #Nothing has been cached for the course
+        pass
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+def get_stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses) if hits + misses else None}
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
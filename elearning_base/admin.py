@@ -6,6 +6,10 @@ from .models import *
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user_id', 'username','email', 'is_teacher', 'date_of_birth', 'bio')
 
+    #Saved without the unread count, which is only written by atomic updates (notification_counts.py)
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('unread_notifications')
+
 class CourseAdmin(admin.ModelAdmin):
     list_display = ('course_id', 'course_title', 'description', 'teacher')
 
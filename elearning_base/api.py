@@ -1,6 +1,8 @@
 from django.http import JsonResponse
+from django.urls import reverse
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView
+from django.utils.decorators import method_decorator
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -10,6 +12,18 @@ from drf_yasg import openapi
 from rest_framework.parsers import MultiPartParser
 from .models import *
 from .serializers import *
+from .services import *
+from . import search, uploads, grading, enrollment_import
+from .db_router import use_replica
+from .notification_counts import add_unread, push_unread_count, mark_read
+from django.db import IntegrityError, transaction
+from .pagination import InvalidCursor, pagination_params, paginated_response, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+#Query parameters of the cursor paginated list endpoints, see pagination.py
+CURSOR_PAGINATION_PARAMETERS = [
+    openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor of the page to fetch, taken from the Link header", type=openapi.TYPE_STRING),
+    openapi.Parameter('page_size', openapi.IN_QUERY, description=f"Number of results per page (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE})", type=openapi.TYPE_INTEGER),
+]
 
 # User specific views - These hasve been implemented partially
 #Get user prpofile is used in the traditional view home. The rest are an implementation of the rest of the user data API.
@@ -56,7 +70,8 @@ def create_user_api(request):
 @parser_classes([MultiPartParser])
 def update_user_api(request, user_id):
     try:
-        user=UserProfile.objects.get(user_id=user_id)
+        #Without the unread count, which is only written by atomic updates (notification_counts.py)
+        user=UserProfile.objects.defer('unread_notifications').get(user_id=user_id)
     except UserProfile.DoesNotExist:
         return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -70,6 +85,7 @@ def update_user_api(request, user_id):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
     responses={
@@ -90,10 +106,9 @@ def get_user_api(request, user_id):
         return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        if not user.is_teacher and not request.user.is_teacher and request.user != user:
+        if not can_view_user(request.user, user):
             return Response({'message': 'As a student you are not authorized to view other student data!'}, status=status.HTTP_403_FORBIDDEN)
-        serializer = UserProfileSerializer(user, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        return JsonResponse(get_user_data(request, user), safe=False, status=status.HTTP_200_OK)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
@@ -243,6 +258,132 @@ def create_course_activity_material(request, activity_id):
         
     return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+#Resumable chunked uploads of large material and submission files, see uploads.py for the protocol
+UPLOAD_OFFSET_PARAMETER = openapi.Parameter('Upload-Offset', openapi.IN_HEADER, description="Position in the file of the chunk in the request body", type=openapi.TYPE_INTEGER, required=True)
+
+def upload_response(upload, status_code):
+    return Response(UploadSerializer(upload).data, status=status_code, headers={'Upload-Offset': str(upload.offset)})
+
+@swagger_auto_schema(
+    method='post',
+    request_body=UploadSerializer,
+    responses={
+        201: UploadSerializer,
+        400: 'Bad request',
+        405: 'Method not allowed'
+    },
+    operation_description="Start a resumable upload of a material file (teacher of the activity's course, with the material's title and description) or of a submission (enrolled student). The file's size and SHA-256 checksum are given up front, its chunks are then sent with upload_chunk and the material or submission is created by finalize_upload.",
+    tags=['Upload']
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload(request):
+    if request.method == 'POST':
+        serializer = UploadSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            upload = serializer.save()
+            return upload_response(upload, status.HTTP_201_CREATED)
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+@swagger_auto_schema(
+    method='get',
+    responses={
+        200: UploadSerializer,
+        404: 'Upload not found',
+        405: 'Method not allowed'
+    },
+    operation_description="Get an upload, its offset is where the next chunk starts (also in the Upload-Offset header).",
+    tags=['Upload']
+)
+@swagger_auto_schema(
+    method='patch',
+    manual_parameters=[UPLOAD_OFFSET_PARAMETER],
+    responses={
+        200: UploadSerializer,
+        400: 'Missing or invalid Upload-Offset header, invalid Content-Length, or chunk past the end of the file',
+        404: 'Upload not found',
+        409: 'Upload-Offset is not the offset of the upload',
+        405: 'Method not allowed',
+        411: 'Missing Content-Length'
+    },
+    operation_description="Append a chunk (the raw request body, Content-Type application/offset+octet-stream) to an upload, at the Upload-Offset header. A chunk cut short by the connection is kept up to where it stopped, resume from the returned offset.",
+    tags=['Upload']
+)
+@api_view(['GET', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id):
+    try:
+        upload = Upload.objects.get(pk=upload_id, user=request.user)
+    except Upload.DoesNotExist:
+        return Response({'message': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        return upload_response(upload, status.HTTP_200_OK)
+
+    elif request.method == 'PATCH':
+        #The body is streamed to the file, request.data (which would read it into memory) is never used
+        if 'Content-Length' not in request.headers:
+            return Response({'message': 'Content-Length header required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'] or 0)
+        except (KeyError, ValueError):
+            return Response({'message': 'Upload-Offset and Content-Length must be non-negative integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if offset < 0 or length < 0:
+            return Response({'message': 'Upload-Offset and Content-Length must be non-negative integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if offset + length > upload.size:
+            return Response({'message': 'Chunk goes past the end of the file'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if length and uploads.append(upload, request.stream, offset, length) is None:
+            upload.refresh_from_db()
+            return Response({'message': 'Upload-Offset is not the offset of the upload', 'offset': upload.offset}, status=status.HTTP_409_CONFLICT, headers={'Upload-Offset': str(upload.offset)})
+        return upload_response(upload, status.HTTP_200_OK)
+
+    return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+@swagger_auto_schema(
+    method='post',
+    responses={
+        201: 'The created CourseActivityMaterial or Submission',
+        400: 'Upload incomplete, or the file does not match the checksum (the upload is restarted from offset 0)',
+        404: 'Upload not found',
+        405: 'Method not allowed'
+    },
+    operation_description="Finish an upload once every chunk has been sent - the file is checked against the checksum and attached to a new material or submission.",
+    tags=['Upload']
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload(request, upload_id):
+    try:
+        upload = Upload.objects.select_related('course_activity').get(pk=upload_id, user=request.user)
+    except Upload.DoesNotExist:
+        return Response({'message': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'POST':
+        if upload.offset != upload.size:
+            return Response({'message': 'Upload incomplete', 'offset': upload.offset}, status=status.HTTP_400_BAD_REQUEST)
+        if not uploads.verify(upload):
+            uploads.restart(upload)
+            return Response({'message': 'File does not match the checksum, send it again from offset 0', 'offset': 0}, status=status.HTTP_400_BAD_REQUEST)
+        if upload.target == Upload.MATERIAL and CourseActivityMaterial.objects.filter(course_activity=upload.course_activity, material_title=upload.material_title).exists():
+            return Response({'material_title': ['Material with this title already exists for this activity.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            instance = uploads.finish(upload)
+        except IntegrityError:
+            #A material with the title created since the check above
+            if upload.target != Upload.MATERIAL:
+                raise
+            return Response({'material_title': ['Material with this title already exists for this activity.']}, status=status.HTTP_400_BAD_REQUEST)
+        serializer_class = CourseActivityMaterialSerializer if upload.target == Upload.MATERIAL else SubmissionSerializer
+        return Response(serializer_class(instance, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+    return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 @swagger_auto_schema(
     method='post', 
     request_body=FeedbackSerializer, 
@@ -309,6 +450,47 @@ def create_enrollment(request, course_id):
 
     return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+    responses={
+        200: EnrollmentImportReportSerializer,
+        400: 'Invalid CSV or JSON, or too many usernames, nothing was changed',
+        403: 'You are not authorized to perform this action',
+        404: 'Course not found',
+        405: 'Method not allowed',
+        415: 'Unsupported media type'
+    },
+    operation_description="TEACHER OF THE COURSE ONLY: Enroll students in a course in bulk. The body is a JSON array of usernames (application/json) or a CSV file (text/csv) with a username column, or one username per line. The teacher is sent one notification for all of the new enrollments. Usernames which can't be enrolled are reported, the others are enrolled.",
+    tags=['Enrollment']
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_enrollments(request, course_id):
+    if request.method == 'POST':
+        try:
+            course = Course.objects.get(pk=course_id)
+        except Course.DoesNotExist:
+            return Response({'message': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
+        if request.user != course.teacher:
+            return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            if request.content_type.startswith('text/csv'):
+                if request.stream is None:
+                    return Response({'message': 'No usernames sent'}, status=status.HTTP_400_BAD_REQUEST)
+                usernames = enrollment_import.read_csv_usernames(request.stream)
+            elif request.content_type.startswith('application/json'):
+                usernames = enrollment_import.read_json_usernames(request.data)
+            else:
+                return Response({'message': 'Send a CSV file (text/csv) or a JSON array (application/json)'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            report = enrollment_import.enroll(course, usernames)
+        except enrollment_import.EnrollmentFileError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(EnrollmentImportReportSerializer(report).data, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 @swagger_auto_schema(
     methods=['patch', 'post'], 
     request_body=EnrollmentUpdateSerializer,
@@ -341,6 +523,48 @@ def update_blocked_status(request, enrollment_id):
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@swagger_auto_schema(
+    methods=['patch', 'post'],
+    request_body=GradeRowSerializer(many=True),
+    responses={
+        200: GradeReportSerializer,
+        400: 'Invalid CSV or JSON, nothing was changed',
+        403: 'You are not authorized to perform this action',
+        404: 'Activity not found',
+        405: 'Method not allowed',
+        415: 'Unsupported media type'
+    },
+    operation_description="Grade the submissions to an activity in bulk, teacher of the activity's course only. The body is a JSON array of rows (application/json) or a CSV file with a header (text/csv), each row a submission_id or student username and a grade from 0 to 100 (empty to clear it). Rows which can't be applied are reported with their number, the others are saved.",
+    tags=['Course']
+)
+@api_view(['POST', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def update_submission_grades(request, activity_id):
+    if request.method == 'PATCH' or request.method == 'POST':
+        try:
+            activity = CourseActivity.objects.select_related('course').get(pk=activity_id)
+        except CourseActivity.DoesNotExist:
+            return Response({'message': 'Activity not found'}, status=status.HTTP_404_NOT_FOUND)
+        if request.user != activity.course.teacher:
+            return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
+
+        #The body is streamed to the parser, request.data (which would read it into memory) is never used
+        if request.stream is None:
+            return Response({'message': 'No rows sent'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.content_type.startswith('text/csv'):
+            rows = grading.read_csv_rows(request.stream)
+        elif request.content_type.startswith('application/json'):
+            rows = grading.read_json_rows(request.stream)
+        else:
+            return Response({'message': 'Send a CSV file (text/csv) or a JSON array (application/json)'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            report = grading.apply_grades(activity, rows)
+        except grading.GradeFileError as e:
+            return Response({'message': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(GradeReportSerializer(report).data, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
 @swagger_auto_schema(
     methods=['patch', 'post'], 
     request_body=NotificationUpdateSerializer,
@@ -363,8 +587,12 @@ def update_notification_read(request, notification_id):
             if request.user != notification.recipient:
                 return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
 
-            notification.read = not notification.read
-            notification.save()
+            #Only toggled (and counted) if not toggled by a concurrent request meanwhile
+            with transaction.atomic():
+                if Notification.objects.filter(pk=notification.pk, read=notification.read).update(read=not notification.read):
+                    add_unread([notification.recipient_id], -1 if not notification.read else 1)
+            notification.refresh_from_db()
+            push_unread_count(notification.recipient_id)
 
             serializer = NotificationUpdateSerializer(notification)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -373,14 +601,46 @@ def update_notification_read(request, notification_id):
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@swagger_auto_schema(
+    methods=['patch', 'post'],
+    request_body=NotificationsReadSerializer,
+    responses={
+        200: NotificationsReadSerializer,
+        400: 'Invalid request body or cursor',
+        405: 'Method not allowed'
+    },
+    operation_description="Marks the request user's notifications read in bulk - the given notification ids, every notification up to the up_to cursor (as given in the get_notifications Link header) or, without either, all of them. Returns the number marked read and the new unread count.",
+    tags=['Notifications']
+)
+@api_view(['POST', 'PATCH'])
+@permission_classes([IsAuthenticated])
+def mark_notifications_read(request):
+    if request.method == 'PATCH' or request.method == 'POST':
+        serializer = NotificationsReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            updated = mark_read(request.user, **serializer.validated_data)
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        unread_count = push_unread_count(request.user.pk)
+
+        return Response(NotificationsReadSerializer({'updated': updated, 'unread_count': unread_count}).data, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+@use_replica
 @swagger_auto_schema(
     method='get', 
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: StatusUpdateSerializer(many=True), 
+        400: 'Invalid cursor',
         404: 'User not found', 
         405: 'Method not allowed'
     },
-    operation_description="Get status updates for a given user",
+    operation_description="Get status updates for a given user. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['User']
 )
 @api_view(['GET'])
@@ -392,21 +652,26 @@ def get_status_updates(request, user_id):
         return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        status_updates = StatusUpdate.objects.filter(user=user).order_by('-created_at')
-        serializer = StatusUpdateSerializer(status_updates, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_status_updates_page(request, user, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get', 
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: EnrollmentsSerializer(many=True),
+        400: 'Invalid cursor',
         403: 'You are not authorized to perform this action', 
         404: 'User not found', 
         405: 'Method not allowed'
     },
-    operation_description="Get enrolled courses for a given student user",
+    operation_description="Get enrolled courses for a given student user. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['Enrollments']
 )
 @api_view(['GET'])
@@ -418,20 +683,25 @@ def get_enrolled_courses(request, user_id):
         return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        courses = Enrollments.objects.filter(student=user).order_by('-enrolled_at')
-        serializer = EnrollmentsSerializer(courses, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_enrolled_courses_page(request, user, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get', 
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: CourseSerializer(many=True), 
+        400: 'Invalid cursor',
         404: 'User not found', 
         405: 'Method not allowed'
     },
-    operation_description="Get courses taught by a given teacher user",
+    operation_description="Get courses taught by a given teacher user. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['Course']
 )
 @api_view(['GET'])
@@ -443,12 +713,15 @@ def get_courses_taught(request, user_id):
         return Response({'message': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        courses_taught = Course.objects.filter(teacher=user).order_by('-created_at')
-        serializer = CourseSerializer(courses_taught, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_courses_taught_page(request, user, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get', 
     responses={
@@ -459,28 +732,20 @@ def get_courses_taught(request, user_id):
         404: 'Search query not found', 
         405: 'Method not allowed'
     },
-    operation_description="Get search results for a given search query. Results include courses, teachers and students; depending on request user type.",
+    manual_parameters=[openapi.Parameter('page', openapi.IN_QUERY, description="Page of results per category", type=openapi.TYPE_INTEGER)],
+    operation_description="Get full-text search results for a given search query, ranked by relevance. Results include courses, teachers and students; depending on request user type. Paginated per category and capped to the most relevant results.",
     tags=['Miscellaneous']
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_search_results(request, search_query):
     if request.method == 'GET':
-        courses = Course.objects.filter(course_title__icontains=search_query)
-        teachers = UserProfile.objects.filter(username__icontains=search_query, is_teacher=True)
-        students = UserProfile.objects.filter(username__icontains=search_query, is_teacher=False)
-
-        course_serializer = CourseSerializer(courses, many=True, context={'request': request})
-        teachers_serializer = UserProfileSerializer(teachers, many=True, context={'request': request})
-        students_serializer = UserProfileSerializer(students, many=True, context={'request': request})
-        if request.user.is_teacher:
-            results_dict = {'courses': course_serializer.data, 'teachers': teachers_serializer.data, 'students': students_serializer.data}
-        else:
-            results_dict = {'courses': course_serializer.data, 'teachers': teachers_serializer.data}
-        return JsonResponse(results_dict, status=status.HTTP_200_OK)
+        page = search.parse_page(request.GET.get('page'))
+        return JsonResponse(get_search_results_data(request, search_query, page), status=status.HTTP_200_OK)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
     responses={
@@ -501,24 +766,51 @@ def get_course_activities_with_materials(request, course_id):
         return Response({'message': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        enrolled = Enrollments.objects.filter(course=course, student=request.user, blocked=False).exists()
-        if not enrolled and not request.user.is_teacher:
+        if not can_view_course_activities(request.user, course):
             return Response({'message': 'You are not authorized to perform this action. Enroll and try again!'}, status=status.HTTP_403_FORBIDDEN)
         
-        activities = CourseActivity.objects.filter(course=course).order_by('-created_at')
-        serializer = CourseActivitySerializer(activities, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        return JsonResponse(get_course_activities_data(request, course), safe=False, status=status.HTTP_200_OK)
+    else:
+        return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+@use_replica
+@swagger_auto_schema(
+    method='get',
+    responses={
+        200: GradebookSerializer,
+        403: 'You are not authorized to perform this action',
+        404: 'Course not found',
+        405: 'Method not allowed'
+    },
+    operation_description="Get the gradebook of a course, teacher of the course only - the number of submissions and graded submissions, and the average, lowest and highest grade, of each activity and each student.",
+    tags=['Course']
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_gradebook(request, course_id):
+    try:
+        course = Course.objects.get(course_id=course_id)
+    except Course.DoesNotExist:
+        return Response({'message': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        if request.user.user_id != course.teacher_id:
+            return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
+        return JsonResponse(get_gradebook_data(request, course), status=status.HTTP_200_OK)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: FeedbackSerializer(many=True),
+        400: 'Invalid cursor',
         404: 'Course not found',
         405: 'Method not allowed'
     },
-    operation_description="Get feedback for a given course",
+    operation_description="Get feedback for a given course. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['Course']
 )
 @api_view(['GET'])
@@ -530,21 +822,26 @@ def get_course_feedback(request, course_id):
         return Response({'message': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if request.method == 'GET':
-        feedbacks = Feedback.objects.filter(course=course).order_by('-created_at')
-        serializer = FeedbackSerializer(feedbacks, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_course_feedback_page(request, course, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: EnrollmentsSerializer(many=True),
+        400: 'Invalid cursor',
         403: 'You are not authorized to perform this action',
         404: 'Course not found',
         405: 'Method not allowed'
     },
-    operation_description="Get enrolled students for a given course. Viewable only by the teacher of the course. Determined via request user.",
+    operation_description="Get enrolled students for a given course. Viewable only by the teacher of the course. Determined via request user. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['Enrollments']
 )
 @api_view(['GET'])
@@ -556,24 +853,29 @@ def get_enrolled_students(request, course_id):
         except Course.DoesNotExist:
             return Response({'message': 'Course not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        if request.user != course.teacher:
+        if request.user.user_id != course.teacher_id:
             return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
         
-        students = Enrollments.objects.filter(course=course).order_by('-enrolled_at')
-        serializer = EnrollmentsSerializer(students, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_enrolled_students_page(request, course, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
     responses={
         200: NotificationSerializer(many=True),
+        400: 'Invalid cursor',
         403: 'You are not authorized to perform this action',
         404: 'User not found',
         405: 'Method not allowed'
     },
-    operation_description="Get notifications for a given user. Determined via request user. Can only view their own notifications",
+    operation_description="Get notifications for a given user. Determined via request user. Can only view their own notifications. Paginated newest first, links to the next and previous pages are given in the Link header.",
     tags=['Notifications']
 )
 @api_view(['GET'])
@@ -588,28 +890,53 @@ def get_notifications(request, user_id):
         if request.user != user:
             return Response({'message': 'You are not authorized to perform this action'}, status=status.HTTP_403_FORBIDDEN)
         
-        notifications = Notification.objects.filter(recipient=user, read=False).order_by('-created_at')
-        serializer = NotificationSerializer(notifications, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        try:
+            page = get_notifications_page(request, user, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+@use_replica
 @swagger_auto_schema(
     method='get',
     responses={
-        200: LobbyMessageSerializer(many=True),
+        200: LobbyHistorySerializer(many=True),
         405: 'Method not allowed'
     },
-    operation_description="Get the latest lobby messages. No permissions required, accessible by all users. Returns 10 latest messages in lobby.",
+    operation_description="Get the latest lobby messages. No permissions required, accessible by all users. Returns 10 latest messages in lobby, newest first. The link to the older messages (get_lobby_history) is given in the Link header.",
     tags=['Lobby']
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_latest_lobby_messages(request):
     if request.method == 'GET':
-        latest_messages = LobbyMessage.objects.all().order_by('-created_at')[:10]
-        serializer = LobbyMessageSerializer(latest_messages, many=True, context={'request': request})
-        return JsonResponse(serializer.data, safe=False, status=status.HTTP_200_OK)
+        return paginated_response(request, get_latest_lobby_messages_page(request), path=reverse('get_lobby_history'))
+    else:
+        return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+@use_replica
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=CURSOR_PAGINATION_PARAMETERS,
+    responses={
+        200: LobbyHistorySerializer(many=True),
+        400: 'Invalid cursor',
+        405: 'Method not allowed'
+    },
+    operation_description="Get the lobby message history. No permissions required, accessible by all users. Paginated newest first, links to the next and previous pages are given in the Link header.",
+    tags=['Lobby']
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_lobby_history(request):
+    if request.method == 'GET':
+        try:
+            page = get_lobby_history_page(request, **pagination_params(request))
+        except InvalidCursor:
+            return Response({'message': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return paginated_response(request, page)
     else:
         return Response({'message': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
@@ -672,6 +999,10 @@ class GetAvailableCourses(LoginRequiredMixin, ListView):
     context_object_name = 'courses'
     paginate_by = 10
 
+    @method_decorator(use_replica)
+    def dispatch(self, request, *args, **kwargs):
+        return super().dispatch(request, *args, **kwargs)
+
     def get_queryset(self):
         return Course.objects.all().order_by('course_title')
         
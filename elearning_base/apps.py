@@ -5,6 +5,8 @@ class ElearningBaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'elearning_base'
 
-    #Override the ready method to import signals
+    #Override the ready method to import signals and install the request timing instrumentation
     def ready(self):
         import elearning_base.signals
+        from elearning_base.middleware import install_instrumentation
+        install_instrumentation()
@@ -2,7 +2,11 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
 from .models import Enrollments, LobbyMessage, UserProfile
+from .lobby_buffer import lobby_buffer
+from . import lobby_history
 
 #These consumers are used to handle websocket connections and messages sent asynchrously
 #between client side and server side
@@ -37,9 +41,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
         username = self.scope["user"].username
         is_teacher = self.scope["user"].is_teacher
         lobby_group = f'public_lobby'
+        lobby_message = LobbyMessage(user=self.scope["user"], message=message, created_at=timezone.now())
     
-        #Create message entry in database
-        await self.create_lobby_message(message)
+        #Create message entry in database, unless it is written afterwards in a batch (lobby_buffer.py)
+        if not settings.LOBBY_WRITE_BEHIND:
+            await self.save_lobby_message(lobby_message)
         
         await self.channel_layer.group_send(
         lobby_group,
@@ -49,6 +55,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'username': username,
             'is_teacher': is_teacher
         })
+
+        #Messages saved one by one are added to the lobby history by the lobby_message signal
+        if settings.LOBBY_WRITE_BEHIND:
+            await lobby_buffer.append(lobby_message)
+            await sync_to_async(lobby_history.push, thread_sensitive=False)(lobby_message)
     
     async def chat_message(self, event):
         message = event['message']
@@ -63,11 +74,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     #The following is synchronous database operations
     @database_sync_to_async
-    def create_lobby_message(self, message):
-        return LobbyMessage.objects.create(
-            user=self.scope["user"],
-            message=message
-        )
+    def save_lobby_message(self, lobby_message):
+        lobby_message.save()
     
     @database_sync_to_async
     def get_user(self):
@@ -76,9 +84,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
-        self.user, self.enrolled_courses = await self.get_users_and_courses()
+        self.user, self.enrolled_courses, self.blocked_courses = await self.get_users_and_courses()
 
         if self.user.is_authenticated:
+            # Unread count as of connecting, loaded along with the user
+            self.unread_notifications = self.user.unread_notifications
+
             user_specific_group = f"user_notifications_{self.user.user_id}"
             await self.channel_layer.group_add(user_specific_group, self.channel_name)
 
@@ -92,18 +103,14 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 teacher_group = f"enrollment_notifications_{self.user.user_id}"
                 await self.channel_layer.group_add(teacher_group, self.channel_name)
             
-            # Student notifications
+            # Student notifications - a single broadcast group per course, shared by all of its enrolled students.
+            # New activity and material events are sent once to the course group and filtered per user in course_notification
             for course_id in self.enrolled_courses:
-                material_group = f"new_material_notifications_{course_id}_{self.user.user_id}"
-                activity_group = f"new_activity_notifications_{course_id}_{self.user.user_id}"
-                await self.channel_layer.group_add(material_group, self.channel_name)
-                await self.channel_layer.group_add(activity_group, self.channel_name)
+                await self.channel_layer.group_add(course_notifications_group(course_id), self.channel_name)
 
             await self.accept()
 
     async def disconnect(self, close_code):
-        self.user, self.enrolled_courses = await self.get_users_and_courses()
-
         if self.user.is_authenticated:
             user_specific_group = f"user_notifications_{self.user.user_id}"
             await self.channel_layer.group_discard(user_specific_group, self.channel_name)
@@ -113,12 +120,9 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 teacher_group = f"enrollment_notifications_{self.user.user_id}"
                 await self.channel_layer.group_discard(teacher_group, self.channel_name)
             
-            # Student notifications
+            # Student notifications, including courses subscribed to dynamically since connecting
             for course_id in self.enrolled_courses:
-                material_group = f"new_material_notifications_{course_id}_{self.user.user_id}"
-                activity_group = f"new_activity_notifications_{course_id}_{self.user.user_id}"
-                await self.channel_layer.group_discard(material_group, self.channel_name)
-                await self.channel_layer.group_discard(activity_group, self.channel_name)
+                await self.channel_layer.group_discard(course_notifications_group(course_id), self.channel_name)
 
     async def new_notification(self, event):
         message = event["message"]
@@ -128,17 +132,42 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             "title": title
         }))
 
+    async def course_notification(self, event):
+        # Course broadcasts reach every enrolled student connected, so students blocked from the course are filtered out here
+        if event["course_id"] in self.blocked_courses:
+            return
+        await self.new_notification(event)
+        # The broadcast carries no per-student counts, the notification is counted here (the task counted it in the database)
+        self.unread_notifications += 1
+        await self.send_unread_count()
+
+    async def unread_count(self, event):
+        # New count after the user's own notifications changed (notification_counts.py)
+        self.unread_notifications = event["count"]
+        await self.send_unread_count()
+
+    async def send_unread_count(self):
+        await self.send(text_data=json.dumps({
+            "unread_count": self.unread_notifications
+        }))
+
+    async def enrollment_status(self, event):
+        # Keeps the blocked courses up to date when a teacher blocks/unblocks the student whilst connected
+        if event["blocked"]:
+            self.blocked_courses.add(event["course_id"])
+        else:
+            self.blocked_courses.discard(event["course_id"])
+
     async def dynamic_subscription(self, event):
-        material_group = event["material_group"]
-        activity_group = event["activity_group"]
+        course_id = event["course_id"]
+        course_group = course_notifications_group(course_id)
         title = event["title"]
         message = event["message"]
-        await self.channel_layer.group_add(material_group, self.channel_name)
-        await self.channel_layer.group_add(activity_group, self.channel_name)
+        await self.channel_layer.group_add(course_group, self.channel_name)
+        self.enrolled_courses.add(course_id)
 
         await self.send(text_data=json.dumps({
-            "material_group": material_group,
-            "activity_group": activity_group,
+            "course_group": course_group,
             "title": title,
             "message": message
         }))
@@ -159,9 +188,20 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_discard("chat_notifications", self.channel_name)
     #The following methods are for synchronous database operations
     #And data required in async functions
-    #Converting to list for immediate execution in async environment
+    #Converting to sets for immediate execution in async environment
     @database_sync_to_async
     def get_users_and_courses(self):
         user = self.scope["user"]
-        enrolled_courses = Enrollments.objects.filter(student=user).values_list('course_id', flat=True)
-        return user, list(enrolled_courses)
\ No newline at end of file
+        if not user.is_authenticated:
+            return user, set(), set()
+        enrollments = Enrollments.objects.filter(student=user).values_list('course_id', 'blocked')
+        enrolled_courses = set()
+        blocked_courses = set()
+        for course_id, blocked in enrollments:
+            enrolled_courses.add(course_id)
+            if blocked:
+                blocked_courses.add(course_id)
+        return user, enrolled_courses, blocked_courses
+
+def course_notifications_group(course_id):
+    return f"course_notifications_{course_id}"
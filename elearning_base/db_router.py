@@ -0,0 +1,50 @@
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+
+#Read/write split between the primary database (default) and a read replica (DATABASE_REPLICA, an alias in DATABASES).
+#Reads only go to the replica inside the read-only views marked with use_replica - the get_* API endpoints, the available
+#courses list and the search page - everything else (writes, other views, tasks, consumers) uses the primary.
+#The replica lags behind the primary, so reads stay on the primary:
+#  - for the rest of a request once it has written anything (db_for_write below)
+#  - for DATABASE_REPLICA_STICKY_SECONDS after a client's POST/PATCH/DELETE, marked by a cookie
+#    (middleware.PrimaryAfterWriteMiddleware), so a client reading back what it just wrote sees it
+#  - for the sessions, a login would otherwise not be found on the replica until it is synced
+#Locally the replica can be a second SQLite file, copied from the primary by the sync_replica management command.
+
+STICKY_COOKIE = 'use_primary'
+PRIMARY_APPS = {'sessions'}
+
+#Whether reads of the current request go to the replica
+replica_reads = ContextVar('replica_reads', default=False)
+
+def use_replica(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.DATABASE_REPLICA or request.method not in ('GET', 'HEAD') or STICKY_COOKIE in request.COOKIES:
+            return view(request, *args, **kwargs)
+        token = replica_reads.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+    return wrapper
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if replica_reads.get() and model._meta.app_label not in PRIMARY_APPS:
+            return settings.DATABASE_REPLICA
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        #Sticky to the primary after a write, until the end of the view
+        replica_reads.set(False)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        #The replica holds the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        #The replica gets the schema along with the data
+        return db == 'default'
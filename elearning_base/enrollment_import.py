@@ -0,0 +1,94 @@
+import csv
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import Enrollments, UserProfile
+from .grading import decoded_chunks, lines
+from .tasks import send_bulk_enrollment_notification
+
+#Bulk enrollment of students in a course by their usernames (api.create_enrollments), sent as a JSON array or a CSV file
+#  ["jsmith", "adoe", ...]          username        (or one username per line, without a header)
+#                                   jsmith
+#The usernames are looked up and enrolled ENROLLMENT_IMPORT_BATCH_SIZE at a time - one lookup of the students, one of their
+#existing enrollments and one bulk_create per batch, inserted again without any student the unique (course, student)
+#finds enrolled concurrently. bulk_create sends no post_save, so none of the per enrollment notification tasks
+#(signals.enrollment_notification) are queued: once the import commits a single task sends the teacher one notification
+#for all of the new students, and the pushes follow from their own tasks.
+#Usernames which can't be enrolled (unknown, teachers) are reported back, the others are enrolled.
+
+class EnrollmentFileError(Exception):
+    pass
+
+def read_json_usernames(data):
+    if not isinstance(data, list):
+        raise EnrollmentFileError("Expected a JSON array of usernames.")
+    return [str(username) for username in data]
+
+def read_csv_usernames(stream):
+    try:
+        rows = csv.reader(lines(decoded_chunks(stream)))
+        header = next(rows, [])
+        column = next((i for i, name in enumerate(header) if name.strip().lower() == 'username'), None)
+        if column is None:
+            #No header, the usernames are in the first column
+            column = 0
+            yield from header[:1]
+        for row in rows:
+            if len(row) > column:
+                yield row[column]
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise EnrollmentFileError(f"Invalid CSV: {e}")
+
+def enroll_batch(course, usernames):
+    #Enrolls a batch of usernames, returns (student ids enrolled, usernames already enrolled, errors)
+    students = {username: (pk, is_teacher) for pk, username, is_teacher in UserProfile.objects.filter(username__in=usernames).values_list('pk', 'username', 'is_teacher')}
+    enrolled = set(Enrollments.objects.filter(course=course, student_id__in=[pk for pk, _ in students.values()]).values_list('student_id', flat=True))
+
+    new, already_enrolled, errors = [], [], []
+    for username in usernames:
+        if username not in students:
+            errors.append({'username': username, 'error': "No user with this username."})
+            continue
+        pk, is_teacher = students[username]
+        #As EnrollmentCreateSerializer.validate
+        if is_teacher:
+            errors.append({'username': username, 'error': "Teacher cannot enroll in courses."})
+        elif pk in enrolled:
+            already_enrolled.append(username)
+        else:
+            new.append((pk, username))
+    if not new:
+        return [], already_enrolled, errors
+    #Inserted in a savepoint, without ignore_conflicts: a student enrolled in the meantime (a single enrollment made
+    #concurrently) fails the unique (course, student), and the batch is inserted again without the students now enrolled,
+    #who are reported as already enrolled - so every row of the batch inserted is one of this import's
+    while new:
+        try:
+            with transaction.atomic():
+                Enrollments.objects.bulk_create([Enrollments(course=course, student_id=pk) for pk, _ in new])
+            break
+        except IntegrityError:
+            enrolled = set(Enrollments.objects.filter(course=course, student_id__in=[pk for pk, _ in new]).values_list('student_id', flat=True))
+            if not enrolled:
+                raise
+            already_enrolled += [username for pk, username in new if pk in enrolled]
+            new = [(pk, username) for pk, username in new if pk not in enrolled]
+    return [pk for pk, _ in new], already_enrolled, errors
+
+def enroll(course, usernames):
+    #Enrolls the students of usernames in course, returns the report
+    usernames = list(dict.fromkeys(username.strip() for username in usernames if username.strip()))
+    if len(usernames) > settings.ENROLLMENT_IMPORT_MAX_USERNAMES:
+        raise EnrollmentFileError(f"At most {settings.ENROLLMENT_IMPORT_MAX_USERNAMES} usernames can be enrolled at once.")
+
+    report = {'usernames': len(usernames), 'enrolled': 0, 'already_enrolled': [], 'errors': []}
+    student_ids = []
+    with transaction.atomic():
+        for i in range(0, len(usernames), settings.ENROLLMENT_IMPORT_BATCH_SIZE):
+            new, already_enrolled, errors = enroll_batch(course, usernames[i:i + settings.ENROLLMENT_IMPORT_BATCH_SIZE])
+            student_ids += new
+            report['already_enrolled'] += already_enrolled
+            report['errors'] += errors
+        if student_ids:
+            transaction.on_commit(lambda: send_bulk_enrollment_notification.delay(course.course_id, student_ids))
+    report['enrolled'] = len(student_ids)
+    return report
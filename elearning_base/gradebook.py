@@ -0,0 +1,88 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from .models import CourseActivity, GradeSummary, Submission
+
+#Gradebook of a course - the number of submissions and graded submissions, and the average, lowest and highest grade, of
+#each activity and each student - kept in GradeSummary rows so a course's gradebook is one indexed read of its rows
+#(api.get_gradebook) rather than an aggregate over every submission of the course.
+#A change to submissions (signals.py, grading.py for the bulk updates which don't send signals) refreshes only the rows of
+#the activities and students it touched, each recomputed from their submissions with an indexed aggregate - the lowest
+#and highest grade can't be worked out from the old row when a submission is deleted or regraded. The refreshes of a
+#transaction are queued and run once it commits (queue_refresh), a bulk grading or an activity deleted with its
+#submissions refreshes each row once. The rebuild_gradebook command recomputes whole courses.
+
+def summary_values(row):
+    return {key: row[key] for key in ('submissions', 'graded', 'grade_min', 'grade_max')} | {'grade_total': row['grade_total'] or 0}
+
+def aggregate(submissions, group_by):
+    return submissions.values(group_by).annotate(
+        submissions=Count('pk'), graded=Count('grade'), grade_total=Sum('grade'), grade_min=Min('grade'), grade_max=Max('grade'),
+    ).order_by()
+
+def refresh(course_id, activity_ids=None, student_ids=None):
+    #Recomputes the rows of the course's activities and students in activity_ids and student_ids, None for all of them.
+    #Returns the number of rows written.
+    summaries, rows = GradeSummary.objects.filter(course_id=course_id), []
+    with transaction.atomic():
+        if activity_ids is None or activity_ids:
+            if activity_ids is None:
+                submissions = Submission.objects.filter(course_activity__course_id=course_id)
+                summaries.filter(course_activity__isnull=False).delete()
+            else:
+                submissions = Submission.objects.filter(course_activity_id__in=activity_ids)
+                summaries.filter(course_activity_id__in=activity_ids).delete()
+            rows += [GradeSummary(course_id=course_id, course_activity_id=row['course_activity_id'], **summary_values(row))
+                     for row in aggregate(submissions, 'course_activity_id')]
+
+        if student_ids is None or student_ids:
+            submissions = Submission.objects.filter(course_activity__course_id=course_id)
+            if student_ids is None:
+                summaries.filter(student__isnull=False).delete()
+            else:
+                submissions = submissions.filter(student_id__in=student_ids)
+                summaries.filter(student_id__in=student_ids).delete()
+            rows += [GradeSummary(course_id=course_id, student_id=row['student_id'], **summary_values(row))
+                     for row in aggregate(submissions, 'student_id')]
+        GradeSummary.objects.bulk_create(rows)
+    return len(rows)
+
+class PendingRefresh:
+    #The activities and students changed, refreshed when the transaction commits
+    def __init__(self):
+        self.activities = defaultdict(set)
+        self.courses = set()
+
+    def __call__(self):
+        course_of = dict(CourseActivity.objects.filter(pk__in=self.activities).values_list('pk', 'course_id'))
+        changes = defaultdict(lambda: (set(), set()))
+        for activity_id, student_ids in self.activities.items():
+            #Deleted since, along with its rows
+            if activity_id in course_of:
+                changes[course_of[activity_id]][0].add(activity_id)
+                changes[course_of[activity_id]][1].update(student_ids)
+        for course_id in self.courses:
+            changes[course_id][1].add(None)
+        for course_id, (activity_ids, student_ids) in changes.items():
+            refresh(course_id, activity_ids, None if None in student_ids else student_ids)
+
+def run_pending(connection):
+    #The first callback to run after the commit refreshes everything queued, the later ones find nothing left
+    pending, connection.gradebook_pending = getattr(connection, 'gradebook_pending', None), None
+    if pending is not None:
+        pending()
+
+def queue_refresh(activity_id=None, student_ids=(), course_id=None):
+    #Queues the refresh of an activity's row and its students' rows, or of all the student rows of course_id, for the end
+    #of the transaction (at once outside of one). The changes gather in a PendingRefresh on the connection, so a
+    #transaction refreshes each row once. Every call registers its own callback - one registered in a savepoint which is
+    #rolled back is dropped, the changes left over by a rolled back transaction are refreshed (unchanged) with the next.
+    connection = transaction.get_connection()
+    if getattr(connection, 'gradebook_pending', None) is None:
+        connection.gradebook_pending = PendingRefresh()
+    pending = connection.gradebook_pending
+    if activity_id is not None:
+        pending.activities[activity_id].update(student_ids)
+    if course_id is not None:
+        pending.courses.add(course_id)
+    transaction.on_commit(lambda: run_pending(connection))
@@ -0,0 +1,168 @@
+import codecs
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import transaction
+from .models import Submission
+from . import gradebook
+
+#Bulk grading of an activity's submissions (api.update_submission_grades) from a CSV file or a JSON array of rows
+#  submission_id,student,grade          [{"submission_id": 12, "grade": 85}, {"student": "jsmith", "grade": 70}, ...]
+#each naming a submission by id or by its student's username (their latest submission to the activity), an empty grade
+#clearing it. The body is read READ_SIZE bytes at a time and the rows applied GRADING_BATCH_SIZE at a time - two lookups
+#and one bulk_update per batch - so memory use doesn't grow with the number of rows. All batches are written in one
+#transaction, a file which can't be parsed changes nothing. Rows which can't be applied are reported with their number
+#(the first data row is 1), at most GRADING_MAX_ERRORS of them.
+
+READ_SIZE = 64 * 1024
+#Longest JSON row, a body which doesn't parse isn't buffered to the end
+MAX_JSON_ROW_SIZE = 64 * 1024
+
+class GradeFileError(Exception):
+    pass
+
+def decoded_chunks(stream):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    while data := stream.read(READ_SIZE):
+        yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
+
+def lines(chunks):
+    pending = ''
+    for chunk in chunks:
+        #The last part is a line cut off by the end of the chunk
+        *complete, pending = (pending + chunk).split('\n')
+        for line in complete:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+def read_csv_rows(stream):
+    reader = csv.DictReader(lines(decoded_chunks(stream)))
+    try:
+        if not reader.fieldnames or 'grade' not in reader.fieldnames or not {'submission_id', 'student'} & set(reader.fieldnames):
+            raise GradeFileError("The CSV header needs a grade column and a submission_id or student column.")
+        yield from reader
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise GradeFileError(f"Invalid CSV: {e}")
+
+def read_json_rows(stream):
+    #The items of a JSON array, decoded one at a time
+    decoder = json.JSONDecoder()
+    buffer, started = '', False
+    try:
+        for chunk in decoded_chunks(stream):
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip()
+                if not buffer:
+                    break
+                if not started:
+                    if buffer[0] != '[':
+                        raise GradeFileError("Expected a JSON array of rows.")
+                    buffer, started = buffer[1:], True
+                elif buffer[0] == ']':
+                    return
+                elif buffer[0] == ',':
+                    buffer = buffer[1:]
+                else:
+                    try:
+                        row, end = decoder.raw_decode(buffer)
+                    except json.JSONDecodeError:
+                        if len(buffer) > MAX_JSON_ROW_SIZE:
+                            raise GradeFileError("Invalid JSON row.")
+                        #The rest of the row is in the next chunk
+                        break
+                    buffer = buffer[end:]
+                    yield row
+    except UnicodeDecodeError as e:
+        raise GradeFileError(f"Invalid JSON: {e}")
+    raise GradeFileError("Invalid JSON: the array is not closed." if started else "Expected a JSON array of rows.")
+
+def parse_row(row):
+    #(key, value, grade) of a row, key 'submission_id' or 'student'. Raises ValueError with the row's error.
+    if not isinstance(row, dict):
+        raise ValueError("Row must be an object with a grade and a submission_id or student.")
+    if row.get('submission_id') not in (None, ''):
+        try:
+            key, value = 'submission_id', int(row['submission_id'])
+        except (TypeError, ValueError):
+            raise ValueError("submission_id must be a number.")
+    elif row.get('student') not in (None, ''):
+        key, value = 'student', str(row['student'])
+    else:
+        raise ValueError("Row needs a submission_id or a student.")
+
+    grade = row.get('grade')
+    if grade is None or grade == '':
+        return key, value, None
+    try:
+        grade = Decimal(str(grade).strip())
+    except InvalidOperation:
+        raise ValueError("Grade must be a number.")
+    if not grade.is_finite():
+        raise ValueError("Grade must be a number.")
+    #As Submission.clean
+    if grade < 0:
+        raise ValueError("Grade cannot be negative")
+    if grade > 100:
+        raise ValueError("Grade cannot be greater than 100")
+    if grade != grade.to_integral_value():
+        raise ValueError("Grade must be a whole number.")
+    return key, value, grade.quantize(Decimal(1))
+
+def apply_batch(activity, batch):
+    #Writes the grades of a batch of (number, key, value, grade), returns (rows updated, errors)
+    ids = {value for _, key, value, _ in batch if key == 'submission_id'}
+    usernames = {value for _, key, value, _ in batch if key == 'student'}
+    #(key, value) -> (submission, its student)
+    found = {('submission_id', pk): (pk, student_id) for pk, student_id in Submission.objects.filter(course_activity=activity, pk__in=ids).values_list('pk', 'student_id')}
+    #A student's latest submission, picked here rather than sorted by the database
+    latest = {}
+    submissions = Submission.objects.filter(course_activity=activity, student__username__in=usernames)
+    for pk, student_id, username, submitted_at in submissions.values_list('pk', 'student_id', 'student__username', 'submitted_at'):
+        if username not in latest or (submitted_at, pk) > latest[username][0]:
+            latest[username] = ((submitted_at, pk), student_id)
+    found.update({('student', username): (pk, student_id) for username, ((_, pk), student_id) in latest.items()})
+
+    grades, student_ids, errors = {}, set(), []
+    for number, key, value, grade in batch:
+        if (key, value) not in found:
+            errors.append({'row': number, 'error': f"No submission to this activity with {key} {value}."})
+        else:
+            pk, student_id = found[(key, value)]
+            grades[pk] = grade
+            student_ids.add(student_id)
+    Submission.objects.bulk_update([Submission(pk=pk, grade=grade) for pk, grade in grades.items()], ['grade'])
+    #bulk_update sends no post_save, the gradebook is refreshed here
+    gradebook.queue_refresh(activity.pk, student_ids)
+    return len(batch) - len(errors), errors
+
+def apply_grades(activity, rows):
+    #Grades the submissions of rows, returns the report. Raises GradeFileError for a file which can't be parsed.
+    report = {'rows': 0, 'updated': 0, 'error_count': 0, 'errors': []}
+
+    def add_errors(errors):
+        report['error_count'] += len(errors)
+        report['errors'].extend(errors[:settings.GRADING_MAX_ERRORS - len(report['errors'])])
+
+    with transaction.atomic():
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            report['rows'] = number
+            try:
+                batch.append((number, *parse_row(row)))
+            except ValueError as e:
+                add_errors([{'row': number, 'error': str(e)}])
+            if len(batch) >= settings.GRADING_BATCH_SIZE:
+                updated, errors = apply_batch(activity, batch)
+                report['updated'] += updated
+                add_errors(errors)
+                batch = []
+        if batch:
+            updated, errors = apply_batch(activity, batch)
+            report['updated'] += updated
+            add_errors(errors)
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
@@ -0,0 +1,73 @@
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+#Resized copies (derivatives) of the uploaded profile, course and material images, so that avatars and lists don't embed
+#the full-resolution uploads. Each IMAGE_DERIVATIVE_WIDTHS width is saved next to the original, in the original's format
+#and as WebP:
+#  profile_imgs/user_1/photo.jpg -> profile_imgs/user_1/photo.thumbnail.jpg, profile_imgs/user_1/photo.thumbnail.webp
+#They are generated by tasks.generate_image_derivatives once the upload is committed (signals.py), the upload request
+#doesn't wait for them. Until then the derivative URLs are the original's.
+
+#Model label -> image field, of the images which get derivatives
+IMAGE_FIELDS = {
+    'elearning_base.userprofile': 'profile_img',
+    'elearning_base.course': 'course_img',
+    'elearning_base.courseactivitymaterial': 'image',
+}
+
+def widths():
+    #(derivative, width), widest first
+    return sorted(settings.IMAGE_DERIVATIVE_WIDTHS.items(), key=lambda item: -item[1])
+
+def derivative_name(name, derivative, webp=False):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{derivative}{'.webp' if webp else ext}"
+
+def derivative_names(name):
+    return [derivative_name(name, derivative, webp) for derivative, _ in widths() for webp in (False, True)]
+
+def has_derivatives(field_file):
+    #The WebP copy of the smallest width is saved last
+    return field_file.storage.exists(derivative_names(field_file.name)[-1])
+
+def derivative_url(field_file, derivative, webp=False, derivatives=None):
+    #The original's URL until the copies exist. They're made together, callers building several URLs of an image pass
+    #has_derivatives() once as derivatives rather than a stat of the media directory per URL
+    if derivatives is None:
+        derivatives = has_derivatives(field_file)
+    if derivatives:
+        return field_file.storage.url(derivative_name(field_file.name, derivative, webp))
+    return field_file.url
+
+def encode(image, format):
+    if format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, format, quality=settings.IMAGE_DERIVATIVE_QUALITY)
+    return buffer.getvalue()
+
+def generate(field_file):
+    #Saves the derivatives of the image, replacing older copies. Returns their names.
+    #Raises PIL.UnidentifiedImageError for files which aren't images Pillow can read.
+    storage = field_file.storage
+    with field_file.open('rb'), Image.open(field_file) as original:
+        format = original.format if original.format in Image.SAVE else 'PNG'
+        #Rotated as the camera was held, the EXIF orientation isn't kept in the copies
+        image = ImageOps.exif_transpose(original)
+        image.load()
+
+    names = []
+    #Each width is resized from the previous, wider one rather than the full image. Never enlarged.
+    for derivative, width in widths():
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.Resampling.LANCZOS)
+        for webp in (False, True):
+            name = derivative_name(field_file.name, derivative, webp)
+            storage.delete(name)
+            names.append(storage.save(name, ContentFile(encode(image, 'WEBP' if webp else format))))
+    return names
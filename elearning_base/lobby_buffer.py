@@ -0,0 +1,148 @@
+import asyncio
+import atexit
+import json
+import logging
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import LobbyMessage
+
+#Write-behind buffer of the public lobby messages.
+#With LOBBY_WRITE_BEHIND on, ChatConsumer broadcasts a message straight away and appends it to this (per process) buffer,
+#which is written with a single bulk_create once LOBBY_BUFFER_MAX_SIZE messages are waiting or LOBBY_BUFFER_FLUSH_INTERVAL
+#seconds after the first message of a batch, so chat lines no longer wait on the database (and SQLite's single writer lock).
+#bulk_create does not send post_save, so each flush sends one chat_notifications ping in place of the lobby_message
+#signal's ping per message.
+#A batch which fails to write is put back and retried on a timer backing off up to LOBBY_BUFFER_RETRY_MAX_INTERVAL seconds,
+#whether or not more messages arrive. While the database stays down at most LOBBY_BUFFER_MAX_PENDING messages are kept,
+#the oldest ones past that are dropped (and logged).
+#The buffer is flushed on shutdown by the ASGI lifespan handler (lifespan below) and at interpreter exit. Daphne, which
+#serves this project, doesn't send lifespan events, so there only the exit flush runs - the messages waiting in the buffer
+#are lost when the process is stopped by SIGTERM or SIGKILL, which is why LOBBY_WRITE_BEHIND is off by default.
+#Every flush logs the buffer depth as a JSON line.
+
+logger = logging.getLogger(__name__)
+
+CHAT_NOTIFICATIONS_GROUP = 'chat_notifications'
+CHAT_NOTIFICATION_MESSAGE = 'New message in the public lobby'
+
+class LobbyMessageBuffer:
+    def __init__(self):
+        self.pending = []
+        self.timer = None
+        self.max_depth = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+        #Failed writes in a row, the retry timer backs off with them
+        self.retries = 0
+
+    @property
+    def depth(self):
+        return len(self.pending)
+
+    def stats(self):
+        return {'depth': self.depth, 'max_depth': self.max_depth, 'flushed': self.flushed, 'failed': self.failed, 'dropped': self.dropped}
+
+    async def append(self, lobby_message):
+        #An unsaved LobbyMessage, created_at set to the time it was sent
+        self.pending.append(lobby_message)
+        self.max_depth = max(self.max_depth, self.depth)
+        #Whilst backing off from a failed write the messages wait for the retry timer
+        if self.depth >= settings.LOBBY_BUFFER_MAX_SIZE and not self.retries:
+            await self.flush()
+        elif not self.timer_pending():
+            self.timer = asyncio.create_task(self.flush_later(settings.LOBBY_BUFFER_FLUSH_INTERVAL))
+
+    def timer_pending(self):
+        return self.timer is not None and not self.timer.done() and self.timer.get_loop() is asyncio.get_running_loop()
+
+    async def flush_later(self, delay):
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    def retry_later(self):
+        #A timer already waiting flushes the batch anyway, unless this is its own flush
+        if not self.timer_pending() or self.timer is asyncio.current_task():
+            delay = min(settings.LOBBY_BUFFER_FLUSH_INTERVAL * 2 ** self.retries, settings.LOBBY_BUFFER_RETRY_MAX_INTERVAL)
+            self.timer = asyncio.create_task(self.flush_later(delay))
+
+    def take(self):
+        #The batch is taken off the buffer before it is written, messages sent meanwhile go into the next batch
+        batch, self.pending = self.pending, []
+        return batch
+
+    def write(self, batch):
+        try:
+            LobbyMessage.objects.bulk_create(batch)
+        except IntegrityError:
+            #A message of a user deleted since it was sent - written one by one instead, dropping the ones which fail
+            #rather than putting the batch back to fail again
+            for lobby_message in batch:
+                try:
+                    with transaction.atomic():
+                        LobbyMessage.objects.bulk_create([lobby_message])
+                except IntegrityError:
+                    logger.warning('Dropped lobby message of user %s', lobby_message.user_id)
+
+    def written(self, batch):
+        self.flushed += len(batch)
+        self.retries = 0
+        logger.info(json.dumps({'event': 'lobby_buffer_flush', 'written': len(batch), **self.stats()}))
+
+    def write_failed(self, batch):
+        #Put back in front of the buffer, to be written with the next batch
+        self.failed += 1
+        self.retries += 1
+        self.pending[:0] = batch
+        logger.exception('Writing %d lobby messages failed', len(batch))
+        if self.depth > settings.LOBBY_BUFFER_MAX_PENDING:
+            dropped = self.depth - settings.LOBBY_BUFFER_MAX_PENDING
+            del self.pending[:dropped]
+            self.dropped += dropped
+            logger.error('Dropped the %d oldest unwritten lobby messages, %d are waiting', dropped, self.depth)
+
+    async def flush(self):
+        batch = self.take()
+        if not batch:
+            return
+        try:
+            await database_sync_to_async(self.write)(batch)
+        except Exception:
+            self.write_failed(batch)
+            self.retry_later()
+            return
+        self.written(batch)
+        await get_channel_layer().group_send(CHAT_NOTIFICATIONS_GROUP, chat_notification_event())
+
+    def flush_sync(self):
+        batch = self.take()
+        if not batch:
+            return
+        try:
+            self.write(batch)
+        except Exception:
+            self.write_failed(batch)
+            return
+        self.written(batch)
+        async_to_sync(get_channel_layer().group_send)(CHAT_NOTIFICATIONS_GROUP, chat_notification_event())
+
+def chat_notification_event():
+    return {'type': 'chat.notification', 'message': CHAT_NOTIFICATION_MESSAGE}
+
+lobby_buffer = LobbyMessageBuffer()
+
+atexit.register(lobby_buffer.flush_sync)
+
+async def lifespan(scope, receive, send):
+    #ASGI lifespan protocol application, flushes the buffer when the server shuts down
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await lobby_buffer.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -0,0 +1,106 @@
+import json
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from .models import LobbyMessage
+from .pagination import CursorPage, encode_cursor, encode_position, paginate
+from .serializers import LobbyHistorySerializer
+
+#Ring buffer of the latest public lobby messages, so loading the lobby does not query the database.
+#The last LOBBY_HISTORY_SIZE messages are kept serialized (LobbyHistorySerializer) in a capped Redis list, newest first,
+#pushed as messages are sent - by ChatConsumer for buffered messages (lobby_buffer.py) and by the lobby_message signal for
+#messages saved one by one. Without LOBBY_HISTORY_REDIS_URL (tests) the list is kept in the django cache instead.
+#
+#The ring is filled from the database on the first read after it was lost (Redis restart/eviction). Until then pushes are
+#dropped, a ring with only the messages sent since would hide the older ones. An end marker is pushed after the messages
+#loaded from the database, so the ring of an empty lobby is not mistaken for a lost one.
+#Older messages are paginated from the database (services.get_lobby_history_page), starting at history_cursor - the oldest
+#shown message's position, or its timestamp (history_page) while it is in the lobby buffer without an id.
+
+HISTORY_KEY = 'lobby_history'
+END_MARKER = ''
+
+redis_clients = {}
+
+def get_redis():
+    url = settings.LOBBY_HISTORY_REDIS_URL
+    if url not in redis_clients:
+        redis_clients[url] = redis.Redis.from_url(url)
+    return redis_clients[url]
+
+def serialize(message):
+    return dict(LobbyHistorySerializer(message).data)
+
+def push(message):
+    entry = serialize(message)
+    if settings.LOBBY_HISTORY_REDIS_URL:
+        with get_redis().pipeline() as pipe:
+            #LPUSHX only pushes to an existing ring
+            pipe.lpushx(HISTORY_KEY, json.dumps(entry))
+            pipe.ltrim(HISTORY_KEY, 0, settings.LOBBY_HISTORY_SIZE)
+            pipe.execute()
+    else:
+        entries = cache.get(HISTORY_KEY)
+        if entries is not None:
+            cache.set(HISTORY_KEY, [entry] + entries[:settings.LOBBY_HISTORY_SIZE - 1], None)
+
+def latest(count):
+    #The latest count messages, newest first
+    if settings.LOBBY_HISTORY_REDIS_URL:
+        entries = get_redis().lrange(HISTORY_KEY, 0, count - 1)
+        if entries:
+            return [json.loads(entry) for entry in entries if entry != END_MARKER.encode()]
+    else:
+        entries = cache.get(HISTORY_KEY)
+        if entries is not None:
+            return entries[:count]
+    return fill()[:count]
+
+def fill():
+    messages = LobbyMessage.objects.select_related('user').order_by('-created_at', '-pk')[:settings.LOBBY_HISTORY_SIZE]
+    entries = [serialize(message) for message in messages]
+    if settings.LOBBY_HISTORY_REDIS_URL:
+        with get_redis().pipeline() as pipe:
+            try:
+                #Left as is if another process filled the ring (or a message was pushed) meanwhile
+                pipe.watch(HISTORY_KEY)
+                if not pipe.exists(HISTORY_KEY):
+                    pipe.multi()
+                    pipe.rpush(HISTORY_KEY, *[json.dumps(entry) for entry in entries], END_MARKER)
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+    else:
+        cache.add(HISTORY_KEY, entries, None)
+    return entries
+
+def clear():
+    if settings.LOBBY_HISTORY_REDIS_URL:
+        get_redis().delete(HISTORY_KEY)
+    else:
+        cache.delete(HISTORY_KEY)
+
+def history_cursor(entries, count):
+    #Cursor of the messages older than entries (as returned by latest(count)), None when there are none
+    if len(entries) < count:
+        return None
+    oldest = entries[-1]
+    created_at = parse_datetime(oldest['created_at'])
+    if oldest.get('message_id') is not None:
+        return encode_position(created_at, oldest['message_id'])
+    #The oldest entry is still in the lobby buffer (and so are the newer ones, it is written in order) - a negative
+    #position: the messages sent up to and including its timestamp, less the ones shown then (history_page)
+    return encode_position(created_at, -sum(1 for entry in entries if entry['created_at'] == oldest['created_at']))
+
+def history_page(messages, created_at, shown, page_size):
+    #Page of messages at or before created_at, the first shown messages at created_at left out. Messages sent at the same
+    #time are written in the order they were sent, the shown ones (sent last) have the highest ids of them.
+    page = paginate(messages.filter(created_at__lte=created_at), None, page_size + shown)
+    rows, skipped = page.items, 0
+    while skipped < shown and skipped < len(rows) and rows[skipped].created_at == created_at:
+        skipped += 1
+    rows = rows[skipped:]
+    has_more = page.next_cursor is not None or len(rows) > page_size
+    rows = rows[:page_size]
+    return CursorPage(rows, encode_cursor(rows[-1], 'created_at') if has_more and rows else None, encode_cursor(rows[0], 'created_at', backwards=True) if rows else None)
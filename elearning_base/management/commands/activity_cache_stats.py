@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from elearning_base import activity_cache
+
+#Prints the hit/miss counters of the course activity tree cache (activity_cache.py)
+class Command(BaseCommand):
+    help = 'Show the hit/miss counters of the course activities cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = activity_cache.get_stats()
+        hit_ratio = f"{stats['hit_ratio']:.1%}" if stats['hit_ratio'] is not None else '-'
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit ratio: {hit_ratio}")
+        if options['reset']:
+            activity_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
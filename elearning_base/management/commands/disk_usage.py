@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elearning_base import storage
+
+#Reports the disk usage of the content-addressed blobs (storage.py) - the bytes stored against the bytes the materials and
+#submissions referring to them would take as separate copies - and optionally deletes the unreferenced ones, as the daily
+#collect_blobs task does
+class Command(BaseCommand):
+    help = 'Show the disk usage of the content-addressed course files and the bytes saved by storing each once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collect', action='store_true', help='Delete the unreferenced blobs older than the grace period afterwards')
+        parser.add_argument('--grace-hours', type=float, default=settings.BLOB_GC_GRACE_HOURS, help='Keep unreferenced blobs younger than this many hours')
+
+    def handle(self, *args, **options):
+        if not storage.is_content_addressed():
+            self.stdout.write('Course files are not content-addressed (CONTENT_ADDRESSED_STORAGE is off).')
+            return
+
+        result = storage.usage()
+        self.stdout.write(f"blobs: {result['blobs']}, {format_bytes(result['stored_bytes'])} on disk")
+        self.stdout.write(f"referenced: {format_bytes(result['referenced_bytes'])} as separate copies")
+        self.stdout.write(f"saved: {format_bytes(result['saved_bytes'])}")
+        self.stdout.write(f"unreferenced: {result['unreferenced_blobs']} blobs, {format_bytes(result['unreferenced_bytes'])}")
+        if options['collect']:
+            deleted = storage.collect(options['grace_hours'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted['files']} unreferenced blobs, {format_bytes(deleted['bytes'])}."))
+
+def format_bytes(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
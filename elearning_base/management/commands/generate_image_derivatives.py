@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from PIL import Image
+from elearning_base import image_derivatives
+
+#Makes the resized copies (image_derivatives.py) of the images uploaded before they were generated on upload, or of all
+#the images with --all, after IMAGE_DERIVATIVE_WIDTHS has changed. Run in the foreground rather than queued.
+class Command(BaseCommand):
+    help = 'Generate the resized copies of the uploaded profile, course and material images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate the copies of images which already have them')
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for model, field_name in image_derivatives.IMAGE_FIELDS.items():
+            for instance in apps.get_model(model).objects.exclude(**{field_name: ''}).only(field_name).iterator():
+                field_file = getattr(instance, field_name)
+                if not options['all'] and image_derivatives.has_derivatives(field_file):
+                    continue
+                try:
+                    image_derivatives.generate(field_file)
+                    generated += 1
+                except (OSError, Image.DecompressionBombError) as e:
+                    #Unreadable images (PIL.UnidentifiedImageError) and missing files
+                    failed += 1
+                    self.stderr.write(f'{field_file.name}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Generated the copies of {generated} images, {failed} failed.'))
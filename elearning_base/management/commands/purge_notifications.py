@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elearning_base import notification_retention
+
+#Deletes the read notifications older than the retention period (notification_retention.py), as the daily
+#purge_notifications task does, reporting the rows removed and the table size before and after
+class Command(BaseCommand):
+    help = 'Delete (and optionally archive) read notifications older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.NOTIFICATION_RETENTION_DAYS, help='Delete read notifications older than this many days')
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_RETENTION_BATCH_SIZE, help='Rows deleted per transaction')
+        parser.add_argument('--archive', help='JSON lines file the deleted notifications are appended to')
+        parser.add_argument('--vacuum', action='store_true', help='VACUUM the database afterwards to return the freed pages to the filesystem (locks the database)')
+
+    def handle(self, *args, **options):
+        if options['archive']:
+            with open(options['archive'], 'a') as archive:
+                result = notification_retention.purge_read_notifications(options['days'], options['batch_size'], archive)
+        else:
+            result = notification_retention.purge_read_notifications(options['days'], options['batch_size'])
+        if options['vacuum']:
+            notification_retention.vacuum()
+            result['after'] = notification_retention.table_size()
+
+        self.stdout.write(f"Deleted {result['deleted']} read notifications older than {result['cutoff']:%Y-%m-%d %H:%M}.")
+        for label in ('before', 'after'):
+            size = result[label]
+            size_bytes = f", {size['bytes'] / 1024:.0f} KiB" if size['bytes'] is not None else ''
+            self.stdout.write(f"{label}: {size['rows']} rows{size_bytes}")
+        self.stdout.write(self.style.SUCCESS('Notifications purged.'))
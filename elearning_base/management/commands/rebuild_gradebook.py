@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from elearning_base import gradebook
+from elearning_base.models import Course
+
+#Recomputes the gradebook rows (gradebook.py) of every course, or of the given courses, from their submissions - to fill
+#them in for the submissions made before the gradebook was kept, or after grades were changed without signals
+class Command(BaseCommand):
+    help = 'Rebuild the gradebook summaries of the courses from their submissions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='*', type=int, help='Courses to rebuild, all of them if none are given')
+
+    def handle(self, *args, **options):
+        course_ids = options['course_ids'] or list(Course.objects.order_by('course_id').values_list('course_id', flat=True))
+        missing = set(course_ids) - set(Course.objects.filter(course_id__in=course_ids).values_list('course_id', flat=True))
+        if missing:
+            raise CommandError(f"Courses not found: {', '.join(map(str, sorted(missing)))}")
+
+        rows = 0
+        for course_id in course_ids:
+            rows += gradebook.refresh(course_id)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the gradebook of {len(course_ids)} courses, {rows} rows."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from elearning_base import search
+
+#Rebuilds the full-text search index from the course and user tables.
+#Needed after rows were inserted/updated without signals firing (bulk_create, queryset.update, raw sql or fixtures).
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over courses and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild the index on')
+
+    def handle(self, *args, **options):
+        if connections[options['database']].vendor != 'sqlite':
+            self.stdout.write('Full-text search index is only used on SQLite, nothing to rebuild.')
+            return
+        search.rebuild_index(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
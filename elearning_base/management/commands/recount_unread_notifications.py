@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from elearning_base import notification_counts
+
+#Rebuilds the unread notification counts (notification_counts.py) from the notifications, after bulk changes or a drift
+class Command(BaseCommand):
+    help = 'Recount the unread notifications of every user'
+
+    def handle(self, *args, **options):
+        updated = notification_counts.recount()
+        self.stdout.write(self.style.SUCCESS(f'Recounted the unread notifications of {updated} users.'))
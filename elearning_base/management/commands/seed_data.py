@@ -0,0 +1,267 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from elearning_base.models import *
+from elearning_base import gradebook, notification_counts, search
+
+#Fills the database with a synthetic, deterministic (seeded) population for load testing and benchmarking.
+#Everything is inserted with bulk_create in batches, so no model save()/signals run - no notifications are sent, the
+#Teachers/Students group membership UserProfile.save would add is inserted directly and the search index is rebuilt at the end.
+#Course popularity follows a power law, so a few courses have most of the enrollments like in a real catalogue.
+#With the default options about 800k rows are generated, the row counts scale linearly with --users and --courses.
+
+WORDS = ['Python', 'Algebra', 'History', 'Physics', 'Design', 'Data', 'Music', 'Biology', 'Finance', 'Networks',
+         'Chemistry', 'Drawing', 'Writing', 'Statistics', 'Marketing', 'Robotics', 'Poetry', 'Geology', 'Ethics', 'Cooking',
+         'Introduction', 'Advanced', 'Applied', 'Modern', 'Foundations', 'Practical', 'Theory', 'Systems', 'Analysis', 'Methods']
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Ella', 'Frank', 'Grace', 'Hugo', 'Iris', 'Jack', 'Kate', 'Liam', 'Maya', 'Noah', 'Olivia', 'Paul']
+LAST_NAMES = ['Smith', 'Borg', 'Camilleri', 'Jones', 'Brown', 'Vella', 'Taylor', 'Farrugia', 'Wilson', 'Zammit', 'Evans', 'Grech']
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+@contextmanager
+def explicit_timestamps(*models):
+    #bulk_create fills auto_now/auto_now_add fields with the current time, switched off so the generated timestamps are kept
+    fields = [field for model in models for field in model._meta.fields if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    original = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in original:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+class Command(BaseCommand):
+    help = 'Fill the database with a deterministic synthetic dataset (bulk inserts) for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed and options generate the same data')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the generated usernames, emails and course titles')
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--teacher-ratio', type=float, default=0.05)
+        parser.add_argument('--courses', type=int, default=2000)
+        parser.add_argument('--enrollments-per-student', type=float, default=5, help='Mean number of courses a student is enrolled in')
+        parser.add_argument('--popularity-skew', type=float, default=1.1, help='Power law exponent of the course popularity')
+        parser.add_argument('--activities-per-course', type=float, default=8)
+        parser.add_argument('--materials-per-activity', type=int, default=2)
+        parser.add_argument('--submission-rate', type=float, default=0.6, help='Share of enrolled students submitting each assignment/exam')
+        parser.add_argument('--feedback-rate', type=float, default=0.1, help='Share of enrollments leaving feedback')
+        parser.add_argument('--notifications-per-user', type=float, default=20)
+        parser.add_argument('--status-updates-per-user', type=float, default=3)
+        parser.add_argument('--lobby-messages', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=365, help='Timestamps are spread over this many days')
+        parser.add_argument('--end-date', type=datetime.fromisoformat, help='Latest timestamp (YYYY-MM-DD), defaults to the start of today')
+        parser.add_argument('--password', default='Seed-password1!', help='Password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if UserProfile.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Data with the prefix '{prefix}' already exists, use a different --prefix.")
+
+        end = options['end_date'] or timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        self.end = end
+        self.start = end - timedelta(days=options['days'])
+
+        self.total = 0
+        started = time.perf_counter()
+        with explicit_timestamps(UserProfile, Course, Enrollments, CourseActivity, CourseActivityMaterial, Submission, StatusUpdate, Feedback, Notification, LobbyMessage):
+            teacher_ids, student_ids = self.step('users', self.create_users)
+            courses = self.step('courses', self.create_courses, teacher_ids)
+            course_students = self.step('enrollments', self.create_enrollments, courses, student_ids)
+            activities = self.step('activities', self.create_activities, courses)
+            self.step('materials', self.create_materials, activities)
+            self.step('submissions', self.create_submissions, activities, course_students)
+            self.step('feedback', self.create_feedback, courses, course_students)
+            self.step('notifications', self.create_notifications, teacher_ids + student_ids)
+            self.step('status updates', self.create_status_updates, teacher_ids + student_ids)
+            self.step('lobby messages', self.create_lobby_messages, teacher_ids + student_ids)
+        #Bulk inserts do not fire the signals that keep the search index up to date, nor update the unread notification counts
+        #or the gradebook summaries
+        self.step('search index', lambda: search.rebuild_index() if search.fts_enabled() else None)
+        self.step('unread counts', lambda: notification_counts.recount(UserProfile.objects.filter(username__startswith=f'{prefix}_')))
+        self.step('gradebook', self.rebuild_gradebook, courses)
+        self.stdout.write(self.style.SUCCESS(f'Seeded {self.total} rows in {time.perf_counter() - started:.1f}s'))
+
+    def step(self, name, fn, *args):
+        started = time.perf_counter()
+        self.rows = 0
+        result = fn(*args)
+        self.total += self.rows
+        self.stdout.write(f'{name:<16} {self.rows:>10} rows  {time.perf_counter() - started:7.1f}s')
+        return result
+
+    def insert(self, model, objects):
+        #Returns the primary key the inserted rows start after, so they can be read back without holding the objects in memory
+        last_pk = model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        with transaction.atomic():
+            for batch in batched(objects, self.batch_size):
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                self.rows += len(batch)
+        return last_pk
+
+    def count(self, mean):
+        #Poisson-like count around the mean, cheap to draw and deterministic for the seed
+        return max(0, int(self.rng.expovariate(1 / mean) + 0.5)) if mean > 0 else 0
+
+    def random_time(self, start=None, end=None):
+        start, end = start or self.start, end or self.end
+        return start + (end - start) * self.rng.random()
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        password = make_password(self.options['password'])
+        teachers = max(1, int(self.options['users'] * self.options['teacher_ratio']))
+
+        def users():
+            for i in range(self.options['users']):
+                is_teacher = i < teachers
+                role = 'teacher' if is_teacher else 'student'
+                joined = self.random_time()
+                yield UserProfile(
+                    username=f'{prefix}_{role}_{i}', email=f'{prefix}_{role}_{i}@example.com', password=password,
+                    first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES), is_teacher=is_teacher,
+                    bio=f'{role.title()} interested in {self.rng.choice(WORDS).lower()}.', date_joined=joined,
+                )
+        last_pk = self.insert(UserProfile, users())
+
+        users = list(UserProfile.objects.filter(user_id__gt=last_pk).order_by('user_id').values_list('user_id', 'is_teacher'))
+        teacher_ids = [user_id for user_id, is_teacher in users if is_teacher]
+        student_ids = [user_id for user_id, is_teacher in users if not is_teacher]
+
+        #Group membership normally added by UserProfile.save
+        teachers_group, _ = Group.objects.get_or_create(name='Teachers')
+        students_group, _ = Group.objects.get_or_create(name='Students')
+        Membership = UserProfile.groups.through
+        self.insert(Membership, (
+            Membership(userprofile_id=user_id, group_id=teachers_group.id if is_teacher else students_group.id) for user_id, is_teacher in users
+        ))
+        return teacher_ids, student_ids
+
+    def create_courses(self, teacher_ids):
+        prefix = self.options['prefix']
+        def courses():
+            for i in range(self.options['courses']):
+                created = self.random_time(end=self.start + (self.end - self.start) * 0.5)
+                title = ' '.join(self.rng.sample(WORDS, 3))
+                yield Course(
+                    course_title=f'{title} {prefix} {i}', description=' '.join(self.rng.choices(WORDS, k=40)).capitalize() + '.',
+                    teacher_id=self.rng.choice(teacher_ids), created_at=created, updated_at=created,
+                )
+        last_pk = self.insert(Course, courses())
+        return list(Course.objects.filter(course_id__gt=last_pk).order_by('course_id').values_list('course_id', 'created_at'))
+
+    def create_enrollments(self, courses, student_ids):
+        #Course popularity follows a power law over a shuffled ranking of the courses
+        ranked = list(courses)
+        self.rng.shuffle(ranked)
+        skew = self.options['popularity_skew']
+        cum_weights, total = [], 0
+        for rank in range(1, len(ranked) + 1):
+            total += 1 / rank ** skew
+            cum_weights.append(total)
+
+        course_students = {course_id: [] for course_id, _ in courses}
+        def enrollments():
+            for student_id in student_ids:
+                draws = self.rng.choices(range(len(ranked)), cum_weights=cum_weights, k=min(len(ranked), max(1, self.count(self.options['enrollments_per_student']))))
+                #Duplicate draws dropped in draw order (not a set, its order would depend on the hash seed)
+                picks = [ranked[i] for i in dict.fromkeys(draws)]
+                for course_id, course_created in picks:
+                    course_students[course_id].append(student_id)
+                    blocked = self.rng.random() < 0.01
+                    status = Enrollments.BLOCKED if blocked else self.rng.choices([Enrollments.ACTIVE, Enrollments.COMPLETE, Enrollments.INACTIVE], weights=[80, 15, 5])[0]
+                    yield Enrollments(course_id=course_id, student_id=student_id, enrolled_at=self.random_time(start=course_created), status=status, blocked=blocked)
+        self.insert(Enrollments, enrollments())
+        return course_students
+
+    def create_activities(self, courses):
+        activity_types = [CourseActivity.LECTURE, CourseActivity.ASSIGNMENT, CourseActivity.EXAM]
+        def activities():
+            for course_id, course_created in courses:
+                for i in range(self.count(self.options['activities_per_course'])):
+                    created = self.random_time(start=course_created)
+                    activity_type = self.rng.choices(activity_types, weights=[60, 30, 10])[0]
+                    deadline = created + timedelta(days=self.rng.randint(7, 60)) if activity_type != CourseActivity.LECTURE else None
+                    yield CourseActivity(
+                        course_id=course_id, activity_title=f'{activity_type.title()} {i + 1}: {self.rng.choice(WORDS)}',
+                        description=' '.join(self.rng.choices(WORDS, k=20)).capitalize() + '.', activity_type=activity_type,
+                        created_at=created, updated_at=created, deadline=deadline,
+                    )
+        last_pk = self.insert(CourseActivity, activities())
+        return list(CourseActivity.objects.filter(activity_id__gt=last_pk).order_by('activity_id').values_list('activity_id', 'course_id', 'activity_type', 'created_at', 'deadline'))
+
+    def create_materials(self, activities):
+        def materials():
+            for activity_id, _, _, activity_created, _ in activities:
+                for i in range(self.options['materials_per_activity']):
+                    created = self.random_time(start=activity_created)
+                    yield CourseActivityMaterial(
+                        course_activity_id=activity_id, material_title=f'Material {i + 1}', description=' '.join(self.rng.choices(WORDS, k=15)).capitalize() + '.',
+                        video_link=f'https://example.com/videos/{activity_id}/{i + 1}', created_at=created, updated_at=created,
+                    )
+        self.insert(CourseActivityMaterial, materials())
+
+    def create_submissions(self, activities, course_students):
+        def submissions():
+            for activity_id, course_id, activity_type, activity_created, deadline in activities:
+                if activity_type == CourseActivity.LECTURE:
+                    continue
+                for student_id in course_students[course_id]:
+                    if self.rng.random() >= self.options['submission_rate']:
+                        continue
+                    graded = self.rng.random() < 0.7
+                    yield Submission(
+                        student_id=student_id, course_activity_id=activity_id, file=f'submissions/user_{student_id}/activity_{activity_id}/submission.pdf',
+                        submitted_at=self.random_time(start=activity_created, end=deadline), grade=self.rng.randint(30, 100) if graded else None,
+                    )
+        self.insert(Submission, submissions())
+
+    def create_feedback(self, courses, course_students):
+        created_at = dict(courses)
+        def feedback():
+            for course_id, students in course_students.items():
+                for student_id in students:
+                    if self.rng.random() < self.options['feedback_rate']:
+                        yield Feedback(course_id=course_id, student_id=student_id, feedback=' '.join(self.rng.choices(WORDS, k=12)).capitalize() + '.', created_at=self.random_time(start=created_at[course_id]))
+        self.insert(Feedback, feedback())
+
+    def create_notifications(self, user_ids):
+        def notifications():
+            for user_id in user_ids:
+                for _ in range(self.count(self.options['notifications_per_user'])):
+                    title = self.rng.choice(['New Activity', 'New Material', 'New Enrollment'])
+                    yield Notification(recipient_id=user_id, title=title, message=f'{title} in {self.rng.choice(WORDS)}', read=self.rng.random() < 0.7, created_at=self.random_time())
+        self.insert(Notification, notifications())
+
+    def create_status_updates(self, user_ids):
+        def status_updates():
+            for user_id in user_ids:
+                for _ in range(self.count(self.options['status_updates_per_user'])):
+                    yield StatusUpdate(user_id=user_id, status=' '.join(self.rng.choices(WORDS, k=10)).capitalize() + '.', created_at=self.random_time())
+        self.insert(StatusUpdate, status_updates())
+
+    def create_lobby_messages(self, user_ids):
+        def lobby_messages():
+            for _ in range(self.options['lobby_messages']):
+                yield LobbyMessage(user_id=self.rng.choice(user_ids), message=' '.join(self.rng.choices(WORDS, k=8)).capitalize() + '.', created_at=self.random_time())
+        self.insert(LobbyMessage, lobby_messages())
+
+    def rebuild_gradebook(self, courses):
+        for course_id, _ in courses:
+            self.rows += gradebook.refresh(course_id)
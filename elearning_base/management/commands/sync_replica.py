@@ -0,0 +1,39 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+#Copies the primary SQLite database to the replica file (db_router.py) with SQLite's online backup API, which takes a
+#consistent snapshot while the primary is in use. With --interval the copy is repeated, standing in for replication.
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the read replica file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replica', help='Replica database file, DATABASE_REPLICA_NAME by default')
+        parser.add_argument('--interval', type=float, help='Keep copying every this many seconds')
+        parser.add_argument('--pages', type=int, default=1024, help='Pages copied per step, the primary is only locked during a step')
+
+    def handle(self, *args, **options):
+        primary = connections['default']
+        if primary.vendor != 'sqlite':
+            raise CommandError('The replica can only be synced from a SQLite primary database.')
+        replica_name = options['replica'] or settings.DATABASE_REPLICA_NAME
+        if not replica_name:
+            raise CommandError('No replica configured, set DATABASE_REPLICA_NAME or pass --replica.')
+
+        while True:
+            start = time.perf_counter()
+            self.sync(primary, replica_name, options['pages'])
+            self.stdout.write(self.style.SUCCESS(f'Replica {replica_name} synced in {(time.perf_counter() - start) * 1000:.0f} ms.'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, primary, replica_name, pages):
+        primary.ensure_connection()
+        replica = sqlite3.connect(replica_name)
+        try:
+            primary.connection.backup(replica, pages=pages)
+        finally:
+            replica.close()
@@ -0,0 +1,187 @@
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from .models import Course, CourseActivity, CourseActivityMaterial, Enrollments, Submission
+from .storage import BLOB_DIR, IMMUTABLE_MAX_AGE, digest_of
+
+#Delivery of the uploaded files under MEDIA_URL (views.protected_media), each request checked against who may read the file:
+#  profile_imgs/, course_imgs/                      anyone
+#  course_files/course_<id>/..., <id>/activity_...  the course's teacher and its enrolled (not blocked) students
+#  submissions/user_<id>/activity_<id>/...          the student and the teacher of the activity's course
+#  blobs/ (storage.py)                              anyone who can read a material or submission referring to the blob
+#The checks are of the name the file is served from: a path with '..', '.' or empty segments (also when sent
+#percent-encoded, %2e%2e) is refused rather than normalized after the check, profile_imgs/../submissions/... isn't public.
+#Each check is a lookup on an index - of the course, the enrollment's (course, student), or the file name.
+#The bytes are then sent by the front web server (MEDIA_DELIVERY), a download doesn't hold a Django worker:
+#  x-accel-redirect  nginx, from an internal location (MEDIA_ACCEL_REDIRECT_LOCATION) aliased to MEDIA_ROOT
+#  x-sendfile        Apache mod_xsendfile or lighttpd, from the file's path
+#  python            by Django itself, with Range requests, ETag/If-None-Match and the wsgi.file_wrapper of the server
+#                    (gunicorn sends it with sendfile(), without copying through Python)
+
+PUBLIC_PREFIXES = ('profile_imgs/', 'course_imgs/')
+COURSE_FILE = re.compile(r'course_files/course_(\d+)/')
+MATERIAL_IMAGE = re.compile(r'(\d+)/activity_\d+/images/')
+SUBMISSION_FILE = re.compile(r'submissions/user_(\d+)/activity_(\d+)/')
+BYTE_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def media_name(path):
+    #The name of the file at a MEDIA_URL path, None for a path which isn't already normalized
+    name = posixpath.normpath(path)
+    if name != path or name.startswith('/') or any(part in ('', '.', '..') for part in name.split('/')):
+        return None
+    return name
+
+def is_public(name):
+    return media_name(name) is not None and name.startswith(PUBLIC_PREFIXES)
+
+def can_read_course(user, course_ids):
+    return (Course.objects.filter(pk__in=course_ids, teacher=user).exists()
+            or Enrollments.objects.filter(course_id__in=course_ids, student=user, blocked=False).exists())
+
+def can_read_blob(user, digest):
+    #Rows referring to the blob or a file derived from it, by a range of the file name index:
+    #blobs/3f/3f9a... <= name < blobs/3f/3f9a.../ matches exactly the names starting with blobs/3f/3f9a....
+    start = f'{BLOB_DIR}/{digest[:2]}/{digest}.'
+    end = start[:-1] + '/'
+    course_ids = set(CourseActivityMaterial.objects.filter(
+        Q(file__gte=start, file__lt=end) | Q(image__gte=start, image__lt=end)
+    ).values_list('course_activity__course_id', flat=True))
+    if course_ids and can_read_course(user, course_ids):
+        return True
+    return Submission.objects.filter(file__gte=start, file__lt=end).filter(Q(student=user) | Q(course_activity__course__teacher=user)).exists()
+
+def can_access(user, name):
+    if media_name(name) is None:
+        return False
+    if is_public(name):
+        return True
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    if match := COURSE_FILE.match(name) or MATERIAL_IMAGE.match(name):
+        return can_read_course(user, [int(match.group(1))])
+    if match := SUBMISSION_FILE.match(name):
+        return int(match.group(1)) == user.pk or CourseActivity.objects.filter(pk=int(match.group(2)), course__teacher=user).exists()
+    if digest := digest_of(name):
+        return can_read_blob(user, digest)
+    return False
+
+def requested_range(request, etag, size):
+    #(first, last) byte of a single Range request, None for the whole file - no Range, a Range the server may ignore
+    #(several ranges, other units) or an If-Range of an older version
+    header = request.headers.get('Range')
+    if not header or request.method != 'GET':
+        return None
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        return None
+    match = BYTE_RANGE.fullmatch(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        #The last bytes of the file
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size:
+        raise RangeNotSatisfiable
+    if last < first:
+        return None
+    return first, last
+
+class FileRange:
+    #Reads length bytes of an open file from its current position. Keeps the file's descriptor for the servers sending it
+    #with sendfile() - gunicorn sends Content-Length bytes from the descriptor's position.
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+def serve(request, name):
+    if media_name(name) is None:
+        raise Http404('File not found')
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        file_stat = os.stat(path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File not found')
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404('File not found')
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_DELIVERY == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_LOCATION + quote(name)
+    elif settings.MEDIA_DELIVERY == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+    else:
+        response = serve_file(request, path, file_stat, content_type)
+    cache_headers(response, name)
+    return response
+
+def serve_file(request, path, file_stat, content_type):
+    size = file_stat.st_size
+    etag = f'"{file_stat.st_mtime_ns:x}-{size:x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(file_stat.st_mtime))
+    if response is not None:
+        #304 Not Modified or 412 Precondition Failed
+        return response
+
+    try:
+        byte_range = requested_range(request, etag, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range:
+        first, last = byte_range
+        file.seek(first)
+        response = FileResponse(FileRange(file, last - first + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = last - first + 1
+    else:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    return response
+
+def cache_headers(response, name):
+    #Only the browser may keep a file, revalidated on every use as the reader may lose access to it. Blobs never change.
+    if digest_of(name):
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
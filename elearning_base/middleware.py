@@ -0,0 +1,117 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from .db_router import STICKY_COOKIE
+
+#Per-request performance instrumentation.
+#ServerTimingMiddleware measures a sample of the requests (SERVER_TIMING_SAMPLE_RATE) - total time, number and time of the SQL
+#queries, and the time spent serializing, rendering templates and in the service layer. The breakdown is sent back in a
+#Server-Timing header (shown in the browser dev tools network tab) and logged as a JSON line.
+#Unsampled requests only pay for a random() call, and the timed() blocks below only do a context variable lookup.
+
+logger = logging.getLogger(__name__)
+
+#Timings of the request being measured, None when the current request is not sampled
+current_timings = ContextVar('current_timings', default=None)
+
+class RequestTimings:
+    def __init__(self):
+        self.durations = {}
+        self.active = set()
+        self.queries = 0
+        self.sql_ms = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_ms += (time.perf_counter() - start) * 1000
+
+    def metrics(self, total_ms):
+        metrics = {'total': total_ms, 'db': self.sql_ms}
+        metrics.update(self.durations)
+        return metrics
+
+    def header(self, total_ms):
+        parts = [f'{name};dur={duration:.1f}' for name, duration in self.metrics(total_ms).items()]
+        parts[1] += f';desc="{self.queries} queries"'
+        return ', '.join(parts)
+
+@contextmanager
+def timed(name):
+    #Adds the time spent in the block to the named metric of the current request. Only the outermost block of a metric is
+    #counted, so nested calls (a nested serializer, an included template, a service calling another) are not counted twice.
+    #Can be used as a decorator as well.
+    timings = current_timings.get()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.active.discard(name)
+        timings.durations[name] = timings.durations.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+def install_instrumentation():
+    #Times serializer output/validation and template rendering, called once from the app config.
+    #The DRF base serializer and the django template backend are wrapped as neither has a hook to time them otherwise.
+    from rest_framework.serializers import BaseSerializer
+    from django.template.backends.django import Template
+
+    if getattr(BaseSerializer, '_timed', False):
+        return
+    BaseSerializer.data = property(timed('serializer')(BaseSerializer.data.fget))
+    BaseSerializer.is_valid = timed('serializer')(BaseSerializer.is_valid)
+    BaseSerializer._timed = True
+    Template.render = timed('template')(Template.render)
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.record_query))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        response['Server-Timing'] = timings.header(total_ms)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.queries,
+            **{f'{name}_ms': round(duration, 2) for name, duration in timings.metrics(total_ms).items()},
+        }))
+        return response
+
+#Marks a client which wrote something (a POST/PATCH/PUT/DELETE request) with a short lived cookie, its reads stay on the
+#primary database until the replica has caught up (db_router.py)
+class PrimaryAfterWriteMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.DATABASE_REPLICA and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# FTS5 full-text search index over courses and users, used by elearning_base/search.py.
+# Only created on SQLite - other backends fall back to icontains lookups.
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS elearning_base_course_fts USING fts5(course_title, description, prefix='2 3')")
+    schema_editor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS elearning_base_userprofile_fts USING fts5(username, first_name, last_name, is_teacher UNINDEXED, prefix='2 3')")
+    schema_editor.execute("INSERT INTO elearning_base_course_fts (rowid, course_title, description) SELECT course_id, course_title, description FROM elearning_base_course")
+    schema_editor.execute("INSERT INTO elearning_base_userprofile_fts (rowid, username, first_name, last_name, is_teacher) SELECT user_id, username, first_name, last_name, is_teacher FROM elearning_base_userprofile")
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS elearning_base_course_fts")
+    schema_editor.execute("DROP TABLE IF EXISTS elearning_base_userprofile_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0009_lobbymessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0010_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lobbymessage',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0011_lobbymessage_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lobbymessage',
+            index=models.Index(fields=['created_at'], name='elearning_b_created_be1682_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:18
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Unread notification counts of the existing users, afterwards maintained by elearning_base/notification_counts.py
+
+def count_unread_notifications(apps, schema_editor):
+    UserProfile = apps.get_model('elearning_base', 'UserProfile')
+    Notification = apps.get_model('elearning_base', 'Notification')
+    unread = Notification.objects.filter(recipient=OuterRef('pk'), read=False).values('recipient').annotate(count=Count('pk')).values('count')
+    UserProfile.objects.update(unread_notifications=Coalesce(Subquery(unread), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0012_lobbymessage_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='unread_notifications',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
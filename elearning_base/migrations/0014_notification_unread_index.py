@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0013_userprofile_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient', 'created_at'], name='notification_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0014_notification_unread_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['teacher', 'created_at'], name='elearning_b_teacher_430ac3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseactivity',
+            index=models.Index(fields=['course', 'created_at'], name='elearning_b_course__040389_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollments',
+            index=models.Index(fields=['course', 'enrolled_at'], name='elearning_b_course__3c3ff0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollments',
+            index=models.Index(fields=['student', 'enrolled_at'], name='elearning_b_student_8edf3b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['course', 'created_at'], name='elearning_b_course__010fa9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statusupdate',
+            index=models.Index(fields=['user', 'created_at'], name='elearning_b_user_id_7500ca_idx'),
+        ),
+    ]
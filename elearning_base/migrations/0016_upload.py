@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0015_composite_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(choices=[('MATERIAL', 'Material'), ('SUBMISSION', 'Submission')], max_length=15)),
+                ('name', models.CharField(editable=False, max_length=255)),
+                ('size', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0, editable=False)),
+                ('checksum', models.CharField(max_length=64)),
+                ('material_title', models.CharField(blank=True, max_length=100)),
+                ('description', models.TextField(blank=True, max_length=1000)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course_activity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='elearning_base.courseactivity')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated_at'], name='elearning_b_updated_9093f0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:06
+
+import elearning_base.models
+import elearning_base.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0016_upload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courseactivitymaterial',
+            name='file',
+            field=models.FileField(blank=True, storage=elearning_base.storage.blob_storage, upload_to=elearning_base.models.activity_material_file_directory_path),
+        ),
+        migrations.AlterField(
+            model_name='courseactivitymaterial',
+            name='image',
+            field=models.ImageField(blank=True, storage=elearning_base.storage.blob_storage, upload_to=elearning_base.models.activity_material_image_directory_path),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='file',
+            field=models.FileField(storage=elearning_base.storage.blob_storage, upload_to=elearning_base.models.submission_directory_path),
+        ),
+    ]
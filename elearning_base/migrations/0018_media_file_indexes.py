@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0017_blob_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courseactivitymaterial',
+            index=models.Index(fields=['file'], name='elearning_b_file_e4be86_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseactivitymaterial',
+            index=models.Index(fields=['image'], name='elearning_b_image_b78f36_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submission',
+            index=models.Index(fields=['file'], name='elearning_b_file_e99e3f_idx'),
+        ),
+    ]
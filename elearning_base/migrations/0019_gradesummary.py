@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elearning_base', '0018_media_file_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeSummary',
+            fields=[
+                ('summary_id', models.AutoField(primary_key=True, serialize=False)),
+                ('submissions', models.PositiveIntegerField(default=0)),
+                ('graded', models.PositiveIntegerField(default=0)),
+                ('grade_total', models.DecimalField(decimal_places=0, default=0, max_digits=12)),
+                ('grade_min', models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True)),
+                ('grade_max', models.DecimalField(blank=True, decimal_places=0, max_digits=5, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='grade_summaries', to='elearning_base.course')),
+                ('course_activity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grade_summaries', to='elearning_base.courseactivity')),
+                ('student', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grade_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='gradesummary',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('course_activity__isnull', False), ('student__isnull', True)), models.Q(('course_activity__isnull', True), ('student__isnull', False)), _connector='OR'), name='grade_summary_activity_or_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='gradesummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('course_activity__isnull', False)), fields=('course_activity',), name='grade_summary_activity_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='gradesummary',
+            constraint=models.UniqueConstraint(condition=models.Q(('student__isnull', False)), fields=('course', 'student'), name='grade_summary_student_unique'),
+        ),
+    ]
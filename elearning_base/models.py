@@ -1,9 +1,11 @@
+import uuid
 from django.db import models
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from datetime import datetime, timedelta
 from django.utils import timezone
+from .storage import blob_storage
 
 
 # These are custom directory paths for the files and images uploaded to the model fields.
@@ -30,6 +32,11 @@ class UserProfile(AbstractUser):
     is_teacher = models.BooleanField(default=False, null=False, blank=False)
     date_of_birth = models.DateField(blank=True, null=True)
     profile_img = models.ImageField(upload_to=user_img_directory_path, blank=True)
+    #Denormalized count of the user's unread notifications, maintained by notification_counts.py, so the badge can be
+    #rendered from the request user without querying the notifications. Only written with UPDATEs of F() expressions - the
+    #users saved by the profile updates and the admin are loaded with it deferred, so a count changed since is never
+    #written back.
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Username: {self.username}\nIs Teacher? {self.is_teacher}"
@@ -60,6 +67,10 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        #A teacher's courses newest first (get_courses_taught) without a sort, see tests/query_plan_tests.py
+        indexes = [models.Index(fields=['teacher', 'created_at'])]
+
     def __str__(self):
         return f"{self.course_title}"
     
@@ -107,6 +118,8 @@ class Enrollments(models.Model):
     
     class Meta:
         unique_together = ('course', 'student')
+        #A course's students and a student's courses by enrollment date (get_enrolled_students, get_enrolled_courses)
+        indexes = [models.Index(fields=['course', 'enrolled_at']), models.Index(fields=['student', 'enrolled_at'])]
 
 class CourseActivity(models.Model):
     LECTURE = 'LECTURE'
@@ -133,6 +146,8 @@ class CourseActivity(models.Model):
     
     class Meta:
         unique_together = ('activity_title', 'course')
+        #A course's activities newest first (get_course_activities_with_materials)
+        indexes = [models.Index(fields=['course', 'created_at'])]
     
     def clean(self):
         if self.deadline and self.deadline <= timezone.make_aware(datetime.now()):
@@ -152,9 +167,13 @@ class CourseActivityMaterial(models.Model):
     course_activity = models.ForeignKey(CourseActivity, on_delete=models.CASCADE, related_name='activity_materials')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    file = models.FileField(upload_to=activity_material_file_directory_path, blank=True)
+    file = models.FileField(upload_to=activity_material_file_directory_path, storage=blob_storage, blank=True)
     video_link = models.URLField(blank=True)
-    image = models.ImageField(upload_to=activity_material_image_directory_path, blank=True)
+    image = models.ImageField(upload_to=activity_material_image_directory_path, storage=blob_storage, blank=True)
+
+    class Meta:
+        #The materials of a content-addressed file, checked by the protected media view (media.py)
+        indexes = [models.Index(fields=['file']), models.Index(fields=['image'])]
 
     def __str__(self):
         return f"{self.course_activity}\nMaterial Title: {self.material_title}"
@@ -164,9 +183,13 @@ class Submission(models.Model):
     student = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='submissions')
     course_activity = models.ForeignKey(CourseActivity, on_delete=models.CASCADE, related_name='submissions')
     submitted_at = models.DateTimeField(auto_now_add=True)
-    file = models.FileField(upload_to=submission_directory_path, blank=False, null=False)
+    file = models.FileField(upload_to=submission_directory_path, storage=blob_storage, blank=False, null=False)
     grade = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True)
 
+    class Meta:
+        #The submissions of a content-addressed file, checked by the protected media view (media.py)
+        indexes = [models.Index(fields=['file'])]
+
     def __str__(self):
         return f"{self.student}\n{self.course_activity}"
     
@@ -182,12 +205,45 @@ class Submission(models.Model):
             elif self.grade > 100:
                 raise ValidationError("Grade cannot be greater than 100")
             
+#Grade statistics of a course's gradebook (gradebook.py), a row per activity and a row per student, kept up to date as
+#submissions are saved, graded and deleted so the gradebook is read without going through the submissions
+class GradeSummary(models.Model):
+    summary_id = models.AutoField(primary_key=True)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='grade_summaries')
+    course_activity = models.ForeignKey(CourseActivity, on_delete=models.CASCADE, null=True, blank=True, related_name='grade_summaries')
+    student = models.ForeignKey(UserProfile, on_delete=models.CASCADE, null=True, blank=True, related_name='grade_summaries')
+    submissions = models.PositiveIntegerField(default=0)
+    graded = models.PositiveIntegerField(default=0)
+    grade_total = models.DecimalField(max_digits=12, decimal_places=0, default=0)
+    grade_min = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True)
+    grade_max = models.DecimalField(max_digits=5, decimal_places=0, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        #Read by course (get_gradebook) through the course foreign key's index
+        constraints = [
+            models.CheckConstraint(check=models.Q(course_activity__isnull=False, student__isnull=True) | models.Q(course_activity__isnull=True, student__isnull=False), name='grade_summary_activity_or_student'),
+            models.UniqueConstraint(fields=['course_activity'], condition=models.Q(course_activity__isnull=False), name='grade_summary_activity_unique'),
+            models.UniqueConstraint(fields=['course', 'student'], condition=models.Q(student__isnull=False), name='grade_summary_student_unique'),
+        ]
+
+    @property
+    def grade_average(self):
+        return self.grade_total / self.graded if self.graded else None
+
+    def __str__(self):
+        return f"{self.course_activity or self.student}: {self.graded}/{self.submissions} graded"
+
 class StatusUpdate(models.Model):
     status_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='status_updates')
     status = models.TextField(max_length=1000, blank=False, null=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        #A user's status updates newest first (get_status_updates)
+        indexes = [models.Index(fields=['user', 'created_at'])]
+
     def __str__(self):
         return f"{self.status_id}"
     
@@ -198,6 +254,10 @@ class Feedback(models.Model):
     feedback = models.TextField(max_length=1000, blank=False, null=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        #A course's feedback newest first (get_course_feedback)
+        indexes = [models.Index(fields=['course', 'created_at'])]
+
     def __str__(self):
         return f"{self.feedback_id}"
     
@@ -213,6 +273,12 @@ class Notification(models.Model):
     read = models.BooleanField(default=False, null=False, blank=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        #A user's unread notifications newest first (get_notifications, mark_notifications_read) without a sort.
+        #Partial rather than on (recipient, read, created_at) - the ORM filters read=False as NOT "read" on SQLite, which
+        #can't use the read column of an index, but does match the index condition
+        indexes = [models.Index(fields=['recipient', 'created_at'], condition=models.Q(read=False), name='notification_unread_idx')]
+
     def __str__(self):
         return f"{self.notification_id}"
     
@@ -220,12 +286,51 @@ class LobbyMessage(models.Model):
     message_id = models.AutoField(primary_key=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='lobby_messages')
     message = models.TextField(max_length=1000, blank=False, null=False)
-    created_at = models.DateTimeField(auto_now_add=True)
+    #Set when the message is sent rather than when it is saved, lobby messages are written in batches (lobby_buffer.py)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        #History pagination and retention
+        indexes = [models.Index(fields=['created_at'])]
 
     def __str__(self):
         return f"{self.message_id}"
-    
-    
+
+#Resumable chunked upload of a material or submission file (uploads.py), its chunks are written straight to the file at
+#name, the final storage path. The material or submission is created once the whole file has been sent.
+class Upload(models.Model):
+    MATERIAL = 'MATERIAL'
+    SUBMISSION = 'SUBMISSION'
+
+    UPLOAD_TARGETS = [
+        (MATERIAL, 'Material'),
+        (SUBMISSION, 'Submission')
+    ]
+
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='uploads')
+    course_activity = models.ForeignKey(CourseActivity, on_delete=models.CASCADE, related_name='uploads')
+    target = models.CharField(max_length=15, choices=UPLOAD_TARGETS)
+    name = models.CharField(max_length=255, editable=False)
+    size = models.PositiveBigIntegerField()
+    #Bytes of the file written so far
+    offset = models.PositiveBigIntegerField(default=0, editable=False)
+    #SHA-256 of the whole file, hex
+    checksum = models.CharField(max_length=64)
+    #Of the material created from a MATERIAL upload
+    material_title = models.CharField(max_length=100, blank=True)
+    description = models.TextField(max_length=1000, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        #Expiry of the unfinished uploads (tasks.expire_uploads)
+        indexes = [models.Index(fields=['updated_at'])]
+
+    def __str__(self):
+        return f"{self.upload_id}"
+
+
 #Why overwrite model save function to automatically clean when saving?
 #Ensures model is always validated before saving to the database
 #Important as not always guaranteed that the model will be validated before saving
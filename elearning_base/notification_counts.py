@@ -0,0 +1,60 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Notification, UserProfile
+from .pagination import decode_cursor
+
+#Maintenance of the denormalized unread notification counts (UserProfile.unread_notifications).
+#The counts are changed with atomic UPDATEs where notifications are created (tasks.py) and marked read/unread
+#(api.update_notification_read, mark_read), in the same transaction as the notification rows.
+#Connected clients are sent the new count as an unread.count event through their NotificationConsumer, which also counts
+#the course broadcast notifications itself (a single group_send to the course, see tasks.fan_out_course_notification).
+#recount rebuilds the counts from the notifications, after bulk inserts or deletes which bypass the above.
+
+#Users updated per UPDATE statement, keeps the id list under SQLite's parameter limit
+UPDATE_CHUNK_SIZE = 500
+
+def add_unread(user_ids, delta=1):
+    #Never below 0, should a count have drifted
+    user_ids = list(user_ids)
+    for i in range(0, len(user_ids), UPDATE_CHUNK_SIZE):
+        UserProfile.objects.filter(pk__in=user_ids[i:i + UPDATE_CHUNK_SIZE]).update(unread_notifications=Greatest(F('unread_notifications') + delta, Value(0)))
+
+def push_unread_count(user_id):
+    count = UserProfile.objects.values_list('unread_notifications', flat=True).get(pk=user_id)
+    async_to_sync(get_channel_layer().group_send)(
+        f"user_notifications_{user_id}",
+        {
+            "type": "unread.count",
+            "count": count
+        }
+    )
+    return count
+
+def recount(users=None):
+    #Recounts the given users (a UserProfile queryset), or everyone
+    unread = Notification.objects.filter(recipient=OuterRef('pk'), read=False).values('recipient').annotate(count=Count('pk')).values('count')
+    users = UserProfile.objects.all() if users is None else users
+    return users.update(unread_notifications=Coalesce(Subquery(unread), Value(0)))
+
+def mark_read(user, notification_ids=None, up_to=None):
+    #Marks the user's given notifications, the ones up to and including the up_to cursor position (pagination.py), or all
+    #of them read with a single UPDATE - ids of other users' notifications are ignored. Returns the number marked read.
+    notifications = Notification.objects.filter(recipient=user, read=False)
+    if up_to is not None:
+        value, pk, _ = decode_cursor(up_to)
+        notifications = notifications.filter(Q(created_at__lt=value) | Q(created_at=value, pk__lte=pk))
+    with transaction.atomic():
+        if notification_ids is None:
+            updated = notifications.update(read=True)
+        else:
+            notification_ids = list(notification_ids)
+            updated = sum(
+                notifications.filter(pk__in=notification_ids[i:i + UPDATE_CHUNK_SIZE]).update(read=True)
+                for i in range(0, len(notification_ids), UPDATE_CHUNK_SIZE)
+            )
+        if updated:
+            add_unread([user.pk], -updated)
+    return updated
@@ -0,0 +1,62 @@
+import json
+from datetime import timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from .models import Notification
+
+#Retention of the notifications - read notifications older than the given number of days are deleted, optionally appended
+#to a JSON lines archive file first. Unread notifications are always kept, so the unread counts (notification_counts.py)
+#are not affected.
+#Deleted in batches of ascending ids, each its own short transaction, so the notification writes of the tasks and endpoints
+#are not held up behind SQLite's writer lock for the whole purge. The delete repeats the filter of the select: a
+#notification marked unread again in between (api.update_notification_read, which counts it again) is kept, and only the
+#rows deleted are archived.
+#Used by the purge_notifications task (run daily by celery beat) and the purge_notifications management command.
+
+ARCHIVE_FIELDS = ['notification_id', 'recipient_id', 'title', 'message', 'read', 'created_at']
+
+def table_size():
+    #Rows and bytes (pages of the table and its indexes) of the notifications table, bytes is only known on SQLite
+    table = Notification._meta.db_table
+    size = {'rows': Notification.objects.count(), 'bytes': None}
+    if connection.vendor != 'sqlite':
+        return size
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)", [table])
+            size['bytes'] = cursor.fetchone()[0]
+    except OperationalError:
+        #SQLite built without dbstat
+        pass
+    return size
+
+def purge_read_notifications(days, batch_size, archive=None):
+    #archive is an open text file the deleted notifications are written to, one JSON object per line
+    cutoff = timezone.now() - timedelta(days=days)
+    before = table_size()
+    notifications = Notification.objects.filter(read=True, created_at__lt=cutoff).order_by('pk')
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            #Locked until the delete where the database supports it
+            batch = list(notifications.filter(pk__gt=last_pk).select_for_update().values(*ARCHIVE_FIELDS)[:batch_size])
+            if not batch:
+                break
+            ids = [row['notification_id'] for row in batch]
+            count = notifications.filter(pk__in=ids).delete()[0]
+            if count < len(batch):
+                kept = set(Notification.objects.filter(pk__in=ids).values_list('pk', flat=True))
+                batch = [row for row in batch if row['notification_id'] not in kept]
+            if archive is not None:
+                archive.writelines(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in batch)
+                archive.flush()
+        last_pk = ids[-1]
+        deleted += count
+    return {'cutoff': cutoff, 'deleted': deleted, 'before': before, 'after': table_size()}
+
+def vacuum():
+    #Deleted rows only free pages within the database file, VACUUM rebuilds the file without them (locks the database)
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM')
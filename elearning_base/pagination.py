@@ -0,0 +1,83 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from django.db.models import Q
+from django.http import JsonResponse
+
+#Keyset (cursor) pagination for the list endpoints and views, newest first.
+#Rather than OFFSET paging (or fetching everything and paginating in python), a page is fetched with a range filter on
+#(created timestamp, primary key) starting from the last row of the previous page, so the cost of a page does not depend
+#on how far into the list it is. The cursor passed between requests is an opaque base64 encoding of that position.
+#The API endpoints keep returning a plain JSON list, links to the next/previous pages are sent in the Link header.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+CursorPage = namedtuple('CursorPage', ['items', 'next_cursor', 'previous_cursor'])
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(obj, field, backwards=False):
+    return encode_position(getattr(obj, field), obj.pk, backwards)
+
+def encode_position(value, pk, backwards=False):
+    position = [value.isoformat(), pk, 'prev' if backwards else 'next']
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor):
+    #Malformed cursors raise ValueError/TypeError subclasses at some step (base64, unicode, json, unpacking, isoformat)
+    try:
+        value, pk, direction = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(value), int(pk), direction == 'prev'
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+
+def parse_page_size(value):
+    try:
+        return min(MAX_PAGE_SIZE, max(1, int(value)))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+def paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, field='created_at'):
+    backwards = False
+    if cursor:
+        value, pk, backwards = decode_cursor(cursor)
+        if backwards:
+            #Previous page - the rows just newer than the cursor, fetched oldest first and flipped back below
+            queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})).order_by(field, 'pk')
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})).order_by(f'-{field}', '-pk')
+    else:
+        queryset = queryset.order_by(f'-{field}', '-pk')
+
+    #One extra row tells whether there is another page in the direction of travel
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        next_cursor = encode_cursor(rows[-1], field) if rows else None
+        previous_cursor = encode_cursor(rows[0], field, backwards=True) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1], field) if has_more else None
+        previous_cursor = encode_cursor(rows[0], field, backwards=True) if cursor and rows else None
+    return CursorPage(rows, next_cursor, previous_cursor)
+
+#Helpers for the API endpoints
+def pagination_params(request):
+    return {'cursor': request.GET.get('cursor'), 'page_size': parse_page_size(request.GET.get('page_size'))}
+
+def paginated_response(request, page, path=None):
+    #The links point to path, the requested endpoint by default
+    response = JsonResponse(page.items, safe=False, status=200)
+    links = []
+    for rel, cursor in (('next', page.next_cursor), ('prev', page.previous_cursor)):
+        if cursor:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            links.append(f'<{request.build_absolute_uri(path or request.path)}?{params.urlencode()}>; rel="{rel}"')
+    if links:
+        response['Link'] = ', '.join(links)
+    return response
@@ -0,0 +1,130 @@
+import re
+from django.db import connection, connections, router
+from .models import Course, UserProfile
+
+#Full-text search over course titles/descriptions and user names.
+#On SQLite the search uses FTS5 virtual tables (created in migration 0010), ranked by bm25 relevance, with prefix matching on
+#every search term. The index is kept up to date by the post_save/post_delete signals in signals.py and can be rebuilt in full
+#with the rebuild_search_index management command (required after bulk inserts, which do not fire signals).
+#On other database backends the search falls back to case-insensitive containment on the course title and username.
+
+COURSE_FTS_TABLE = 'elearning_base_course_fts'
+USER_FTS_TABLE = 'elearning_base_userprofile_fts'
+
+SEARCH_PAGE_SIZE = 10
+#Results are capped per category, a broad query only ever returns the most relevant SEARCH_MAX_RESULTS of each
+SEARCH_MAX_RESULTS = 50
+
+#bm25 column weights - a match in the title/username ranks above one in the description/names
+COURSE_WEIGHTS = (10.0, 1.0)
+USER_WEIGHTS = (10.0, 2.0, 2.0)
+
+#The user columns of the index, a save updating none of them (a login's last_login) leaves the index as it is
+USER_INDEXED_FIELDS = ('username', 'first_name', 'last_name', 'is_teacher')
+
+def fts_enabled():
+    return connection.vendor == 'sqlite'
+
+def rebuild_index(using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {COURSE_FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {COURSE_FTS_TABLE} (rowid, course_title, description) SELECT course_id, course_title, description FROM {Course._meta.db_table}")
+        cursor.execute(f"DELETE FROM {USER_FTS_TABLE}")
+        cursor.execute(f"INSERT INTO {USER_FTS_TABLE} (rowid, username, first_name, last_name, is_teacher) SELECT user_id, username, first_name, last_name, is_teacher FROM {UserProfile._meta.db_table}")
+
+#Index maintenance, called from the signals
+def index_course(course):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {COURSE_FTS_TABLE} WHERE rowid = %s", [course.course_id])
+        cursor.execute(f"INSERT INTO {COURSE_FTS_TABLE} (rowid, course_title, description) VALUES (%s, %s, %s)", [course.course_id, course.course_title, course.description])
+
+def unindex_course(course):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {COURSE_FTS_TABLE} WHERE rowid = %s", [course.course_id])
+
+def index_user(user):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {USER_FTS_TABLE} WHERE rowid = %s", [user.user_id])
+        cursor.execute(f"INSERT INTO {USER_FTS_TABLE} (rowid, username, first_name, last_name, is_teacher) VALUES (%s, %s, %s, %s, %s)", [user.user_id, user.username, user.first_name, user.last_name, user.is_teacher])
+
+def unindex_user(user):
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {USER_FTS_TABLE} WHERE rowid = %s", [user.user_id])
+
+#Querying
+def build_match_expression(search_query):
+    #Every word of the query must match (implicit AND), as a prefix so partially typed words still find results.
+    #Words are quoted so FTS5 operators/syntax in user input are matched literally.
+    terms = re.findall(r'\w+', search_query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def parse_page(value):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return 1
+
+def page_bounds(page, page_size=SEARCH_PAGE_SIZE, max_results=SEARCH_MAX_RESULTS):
+    #Returns the offset and the number of rows to fetch (one extra row to know whether there is a next page)
+    offset = (page - 1) * page_size
+    limit = max(0, min(page_size + 1, max_results - offset))
+    return offset, limit
+
+def search_course_ids(search_query, page=1):
+    offset, limit = page_bounds(page)
+    if not limit:
+        return [], False
+    if not fts_enabled():
+        ids = list(Course.objects.filter(course_title__icontains=search_query).order_by('course_title').values_list('course_id', flat=True)[offset:offset + limit])
+    else:
+        match = build_match_expression(search_query)
+        if not match:
+            return [], False
+        #The database the ranked rows are loaded from (db_router.py)
+        with connections[router.db_for_read(Course)].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {COURSE_FTS_TABLE} WHERE {COURSE_FTS_TABLE} MATCH %s "
+                f"ORDER BY bm25({COURSE_FTS_TABLE}, %s, %s), rowid LIMIT %s OFFSET %s",
+                [match, *COURSE_WEIGHTS, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    return ids[:SEARCH_PAGE_SIZE], len(ids) > SEARCH_PAGE_SIZE
+
+def search_user_ids(search_query, is_teacher, page=1):
+    offset, limit = page_bounds(page)
+    if not limit:
+        return [], False
+    if not fts_enabled():
+        ids = list(UserProfile.objects.filter(username__icontains=search_query, is_teacher=is_teacher).order_by('username').values_list('user_id', flat=True)[offset:offset + limit])
+    else:
+        match = build_match_expression(search_query)
+        if not match:
+            return [], False
+        with connections[router.db_for_read(UserProfile)].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {USER_FTS_TABLE} WHERE {USER_FTS_TABLE} MATCH %s AND is_teacher = %s "
+                f"ORDER BY bm25({USER_FTS_TABLE}, %s, %s, %s, 0.0), rowid LIMIT %s OFFSET %s",
+                [match, is_teacher, *USER_WEIGHTS, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+    return ids[:SEARCH_PAGE_SIZE], len(ids) > SEARCH_PAGE_SIZE
+
+def in_ranked_order(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+def search_courses(search_query, page=1):
+    ids, has_next = search_course_ids(search_query, page)
+    return in_ranked_order(Course.objects.select_related('teacher'), ids), has_next
+
+def search_users(search_query, is_teacher, page=1):
+    ids, has_next = search_user_ids(search_query, is_teacher, page)
+    return in_ranked_order(UserProfile.objects.all(), ids), has_next
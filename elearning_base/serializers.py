@@ -1,6 +1,10 @@
+import re
 from rest_framework import serializers
 from .models import *
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
+from .image_derivatives import derivative_url, has_derivatives
+from . import uploads
 
 #Serializers here are used to convert complex data types such as querysets and model instances to native Python datatypes that can be rendered into JSON.
 #Some serializers are handling the creation of new objects (Create would be in the serializer name), to validate the data and create the object.
@@ -27,10 +31,33 @@ class UserProfileCreateSerializer(serializers.ModelSerializer):
         user = UserProfile.objects.create_user(**validated_data)
         return user
 
+#URL of a resized copy of an image field (image_derivatives.py), the original's until the copy has been made
+class ImageDerivativeField(serializers.ReadOnlyField):
+    def __init__(self, derivative, webp=False, **kwargs):
+        self.derivative = derivative
+        self.webp = webp
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        #The image's four URL fields share one has_derivatives() stat per serialization
+        key = ('image_derivatives', value.name)
+        if key not in self.context:
+            self.context[key] = has_derivatives(value)
+        url = derivative_url(value, self.derivative, self.webp, self.context[key])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
 class UserProfileSerializer(serializers.HyperlinkedModelSerializer):
+    thumbnail_url = ImageDerivativeField('thumbnail', source='profile_img')
+    thumbnail_webp_url = ImageDerivativeField('thumbnail', webp=True, source='profile_img')
+    medium_url = ImageDerivativeField('medium', source='profile_img')
+    medium_webp_url = ImageDerivativeField('medium', webp=True, source='profile_img')
+
     class Meta:
         model = UserProfile
-        fields = ['url', 'username', 'first_name', 'last_name', 'is_teacher', 'profile_img', 'email', 'date_of_birth', 'bio']
+        fields = ['url', 'username', 'first_name', 'last_name', 'is_teacher', 'profile_img', 'thumbnail_url', 'thumbnail_webp_url', 'medium_url', 'medium_webp_url', 'email', 'date_of_birth', 'bio']
         extra_kwargs = {
             'url': {'view_name': 'user_profile', 'lookup_field': 'user_id'}
         }
@@ -59,10 +86,14 @@ class StatusUpdateSerializer(serializers.ModelSerializer):
 
 class CourseSerializer(serializers.HyperlinkedModelSerializer):
     teacher = UserProfileSerializer(read_only=True)
+    thumbnail_url = ImageDerivativeField('thumbnail', source='course_img')
+    thumbnail_webp_url = ImageDerivativeField('thumbnail', webp=True, source='course_img')
+    medium_url = ImageDerivativeField('medium', source='course_img')
+    medium_webp_url = ImageDerivativeField('medium', webp=True, source='course_img')
 
     class Meta:
         model = Course
-        fields = ['url', 'course_id', 'course_title', 'course_img', 'description', 'teacher', 'created_at', 'updated_at']
+        fields = ['url', 'course_id', 'course_title', 'course_img', 'thumbnail_url', 'thumbnail_webp_url', 'medium_url', 'medium_webp_url', 'description', 'teacher', 'created_at', 'updated_at']
         extra_kwargs = {
             'url': {'view_name': 'course_page', 'lookup_field': 'course_id'}
         }
@@ -162,9 +193,14 @@ class FeedbackSerializer(serializers.ModelSerializer):
         return Feedback.objects.create(student=student, course=course, **validated_data)
     
 class CourseActivityMaterialSerializer(serializers.ModelSerializer):
+    thumbnail_url = ImageDerivativeField('thumbnail', source='image')
+    thumbnail_webp_url = ImageDerivativeField('thumbnail', webp=True, source='image')
+    medium_url = ImageDerivativeField('medium', source='image')
+    medium_webp_url = ImageDerivativeField('medium', webp=True, source='image')
+
     class Meta:
         model = CourseActivityMaterial
-        fields = ['material_id', 'material_title', 'description', 'course_activity', 'created_at', 'updated_at', 'file', 'video_link', 'image']
+        fields = ['material_id', 'material_title', 'description', 'course_activity', 'created_at', 'updated_at', 'file', 'video_link', 'image', 'thumbnail_url', 'thumbnail_webp_url', 'medium_url', 'medium_webp_url']
         read_only_fields = ('material_id', 'course_activity', 'created_at', 'updated_at')
     
     def validate(self, data):
@@ -252,9 +288,136 @@ class LobbyMessageSerializer(serializers.ModelSerializer):
         model = LobbyMessage
         fields = ['message_id', 'user', 'message', 'created_at']
 
+#Compact lobby message representation of the lobby history (lobby_history.py), only the sender details the lobby shows.
+#Doesn't need the request, the messages are serialized once when sent and served as is from the history ring buffer.
+class LobbyUserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UserProfile
+        fields = ['user_id', 'username', 'is_teacher']
+
+class LobbyHistorySerializer(serializers.ModelSerializer):
+    user = LobbyUserSerializer(read_only=True)
+
+    class Meta:
+        model = LobbyMessage
+        #message_id is None for a message still in the lobby buffer, not written yet
+        fields = ['message_id', 'user', 'message', 'created_at']
+
+#Request and response of the bulk mark as read endpoint. Either notification ids or an up_to cursor, all notifications without.
+MAX_NOTIFICATION_IDS = 5000
+
+class NotificationsReadSerializer(serializers.Serializer):
+    notification_ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=MAX_NOTIFICATION_IDS)
+    up_to = serializers.CharField(required=False, help_text="Cursor (pagination Link header) of the newest notification to mark read, older ones are marked too")
+    updated = serializers.IntegerField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+
+    def validate(self, data):
+        if 'notification_ids' in data and 'up_to' in data:
+            raise serializers.ValidationError("Give either notification_ids or up_to, not both")
+        return data
+
+#Start of a resumable upload (uploads.py), a material file for the activity's teacher or a submission for its enrolled students
+class UploadSerializer(serializers.ModelSerializer):
+    filename = serializers.CharField(write_only=True, max_length=100)
+
+    class Meta:
+        model = Upload
+        fields = ['upload_id', 'target', 'course_activity', 'filename', 'name', 'size', 'offset', 'checksum', 'material_title', 'description', 'created_at', 'updated_at']
+        read_only_fields = ('upload_id', 'name', 'offset', 'created_at', 'updated_at')
+
+    def validate_size(self, value):
+        if value == 0:
+            raise serializers.ValidationError("File cannot be empty.")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"File cannot be larger than {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def validate_checksum(self, value):
+        if not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError("Checksum must be the SHA-256 of the file, in hex.")
+        return value.lower()
+
+    def validate(self, data):
+        user = self.context['request'].user
+        course_activity = data['course_activity']
+        if data['target'] == Upload.MATERIAL:
+            if course_activity.course.teacher_id != user.user_id:
+                raise serializers.ValidationError("Only the course's teacher can upload materials.")
+            if not data.get('material_title') or not data.get('description'):
+                raise serializers.ValidationError({"material_title": "Materials need a title and a description."})
+            if CourseActivityMaterial.objects.filter(course_activity=course_activity, material_title=data['material_title']).exists():
+                raise serializers.ValidationError({"material_title": "Material with this title already exists for this activity."})
+        else:
+            if not Enrollments.objects.filter(course_id=course_activity.course_id, student=user, blocked=False).exists():
+                raise serializers.ValidationError("Only students enrolled in the course can upload submissions.")
+            if course_activity.deadline and course_activity.deadline < timezone.now():
+                raise serializers.ValidationError("Deadline has passed. Cannot submit documents anymore.")
+        return data
+
+    def create(self, validated_data):
+        return uploads.start(self.context['request'].user, **validated_data)
+
+class SubmissionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Submission
+        fields = ['submission_id', 'student', 'course_activity', 'submitted_at', 'file', 'grade']
+        read_only_fields = ('submission_id', 'student', 'course_activity', 'submitted_at', 'file', 'grade')
+
+#Serializers structuring the Swagger documentation of the bulk grading endpoint (grading.py), its rows are parsed one at a time
+class GradeRowSerializer(serializers.Serializer):
+    submission_id = serializers.IntegerField(required=False)
+    student = serializers.CharField(required=False) # Username, their latest submission to the activity when no submission_id
+    grade = serializers.IntegerField(min_value=0, max_value=100, allow_null=True)
+
+class GradeErrorSerializer(serializers.Serializer):
+    row = serializers.IntegerField(read_only=True)
+    error = serializers.CharField(read_only=True)
+
+class GradeReportSerializer(serializers.Serializer):
+    rows = serializers.IntegerField(read_only=True)
+    updated = serializers.IntegerField(read_only=True)
+    error_count = serializers.IntegerField(read_only=True)
+    errors = GradeErrorSerializer(many=True, read_only=True)
+
+class EnrollmentImportErrorSerializer(serializers.Serializer):
+    username = serializers.CharField(read_only=True)
+    error = serializers.CharField(read_only=True)
+
+class EnrollmentImportReportSerializer(serializers.Serializer):
+    usernames = serializers.IntegerField(read_only=True)
+    enrolled = serializers.IntegerField(read_only=True)
+    already_enrolled = serializers.ListField(child=serializers.CharField(), read_only=True)
+    errors = EnrollmentImportErrorSerializer(many=True, read_only=True)
+
+class ActivityGradeSummarySerializer(serializers.ModelSerializer):
+    activity_title = serializers.CharField(source='course_activity.activity_title', read_only=True)
+    grade_average = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = GradeSummary
+        fields = ['course_activity', 'activity_title', 'submissions', 'graded', 'grade_average', 'grade_min', 'grade_max', 'updated_at']
+        read_only_fields = fields
+
+class StudentGradeSummarySerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='student.username', read_only=True)
+    grade_average = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = GradeSummary
+        fields = ['student', 'username', 'submissions', 'graded', 'grade_average', 'grade_min', 'grade_max', 'updated_at']
+        read_only_fields = fields
+
+#Wrapper serializer structuring the Swagger documentation of the gradebook endpoint
+class GradebookSerializer(serializers.Serializer):
+    activities = ActivityGradeSummarySerializer(many=True, read_only=True)
+    students = StudentGradeSummarySerializer(many=True, read_only=True)
+
 #Wrapper serializer to used for structuring the Swagger documentation of complex API endpoint - search results.
 class SearchResultSerializer(serializers.Serializer):
     courses = CourseSerializer(many=True, read_only=True)
     teachers = UserProfileSerializer(many=True, read_only=True)
     students = UserProfileSerializer(many=True, read_only=True, required=False) # Not required as it's not always included in the response depending on user
+    page = serializers.IntegerField(read_only=True)
+    has_next = serializers.DictField(child=serializers.BooleanField(), read_only=True) # Whether each category has a further page of results
 
@@ -0,0 +1,150 @@
+from .models import *
+from .serializers import *
+from . import search, activity_cache, lobby_history
+from .pagination import CursorPage, decode_cursor, paginate, DEFAULT_PAGE_SIZE
+from .middleware import timed
+
+#Service/query layer shared by the REST endpoints in api.py and the traditional views in views.py.
+#Functions here return plain python structures (serializer data) instead of http responses, so the traditional views
+#can build their template context directly rather than calling an api function, which runs the DRF dispatch stack,
+#renders a JsonResponse and then has to be json.loads'ed back into the same data.
+#Permission rules which both layers need to agree on also live here.
+
+#Number of messages shown when the lobby is opened
+LATEST_LOBBY_MESSAGES = 10
+
+#Permission helpers
+def can_view_user(viewer, user):
+    #Students can only view teachers and themselves, teachers can view everyone
+    return user.is_teacher or viewer.is_teacher or viewer == user
+
+def can_view_course_activities(viewer, course):
+    if viewer.is_teacher:
+        return True
+    return Enrollments.objects.filter(course=course, student=viewer, blocked=False).exists()
+
+#Querysets of the list data, with the related objects the nested serializers render loaded up front (joined with
+#select_related, or in one extra query with prefetch_related) so serializing a list takes a fixed number of queries
+def status_updates_queryset(user):
+    return StatusUpdate.objects.filter(user=user).select_related('user')
+
+def enrolled_courses_queryset(user):
+    return Enrollments.objects.filter(student=user).select_related('course__teacher', 'student')
+
+def courses_taught_queryset(user):
+    return Course.objects.filter(teacher=user).select_related('teacher')
+
+def course_activities_queryset(course):
+    return CourseActivity.objects.filter(course=course).prefetch_related('activity_materials')
+
+def course_feedback_queryset(course):
+    return Feedback.objects.filter(course=course).select_related('student', 'course__teacher')
+
+def enrolled_students_queryset(course):
+    return Enrollments.objects.filter(course=course).select_related('course__teacher', 'student')
+
+def gradebook_queryset(course):
+    #The course's GradeSummary rows (gradebook.py), read through the course index
+    return GradeSummary.objects.filter(course=course).select_related('course_activity', 'student')
+
+def notifications_queryset(user):
+    #Unread notifications only
+    return Notification.objects.filter(recipient=user, read=False).select_related('recipient')
+
+#Data getters - the request is only passed through to the serializer context to build the hyperlinked fields
+@timed('service')
+def get_user_data(request, user):
+    return UserProfileSerializer(user, context={'request': request}).data
+
+@timed('service')
+def get_search_results_data(request, search_query, page=1):
+    #Ranked full-text search (search.py), paginated and capped per category
+    courses, courses_has_next = search.search_courses(search_query, page)
+    teachers, teachers_has_next = search.search_users(search_query, is_teacher=True, page=page)
+
+    results = {
+        'courses': CourseSerializer(courses, many=True, context={'request': request}).data,
+        'teachers': UserProfileSerializer(teachers, many=True, context={'request': request}).data,
+        'page': page,
+        'has_next': {'courses': courses_has_next, 'teachers': teachers_has_next},
+    }
+    #Students are only included in the search results of teachers
+    if request.user.is_teacher:
+        students, students_has_next = search.search_users(search_query, is_teacher=False, page=page)
+        results['students'] = UserProfileSerializer(students, many=True, context={'request': request}).data
+        results['has_next']['students'] = students_has_next
+    return results
+
+@timed('service')
+def get_course_activities_data(request, course):
+    #Served from the per-course cache (activity_cache.py), callers check can_view_course_activities first.
+    #Serialized without the request, the cached urls are relative to any host
+    def build():
+        activities = course_activities_queryset(course).order_by('-created_at')
+        return CourseActivitySerializer(activities, many=True, context={'request': None}).data
+    return activity_cache.get_tree(request, course, build)
+
+@timed('service')
+def get_gradebook_data(request, course):
+    #Callers check the user is the course's teacher. Sorted here, the rows are read in the index's order.
+    activities, students = [], []
+    for summary in gradebook_queryset(course):
+        (activities if summary.course_activity_id else students).append(summary)
+    activities.sort(key=lambda summary: summary.course_activity.created_at)
+    students.sort(key=lambda summary: summary.student.username)
+    return {
+        'activities': ActivityGradeSummarySerializer(activities, many=True, context={'request': request}).data,
+        'students': StudentGradeSummarySerializer(students, many=True, context={'request': request}).data,
+    }
+
+@timed('service')
+def get_latest_lobby_messages_page(request):
+    #Served from the lobby history ring buffer (lobby_history.py), the next cursor continues with get_lobby_history_page
+    latest_messages = lobby_history.latest(LATEST_LOBBY_MESSAGES)
+    return CursorPage(latest_messages, lobby_history.history_cursor(latest_messages, LATEST_LOBBY_MESSAGES), None)
+
+#Paginated getters for the list endpoints and the paginated views, see pagination.py.
+#Each returns a CursorPage of serializer data, an invalid cursor raises pagination.InvalidCursor
+def serialize_page(request, page, serializer_class):
+    return page._replace(items=serializer_class(page.items, many=True, context={'request': request}).data)
+
+@timed('service')
+def get_status_updates_page(request, user, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(status_updates_queryset(user), cursor, page_size)
+    return serialize_page(request, page, StatusUpdateSerializer)
+
+@timed('service')
+def get_enrolled_courses_page(request, user, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(enrolled_courses_queryset(user), cursor, page_size, field='enrolled_at')
+    return serialize_page(request, page, EnrollmentsSerializer)
+
+@timed('service')
+def get_courses_taught_page(request, user, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(courses_taught_queryset(user), cursor, page_size)
+    return serialize_page(request, page, CourseSerializer)
+
+@timed('service')
+def get_course_feedback_page(request, course, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(course_feedback_queryset(course), cursor, page_size)
+    return serialize_page(request, page, FeedbackSerializer)
+
+@timed('service')
+def get_enrolled_students_page(request, course, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(enrolled_students_queryset(course), cursor, page_size, field='enrolled_at')
+    return serialize_page(request, page, EnrollmentsSerializer)
+
+@timed('service')
+def get_notifications_page(request, user, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    page = paginate(notifications_queryset(user), cursor, page_size)
+    return serialize_page(request, page, NotificationSerializer)
+
+@timed('service')
+def get_lobby_history_page(request, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    messages = LobbyMessage.objects.select_related('user')
+    position = decode_cursor(cursor) if cursor else None
+    if position and position[1] < 0 and not position[2]:
+        #Following lobby messages shown before they were written (lobby_history.history_cursor)
+        page = lobby_history.history_page(messages, position[0], -position[1], page_size)
+    else:
+        page = paginate(messages, cursor, page_size)
+    return serialize_page(request, page, LobbyHistorySerializer)
@@ -1,7 +1,12 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.db.backends.signals import connection_created
+from django.conf import settings
 from django.dispatch import receiver
-from .models import Enrollments, CourseActivity, CourseActivityMaterial, LobbyMessage
-from .tasks import send_enrollment_notification, send_new_material_notification, send_new_activity_notification
+from django.db import transaction
+from .models import Enrollments, CourseActivity, CourseActivityMaterial, LobbyMessage, Course, UserProfile, Submission
+from . import search, activity_cache, lobby_history, image_derivatives, gradebook
+from .lobby_buffer import CHAT_NOTIFICATIONS_GROUP, chat_notification_event
+from .tasks import send_enrollment_notification, send_new_material_notification, send_new_activity_notification, generate_image_derivatives
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
@@ -11,32 +16,118 @@ from asgiref.sync import async_to_sync
 def enrollment_notification(sender, instance, created, **kwargs):
     if created:
         send_enrollment_notification.delay(instance.enrollment_id)
+    else:
+        # Course notifications are broadcast to the whole course group and blocked students are filtered out by their
+        # notification consumer, so a connected student's consumer is told when the enrollment is blocked/unblocked
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            f"user_notifications_{instance.student_id}",
+            {
+                "type": "enrollment.status",
+                "course_id": instance.course_id,
+                "blocked": instance.blocked
+            }
+        )
 
 @receiver(post_save, sender=CourseActivityMaterial)
 def course_activity_material_notification(sender, instance, created, **kwargs):
     if created:
-        student_ids = Enrollments.objects.filter(course=instance.course_activity.course).values_list('student', flat=True)
-        for student_id in student_ids:
-            send_new_material_notification.delay(student_id, instance.course_activity.activity_id, instance.course_activity.course.course_id, instance.material_title)
+        #A single task fans the notification out to every student enrolled in the course
+        send_new_material_notification.delay(instance.material_id)
 
 @receiver(post_save, sender=CourseActivity)
 def course_activity_notification(sender, instance, created, **kwargs):
     if created:
-        student_ids = Enrollments.objects.filter(course=instance.course).values_list('student', flat=True)
-        for student_id in student_ids:
-            send_new_activity_notification.delay(student_id, instance.course.course_id, instance.activity_title)
+        send_new_activity_notification.delay(instance.activity_id)
 
-# Signal to notify all users in the public lobby about new messages, toggles the "NEW" indicator on left pane
+# Signal to notify all users in the public lobby about new messages, toggles the "NEW" indicator on left pane, and to add
+# the message to the lobby history (lobby_history.py)
+# Messages written in batches by the lobby buffer (bulk_create) don't send it, the buffer pings once per batch instead
+# and ChatConsumer adds them to the history when they are sent
 @receiver(post_save, sender=LobbyMessage)
 def lobby_message(sender, instance, created, **kwargs):
     if created:
+        lobby_history.push(instance)
         channel_layer = get_channel_layer()
-        chat_notifications_group_name = f"chat_notifications"
+        async_to_sync(channel_layer.group_send)(CHAT_NOTIFICATIONS_GROUP, chat_notification_event())
 
-        async_to_sync(channel_layer.group_send)(
-            chat_notifications_group_name,
-            {
-                "type": "chat.notification",
-                "message": "New message in the public lobby"
-            }
-        )
\ No newline at end of file
+# Signals keeping the full-text search index (search.py) in sync with courses and users
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    search.index_course(instance)
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    search.unindex_course(instance)
+
+@receiver(post_save, sender=UserProfile)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(search.USER_INDEXED_FIELDS):
+        return
+    search.index_user(instance)
+
+@receiver(post_delete, sender=UserProfile)
+def unindex_user(sender, instance, **kwargs):
+    search.unindex_user(instance)
+
+# Signals invalidating the cached activity tree (activity_cache.py) of the course an activity or material belongs to.
+# The tree is invalidated again once the transaction commits, a request reading the course before then would cache the
+# tree without the change
+def invalidate_course_activities(course_id):
+    activity_cache.invalidate(course_id)
+    transaction.on_commit(lambda: activity_cache.invalidate(course_id))
+
+@receiver([post_save, post_delete], sender=CourseActivity)
+def invalidate_activity_tree(sender, instance, **kwargs):
+    invalidate_course_activities(instance.course_id)
+
+@receiver([post_save, post_delete], sender=CourseActivityMaterial)
+def invalidate_material_tree(sender, instance, **kwargs):
+    try:
+        course_id = instance.course_activity.course_id
+    except CourseActivity.DoesNotExist:
+        # Deleted along with its activity, which invalidates the tree itself
+        return
+    invalidate_course_activities(course_id)
+
+# Signals queueing the resized copies of the uploaded images (image_derivatives.py), made by a task once the upload is
+# committed so the upload request doesn't wait for them. Saves which leave the image as it was queue nothing
+def queue_image_derivatives(instance, field_name, update_fields):
+    if update_fields is not None and field_name not in update_fields:
+        return
+    field_file = getattr(instance, field_name)
+    if not field_file or image_derivatives.has_derivatives(field_file):
+        return
+    model, pk, name = instance._meta.label_lower, instance.pk, field_file.name
+    transaction.on_commit(lambda: generate_image_derivatives.delay(model, pk, field_name, name))
+
+@receiver(post_save, sender=UserProfile)
+def profile_img_derivatives(sender, instance, update_fields, **kwargs):
+    queue_image_derivatives(instance, 'profile_img', update_fields)
+
+@receiver(post_save, sender=Course)
+def course_img_derivatives(sender, instance, update_fields, **kwargs):
+    queue_image_derivatives(instance, 'course_img', update_fields)
+
+@receiver(post_save, sender=CourseActivityMaterial)
+def material_image_derivatives(sender, instance, update_fields, **kwargs):
+    queue_image_derivatives(instance, 'image', update_fields)
+
+# Signals refreshing the gradebook rows (gradebook.py) of the activity and student of a submission once the transaction
+# commits. An activity deleted with its submissions takes its row with it, its students' rows are refreshed
+@receiver([post_save, post_delete], sender=Submission)
+def refresh_gradebook(sender, instance, **kwargs):
+    gradebook.queue_refresh(instance.course_activity_id, [instance.student_id])
+
+@receiver(post_delete, sender=CourseActivity)
+def refresh_gradebook_students(sender, instance, **kwargs):
+    gradebook.queue_refresh(course_id=instance.course_id)
+
+# Pragmas of the SQLite connections (SQLITE_PRAGMAS), set once per connection - kept open for CONN_MAX_AGE
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import Counter
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import LazyObject, empty
+
+#Content-addressed storage of the course files, material images and submissions (the course_files storage in STORAGES,
+#used when CONTENT_ADDRESSED_STORAGE is on). A file is hashed while it is written and stored once under its SHA-256
+#digest, whatever the activity, course or student it was uploaded for:
+#  course_files/course_1/activity_2/files/slides.pdf -> blobs/3f/3f9a...c1.pdf
+#The same slides uploaded to ten activities take the space of one. Files derived from a blob (the resized copies of
+#image_derivatives.py) keep the blob's digest in their names, blobs/3f/3f9a...c1.thumbnail.jpg, and are saved as named.
+#Blobs are never overwritten with different content, so they are served with a year long immutable Cache-Control (media.py).
+#Deleting a material or submission leaves its blob, blobs no row refers to any more are deleted by collect()
+#(tasks.collect_blobs) - the references to each digest are counted across BLOB_REFERENCES.
+
+BLOB_DIR = 'blobs'
+READ_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+#Model label -> file fields stored in the course_files storage
+BLOB_REFERENCES = {
+    'elearning_base.courseactivitymaterial': ['file', 'image'],
+    'elearning_base.submission': ['file'],
+}
+
+def digest_of(name):
+    #Digest of a blob or of a file derived from it, None for names outside BLOB_DIR
+    parts = name.split('/')
+    if len(parts) != 3 or parts[0] != BLOB_DIR:
+        return None
+    return parts[2].split('.')[0]
+
+def blob_name(digest, filename):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest}{os.path.splitext(filename)[1].lower()}"
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        #Saving content which is already stored isn't a clash, the name is chosen by _save
+        if digest_of(name):
+            return super().get_available_name(name, max_length)
+        return name
+
+    def _save(self, name, content):
+        if digest_of(name):
+            #A file derived from a blob
+            return super()._save(name, content)
+
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        #Written to a temporary file next to the blob directories while hashing, the digest (and so the name) is only
+        #known at the end
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+            try:
+                for chunk in content.chunks(READ_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        return self.adopt(f.name, digest.hexdigest(), name)
+
+    def adopt(self, path, digest, filename):
+        #Moves a local file of the given SHA-256 digest into the blobs, or deletes it if the blob is already stored.
+        #Returns the blob's name.
+        name = blob_name(digest, filename)
+        target = self.path(name)
+        if os.path.exists(target):
+            os.remove(path)
+            #Counts as new for collect(), the row referring to it again may not be committed yet
+            os.utime(target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.chmod(path, self.file_permissions_mode or 0o644)
+            file_move_safe(path, target, allow_overwrite=True)
+        return name
+
+class CourseFilesStorage(LazyObject):
+    #The course_files storage, looked up when first used (as default_storage is) so that the model fields follow STORAGES
+    def _setup(self):
+        self._wrapped = storages['course_files']
+
+course_files_storage = CourseFilesStorage()
+
+@receiver(setting_changed)
+def reset_course_files_storage(setting, **kwargs):
+    if setting == 'STORAGES':
+        course_files_storage._wrapped = empty
+
+def blob_storage():
+    #Storage of the model fields in BLOB_REFERENCES
+    return course_files_storage
+
+def is_content_addressed():
+    return isinstance(blob_storage(), ContentAddressedStorage)
+
+def reference_counts():
+    #Digest -> number of rows referring to it (or to a file derived from it)
+    counts = Counter()
+    for label, fields in BLOB_REFERENCES.items():
+        model = apps.get_model(label)
+        for field in fields:
+            names = model.objects.filter(**{f'{field}__startswith': f'{BLOB_DIR}/'}).values_list(field, flat=True)
+            counts.update(digest_of(name) for name in names.iterator())
+    return counts
+
+def blob_files():
+    #(digest, name, size, modified time) of every file in BLOB_DIR, derived files included
+    root = blob_storage().path(BLOB_DIR)
+    if not os.path.isdir(root):
+        return
+    for prefix in os.scandir(root):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.is_file():
+                stat = entry.stat()
+                yield entry.name.split('.')[0], f"{BLOB_DIR}/{prefix.name}/{entry.name}", stat.st_size, stat.st_mtime
+
+def usage():
+    #Disk usage of the blobs: bytes stored, bytes the references would take as separate copies, and unreferenced bytes
+    counts = reference_counts()
+    result = {'blobs': 0, 'stored_bytes': 0, 'referenced_bytes': 0, 'unreferenced_blobs': 0, 'unreferenced_bytes': 0}
+    for digest, name, size, _ in blob_files():
+        result['blobs'] += 1
+        result['stored_bytes'] += size
+        result['referenced_bytes'] += size * counts[digest]
+        if not counts[digest]:
+            result['unreferenced_blobs'] += 1
+            result['unreferenced_bytes'] += size
+    result['saved_bytes'] = max(0, result['referenced_bytes'] - (result['stored_bytes'] - result['unreferenced_bytes']))
+    return result
+
+def collect(grace_hours):
+    #Deletes the blobs no row refers to, older than grace_hours - a blob just saved may not have its row committed yet.
+    #Returns the number of files deleted and their bytes.
+    counts = reference_counts()
+    cutoff = time.time() - grace_hours * 60 * 60
+    storage = blob_storage()
+    deleted = {'files': 0, 'bytes': 0}
+    for digest, name, size, modified in list(blob_files()):
+        if counts[digest] or modified > cutoff:
+            continue
+        storage.delete(name)
+        deleted['files'] += 1
+        deleted['bytes'] += size
+    return deleted
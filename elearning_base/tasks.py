@@ -1,9 +1,21 @@
+import asyncio
 from celery import shared_task
+from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from celery.utils.log import get_task_logger
-from .models import Enrollments, Notification, CourseActivity, Course
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from .models import Course, Enrollments, Notification, CourseActivity, CourseActivityMaterial, LobbyMessage
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from .consumers import course_notifications_group
+from .notification_counts import add_unread, push_unread_count
+from .notification_retention import purge_read_notifications
+from . import activity_cache, image_derivatives, storage, uploads
+from PIL import Image, UnidentifiedImageError
 
 User = get_user_model()
 log = get_task_logger(__name__)
@@ -11,94 +23,223 @@ log = get_task_logger(__name__)
 #Celery tasks which are triggered by Django signals. These tasks are used t osend notifications via channels to the client side upon creation of 
 #new activities, materials, enrollments and lobby messages.
 
+# The notification is created and counted once, the pushes are tasks of their own (as for the bulk enrollments below):
+# a failed push doesn't retry this task, which would create and count the notification again
 @shared_task(autoretry_for=(Exception,), retry_backoff=True)
 def send_enrollment_notification(enrollment_id):
     try:
         enrollment = Enrollments.objects.get(enrollment_id=enrollment_id)
         teacher = enrollment.course.teacher
-        notification = Notification.objects.create(
-            title="New Enrollment",
-            recipient=enrollment.course.teacher, 
-            message=f"New enrollment for course {enrollment.course.course_title} - {enrollment.student.username}"
-        )
+        with transaction.atomic():
+            notification = Notification.objects.create(
+                title="New Enrollment",
+                recipient=enrollment.course.teacher, 
+                message=f"New enrollment for course {enrollment.course.course_title} - {enrollment.student.username}"
+            )
+            add_unread([teacher.user_id])
         # Send notification via channels to teacher
-        channel_layer = get_channel_layer()
-        group_name = f"enrollment_notifications_{teacher.user_id}"
-        async_to_sync(channel_layer.group_send)(
-            group_name,  # Group name where all notification listeners are added
-            {
-                "type": "new.notification",  # Custom event type name
-                "message": notification.message,
-                "title": notification.title,
-            }
-        )
+        push_enrollment_notification.delay(teacher.user_id, notification.title, notification.message)
 
         # Notify corresponding enrollment student client to subscribe to course-specific notifications
         # Dynamically adds user to course-specific notification groups when they enroll in a new course
         # Without this, the user will not receive any notifications for the new course until they refresh the page (resubscribe to the notification consumer)
-        student_personal_group = f"user_notifications_{enrollment.student.user_id}"
-        course_material_group = f"new_material_notifications_{enrollment.course.course_id}"
-        course_activity_group = f"new_activity_notifications_{enrollment.course.course_id}"
-        async_to_sync(channel_layer.group_send)(
-            student_personal_group,
-            {
-                "type": "dynamic.subscription",
-                "material_group": course_material_group,
-                "activity_group": course_activity_group,
-                "title": enrollment.course.course_title,
-                "message": f"Welcome to {enrollment.course.course_title}! You will now receive notifications for new materials and activities in this course."
-            }
-        )
+        push_course_subscriptions.delay(enrollment.course_id, [enrollment.student_id])
     except Enrollments.DoesNotExist:
         log.error("Enrollment does not exist")
 
+def dynamic_subscription_event(course):
+    return {
+        "type": "dynamic.subscription",
+        "course_id": course.course_id,
+        "title": course.course_title,
+        "message": f"Welcome to {course.course_title}! You will now receive notifications for new materials and activities in this course."
+    }
+
+#Students enrolled together by a bulk import (enrollment_import.py) are pushed their subscriptions this many at a time,
+#concurrently from a single event loop rather than an async_to_sync round trip per student
+SUBSCRIPTION_PUSH_CHUNK_SIZE = 100
+#Usernames named in the bulk enrollment notification, the others are counted
+BULK_ENROLLMENT_NAMED_STUDENTS = 5
+
+async def push_dynamic_subscriptions(channel_layer, course, student_ids):
+    event = dynamic_subscription_event(course)
+    for i in range(0, len(student_ids), SUBSCRIPTION_PUSH_CHUNK_SIZE):
+        await asyncio.gather(*[
+            channel_layer.group_send(f"user_notifications_{student_id}", event) for student_id in student_ids[i:i + SUBSCRIPTION_PUSH_CHUNK_SIZE]
+        ])
+
+#One notification to the teacher for all of the students enrolled by a bulk import, instead of one per enrollment.
+#The pushes - the teacher's notification and the students' subscriptions - are tasks of their own, retried on their own:
+#a failed push doesn't retry this task, which would create and count the notification again.
 @shared_task(autoretry_for=(Exception,), retry_backoff=True)
-def send_new_material_notification(student_id, course_activity, course, material_title):
+def send_bulk_enrollment_notification(course_id, student_ids):
     try:
-        student = User.objects.get(user_id=student_id)
-        course_activity = CourseActivity.objects.get(activity_id=course_activity)
-        course = Course.objects.get(course_id=course)
+        course = Course.objects.select_related('teacher').get(pk=course_id)
+    except Course.DoesNotExist:
+        log.error("Course does not exist")
+        return
+    teacher = course.teacher
+    named = sorted(User.objects.filter(pk__in=student_ids[:BULK_ENROLLMENT_NAMED_STUDENTS]).values_list('username', flat=True))
+    others = len(student_ids) - len(named)
+    with transaction.atomic():
         notification = Notification.objects.create(
-            title="New Material",
-            recipient=student,
-            message=f"New material {material_title} added to course '{course.course_title}'  -> activity: '{course_activity.activity_title}'"
+            title="New Enrollments",
+            recipient=teacher,
+            message=f"{len(student_ids)} new enrollments for course {course.course_title} - {', '.join(named)}" + (f" and {others} more" if others > 0 else "")
         )
-        # Send notification via channels to all enrolled students
+        add_unread([teacher.user_id])
+
+    push_enrollment_notification.delay(teacher.user_id, notification.title, notification.message)
+    push_course_subscriptions.delay(course.course_id, student_ids)
+    return len(student_ids)
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True)
+def push_enrollment_notification(teacher_id, title, message):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f"enrollment_notifications_{teacher_id}",
+        {
+            "type": "new.notification",
+            "message": message,
+            "title": title,
+        }
+    )
+    push_unread_count(teacher_id)
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True)
+def push_course_subscriptions(course_id, student_ids):
+    # A retry pushes every subscription again - adding a consumer to the course group twice changes nothing, a student
+    # already pushed to may get the welcome message twice
+    try:
+        course = Course.objects.get(pk=course_id)
+    except Course.DoesNotExist:
+        log.error("Course does not exist")
+        return
+    async_to_sync(push_dynamic_subscriptions)(get_channel_layer(), course, student_ids)
+
+#New activity/material notifications are fanned out to every student enrolled in the course by a single task per event.
+#Notification rows are inserted with bulk_create and the websocket push is a single group_send to the course broadcast group,
+#which the channel layer fans out to the connected students (blocked students are filtered out by the consumer).
+#The push is its own task, retried on its own: a failed group_send doesn't retry the fan-out task, which would insert and
+#count every row again.
+NOTIFICATION_FAN_OUT_CHUNK_SIZE = 500
+
+def fan_out_course_notification(course, title, message):
+    student_ids = list(Enrollments.objects.filter(course=course, blocked=False).values_list('student_id', flat=True))
+    # All rows are inserted in one transaction, a fan-out failing part way leaves no rows behind for its retry to repeat.
+    # The connected students' consumers count the broadcast themselves, no per-student unread count events are sent
+    with transaction.atomic():
+        Notification.objects.bulk_create([
+            Notification(title=title, recipient_id=student_id, message=message) for student_id in student_ids
+        ], batch_size=NOTIFICATION_FAN_OUT_CHUNK_SIZE)
+        add_unread(student_ids)
+
+    broadcast_course_notification.delay(course.course_id, title, message)
+    return len(student_ids)
 
-        channel_layer = get_channel_layer()
-        group_name = f"new_material_notifications_{course.course_id}_{student.user_id}"
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "new.notification",
-                "message": notification.message,
-                "title": notification.title
-            }
+@shared_task(autoretry_for=(Exception,), retry_backoff=True)
+def broadcast_course_notification(course_id, title, message):
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        course_notifications_group(course_id),
+        {
+            "type": "course.notification",
+            "course_id": course_id,
+            "message": message,
+            "title": title
+        }
+    )
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True)
+def send_new_material_notification(material_id):
+    try:
+        material = CourseActivityMaterial.objects.select_related('course_activity__course').get(material_id=material_id)
+        course_activity = material.course_activity
+        course = course_activity.course
+        # Send notification via channels to all enrolled students
+        return fan_out_course_notification(
+            course,
+            title="New Material",
+            message=f"New material {material.material_title} added to course '{course.course_title}'  -> activity: '{course_activity.activity_title}'"
         )
-    except (User.DoesNotExist, CourseActivity.DoesNotExist, Course.DoesNotExist):
+    except CourseActivityMaterial.DoesNotExist:
         log.error("Error in sending new material notification")
 
 @shared_task(autoretry_for=(Exception,), retry_backoff=True)
-def send_new_activity_notification(student_id, course, activity_title):
+def send_new_activity_notification(activity_id):
     try:
-        student = User.objects.get(user_id=student_id)
-        course = Course.objects.get(course_id=course)
-        notification = Notification.objects.create(
+        course_activity = CourseActivity.objects.select_related('course').get(activity_id=activity_id)
+        course = course_activity.course
+        # Send notification via channels to all enrolled students
+        return fan_out_course_notification(
+            course,
             title="New Activity",
-            recipient=student,
-            message=f"New activity {activity_title} added course '{course.course_title}'"
+            message=f"New activity {course_activity.activity_title} added course '{course.course_title}'"
         )
+    except CourseActivity.DoesNotExist:
+        log.error("Error in sending new activity notification")
 
-        # Send notification via channels to all enrolled students
-        channel_layer = get_channel_layer()
-        group_name = f"new_activity_notifications_{course.course_id}_{student.user_id}"
-        async_to_sync(channel_layer.group_send)(
-            group_name,
-            {
-                "type": "new.notification",
-                "message": notification.message,
-                "title": notification.title
-            }
-        )
-    except (User.DoesNotExist, Course.DoesNotExist):
-        log.error("Error in sending new activity notification")
\ No newline at end of file
+#Retention of the public lobby history - messages older than LOBBY_MESSAGE_RETENTION_DAYS are deleted, run daily by celery beat.
+#Deleted in batches, each its own short transaction, so the lobby's message writes are not held up behind one long delete
+@shared_task
+def trim_lobby_messages():
+    cutoff = timezone.now() - timedelta(days=settings.LOBBY_MESSAGE_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        batch = list(LobbyMessage.objects.filter(created_at__lt=cutoff).order_by('created_at').values_list('pk', flat=True)[:settings.LOBBY_RETENTION_BATCH_SIZE])
+        if not batch:
+            break
+        deleted += LobbyMessage.objects.filter(pk__in=batch).delete()[0]
+    log.info(f"Deleted {deleted} lobby messages older than {cutoff}")
+    return deleted
+
+#Retention of the read notifications, see notification_retention.py, run daily by celery beat
+@shared_task
+def purge_notifications():
+    archive_path = settings.NOTIFICATION_ARCHIVE_PATH
+    if archive_path:
+        with open(archive_path, 'a') as archive:
+            result = purge_read_notifications(settings.NOTIFICATION_RETENTION_DAYS, settings.NOTIFICATION_RETENTION_BATCH_SIZE, archive)
+    else:
+        result = purge_read_notifications(settings.NOTIFICATION_RETENTION_DAYS, settings.NOTIFICATION_RETENTION_BATCH_SIZE)
+    log.info(f"Deleted {result['deleted']} read notifications older than {result['cutoff']}, {result['before']['rows']} rows before, {result['after']['rows']} after")
+    return result['deleted']
+
+#Resized copies of an uploaded image (image_derivatives.py), queued by signals.py once the upload is committed.
+#Skipped when the image has been replaced since, the new image's own task resizes it
+@shared_task(autoretry_for=(Exception,), retry_backoff=True)
+def generate_image_derivatives(model, pk, field_name, name):
+    try:
+        instance = apps.get_model(model).objects.get(pk=pk)
+    except ObjectDoesNotExist:
+        log.error(f"{model} {pk} does not exist")
+        return []
+    field_file = getattr(instance, field_name)
+    if field_file.name != name:
+        return []
+    try:
+        names = image_derivatives.generate(field_file)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        log.warning(f"Could not resize {name}, not a readable image")
+        return []
+    if isinstance(instance, CourseActivityMaterial):
+        # The cached activity tree of the course has the original's URLs
+        activity_cache.invalidate(instance.course_activity.course_id)
+    return names
+
+#Deletes the resumable uploads (uploads.py) not written to for UPLOAD_EXPIRY_HOURS and their partial files, run hourly by
+#celery beat
+@shared_task
+def expire_uploads():
+    deleted = uploads.expire(settings.UPLOAD_EXPIRY_HOURS)
+    log.info(f"Deleted {deleted} expired uploads")
+    return deleted
+
+#Deletes the content-addressed blobs (storage.py) no material or submission refers to any more, run daily by celery beat
+@shared_task
+def collect_blobs():
+    if not storage.is_content_addressed():
+        return {'files': 0, 'bytes': 0}
+    deleted = storage.collect(settings.BLOB_GC_GRACE_HOURS)
+    log.info(f"Deleted {deleted['files']} unreferenced blobs, {deleted['bytes']} bytes")
+    return deleted
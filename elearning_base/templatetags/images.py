@@ -0,0 +1,10 @@
+from django import template
+from ..image_derivatives import derivative_url
+
+register = template.Library()
+
+#URL of the WebP copy of an image field (image_derivatives.py), the original's until it has been made:
+#{{ user.profile_img|thumbnail }}, {{ course.course_img|thumbnail:'medium' }}
+@register.filter
+def thumbnail(field_file, derivative='thumbnail'):
+    return derivative_url(field_file, derivative, webp=True)
@@ -1,14 +1,21 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth.models import Permission
-from ..models import StatusUpdate, Course, CourseActivity, Enrollments, Notification, Feedback, LobbyMessage
+from ..models import StatusUpdate, Course, CourseActivity, CourseActivityMaterial, Enrollments, Notification, Feedback, LobbyMessage, Upload, Submission
+from .. import search, activity_cache, lobby_history
+from django.core.cache import cache
+from ..pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor
+from django.utils import timezone
 from rest_framework import status
-import os, shutil
+import os, shutil, re, tempfile, hashlib
 from django.conf import settings
+from django.db import connection, IntegrityError
+from django.test.utils import CaptureQueriesContext
 import json
+from unittest import mock
 
 User = get_user_model()
 
@@ -318,6 +325,83 @@ class TestCreateEnrollmentAPI(APITestCase):
         response = self.client.post(self.enrollment_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+class TestCreateEnrollmentsAPI(APITestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.other_teacher = User.objects.create_user(username='other_teacher', password='testpassword', email="other_teacher@test.com", is_teacher=True)
+        self.students = [User.objects.create_user(username=f'student{i}', password='testpassword', email=f"student{i}@test.com") for i in range(3)]
+        self.course = Course.objects.create(course_title='Test Course', description='Test Description', teacher=self.teacher)
+        Enrollments.objects.bulk_create([Enrollments(course=self.course, student=self.students[0])])
+        self.url = reverse('create_enrollments', kwargs={'course_id': self.course.course_id})
+
+    def post(self, data, content_type='application/json'):
+        with mock.patch('elearning_base.enrollment_import.send_bulk_enrollment_notification.delay') as delay, \
+                mock.patch('elearning_base.signals.send_enrollment_notification.delay') as single_delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url, data=data, content_type=content_type)
+        #The per enrollment notifications are replaced by the single bulk one
+        single_delay.assert_not_called()
+        return response, delay
+
+    def test_create_enrollments_json(self):
+        self.client.force_authenticate(user=self.teacher)
+        response, delay = self.post(json.dumps(['student0', 'student1', 'student2', 'student1', 'missing', 'other_teacher']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        self.assertEqual((data['usernames'], data['enrolled'], data['already_enrolled']), (5, 2, ['student0']))
+        self.assertEqual([error['username'] for error in data['errors']], ['missing', 'other_teacher'])
+        self.assertEqual(Enrollments.objects.filter(course=self.course).count(), 3)
+        delay.assert_called_once_with(self.course.course_id, [self.students[1].user_id, self.students[2].user_id])
+
+    def test_create_enrollments_csv(self):
+        self.client.force_authenticate(user=self.teacher)
+        response, delay = self.post('email,username\nx@test.com,student1\ny@test.com,student2\n', content_type='text/csv')
+        self.assertEqual(response.json()['enrolled'], 2)
+        #Without a header
+        response, delay = self.post('student0\nstudent1\n', content_type='text/csv')
+        self.assertEqual((response.json()['enrolled'], response.json()['already_enrolled']), (0, ['student0', 'student1']))
+        delay.assert_not_called()
+
+    def test_create_enrollments_batches(self):
+        self.client.force_authenticate(user=self.teacher)
+        with override_settings(ENROLLMENT_IMPORT_BATCH_SIZE=2), CaptureQueriesContext(connection) as queries:
+            response, delay = self.post(json.dumps(['student0', 'student1', 'student2', 'missing']))
+        self.assertEqual(response.json()['enrolled'], 2)
+        self.assertEqual(len([query for query in queries.captured_queries if 'INTO "elearning_base_enrollments"' in query['sql']]), 2)
+
+    def test_create_enrollments_concurrently_enrolled(self):
+        self.client.force_authenticate(user=self.teacher)
+        statements = []
+        def enrolled_meanwhile(execute, sql, params, many, context):
+            #student1 enrolled after the import looked up the existing enrollments, before the batch is inserted
+            looked_up = any(statement.startswith('SELECT') and '"elearning_base_enrollments"' in statement for statement in statements)
+            statements.append(sql)
+            if sql.startswith('SAVEPOINT') and looked_up and not Enrollments.objects.filter(student=self.students[1]).exists():
+                Enrollments.objects.bulk_create([Enrollments(course=self.course, student=self.students[1])])
+            return execute(sql, params, many, context)
+        with connection.execute_wrapper(enrolled_meanwhile):
+            response, delay = self.post(json.dumps(['student1', 'student2']))
+        #The batch inserted again without student1
+        self.assertEqual(len([statement for statement in statements if statement.startswith('INSERT INTO "elearning_base_enrollments"')]), 3)
+        self.assertEqual((response.json()['enrolled'], response.json()['already_enrolled']), (1, ['student1']))
+        delay.assert_called_once_with(self.course.course_id, [self.students[2].user_id])
+
+    def test_create_enrollments_invalid(self):
+        self.client.force_authenticate(user=self.teacher)
+        response, _ = self.post(json.dumps({'usernames': ['student1']}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(ENROLLMENT_IMPORT_MAX_USERNAMES=1):
+            response, _ = self.post(json.dumps(['student1', 'student2']))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response, _ = self.post('student1', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertEqual(Enrollments.objects.filter(course=self.course).count(), 1)
+
+    def test_create_enrollments_not_teacher(self):
+        self.client.force_authenticate(user=self.other_teacher)
+        response, _ = self.post(json.dumps(['student1']))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 class TestUpdateBlockedStatusAPI(APITestCase):
     def setUp(self):
         self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
@@ -344,6 +428,151 @@ class TestUpdateBlockedStatusAPI(APITestCase):
         response = self.client.patch(self.blocked_url, {})
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
     
+class TestUpdateSubmissionGradesAPI(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.other_teacher = User.objects.create_user(username='other_teacher', password='testpassword', email="other_teacher@test.com", is_teacher=True)
+        self.course = Course.objects.create(course_title='Test Course', description='Test Description', teacher=self.teacher)
+        self.activity = CourseActivity.objects.create(activity_title='Exam', description='Test Description', activity_type='ASSIGNMENT', course=self.course)
+        self.other_activity = CourseActivity.objects.create(activity_title='Other', description='Test Description', activity_type='ASSIGNMENT', course=self.course)
+        self.students = [User.objects.create_user(username=f'student{i}', password='testpassword', email=f"student{i}@test.com") for i in range(3)]
+        self.submissions = [Submission.objects.create(student=student, course_activity=self.activity, file=SimpleUploadedFile('exam.pdf', b'exam')) for student in self.students]
+        self.other_submission = Submission.objects.create(student=self.students[0], course_activity=self.other_activity, file=SimpleUploadedFile('other.pdf', b'other'))
+        self.url = reverse('update_submission_grades', kwargs={'activity_id': self.activity.activity_id})
+
+    def grades(self):
+        return [submission.grade for submission in Submission.objects.filter(course_activity=self.activity).order_by('pk')]
+
+    def test_grade_from_csv(self):
+        self.client.force_authenticate(user=self.teacher)
+        body = f"submission_id,student,grade\r\n{self.submissions[0].pk},,85\r\n,student1,70\r\n,student2,101\r\n"
+        response = self.client.post(self.url, data=body.encode(), content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['rows'], response.data['updated'], response.data['error_count']), (3, 2, 1))
+        self.assertEqual(response.data['errors'], [{'row': 3, 'error': 'Grade cannot be greater than 100'}])
+        self.assertEqual(self.grades(), [85, 70, None])
+
+    def test_grade_from_json(self):
+        self.client.force_authenticate(user=self.teacher)
+        rows = [{'submission_id': submission.pk, 'grade': 50 + i} for i, submission in enumerate(self.submissions)]
+        rows += [{'submission_id': self.other_submission.pk, 'grade': 10}, {'student': 'nobody', 'grade': 10}, {'student': 'student0', 'grade': 'A'}, 42]
+        response = self.client.post(self.url, data=json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['updated'], 3)
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 5, 6, 7])
+        self.assertEqual(self.grades(), [50, 51, 52])
+        #Submissions to other activities are not graded
+        self.other_submission.refresh_from_db()
+        self.assertIsNone(self.other_submission.grade)
+
+    def test_grades_written_in_batches(self):
+        self.client.force_authenticate(user=self.teacher)
+        rows = [{'student': f'student{i % 3}', 'grade': i} for i in range(10)]
+        with self.settings(GRADING_BATCH_SIZE=4), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data=json.dumps(rows), content_type='application/json')
+        self.assertEqual(response.data['updated'], 10)
+        #The last row of each student wins
+        self.assertEqual(self.grades(), [9, 7, 8])
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "elearning_base_submission"')]
+        self.assertEqual(len(updates), 3)
+
+    def test_rows_split_across_reads(self):
+        self.client.force_authenticate(user=self.teacher)
+        rows = [{'student': f'student{i}', 'grade': 90 + i} for i in range(3)]
+        with mock.patch('elearning_base.grading.READ_SIZE', 5):
+            response = self.client.post(self.url, data=json.dumps(rows), content_type='application/json')
+            self.assertEqual(response.data['updated'], 3)
+            response = self.client.post(self.url, data='student,grade\n"student0",10\nstudent1,20\n', content_type='text/csv')
+            self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(self.grades(), [10, 20, 92])
+
+    def test_clear_grade(self):
+        Submission.objects.filter(pk=self.submissions[0].pk).update(grade=60)
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.post(self.url, data=b'student,grade\nstudent0,\n', content_type='text/csv')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(self.grades(), [None, None, None])
+
+    def test_invalid_file_changes_nothing(self):
+        self.client.force_authenticate(user=self.teacher)
+        body = json.dumps([{'submission_id': self.submissions[0].pk, 'grade': 90}])[:-1]
+        response = self.client.post(self.url, data=body, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.grades(), [None, None, None])
+
+        response = self.client.post(self.url, data=b'name,score\nstudent0,90\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unsupported_media_type(self):
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.post(self.url, data=b'grades', content_type='text/plain')
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_not_teacher_of_course(self):
+        self.client.force_authenticate(user=self.other_teacher)
+        response = self.client.post(self.url, data=b'student,grade\nstudent0,90\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.grades(), [None, None, None])
+
+    def test_nonexistent_activity(self):
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('update_submission_grades', kwargs={'activity_id': 999})
+        response = self.client.post(url, data=b'student,grade\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class TestGetGradebookAPI(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.student = User.objects.create_user(username='student', password='testpassword', email="student@test.com")
+        self.course = Course.objects.create(course_title='Test Course', description='Test Description', teacher=self.teacher)
+        self.activity = CourseActivity.objects.create(activity_title='Exam', description='Test Description', activity_type='ASSIGNMENT', course=self.course)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.submission = Submission.objects.create(student=self.student, course_activity=self.activity, file=SimpleUploadedFile('exam.pdf', b'exam'))
+        self.url = reverse('get_gradebook', kwargs={'course_id': self.course.course_id})
+
+    def test_get_gradebook(self):
+        self.client.force_authenticate(user=self.teacher)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        #The course and its summary rows
+        self.assertEqual(len([query for query in queries.captured_queries if 'SELECT' in query['sql']]), 2)
+        data = response.json()
+        self.assertEqual(data['activities'][0]['activity_title'], 'Exam')
+        self.assertEqual((data['activities'][0]['submissions'], data['activities'][0]['graded']), (1, 0))
+        self.assertEqual(data['students'][0]['username'], 'student')
+
+    def test_bulk_grading_updates_gradebook(self):
+        self.client.force_authenticate(user=self.teacher)
+        url = reverse('update_submission_grades', kwargs={'activity_id': self.activity.activity_id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, data=json.dumps([{'student': 'student', 'grade': 75}]), content_type='application/json')
+        data = self.client.get(self.url).json()
+        self.assertEqual((data['activities'][0]['graded'], data['activities'][0]['grade_average']), (1, '75.00'))
+        self.assertEqual(data['students'][0]['grade_max'], '75')
+
+    def test_get_gradebook_not_teacher(self):
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_get_gradebook_nonexistent_course(self):
+        self.client.force_authenticate(user=self.teacher)
+        response = self.client.get(reverse('get_gradebook', kwargs={'course_id': 999}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 class TestUpdateNotificationReadAPI(APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username='user1', password='testpassword', email="user1@test.com", is_teacher=False)
@@ -363,6 +592,103 @@ class TestUpdateNotificationReadAPI(APITestCase):
         response = self.client.patch(self.notification_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_update_notification_read_unread_count(self):
+        User.objects.filter(pk=self.user1.pk).update(unread_notifications=1)
+        self.client.force_authenticate(user=self.user1)
+        self.client.patch(self.notification_url)
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.unread_notifications, 0)
+        #Marked unread again
+        self.client.patch(self.notification_url)
+        self.user1.refresh_from_db()
+        self.assertEqual(self.user1.unread_notifications, 1)
+
+    def test_unread_count_rendered_without_notification_query(self):
+        User.objects.filter(pk=self.user1.pk).update(unread_notifications=3)
+        self.client.force_login(self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, '>3</span>')
+        self.assertFalse([query for query in queries.captured_queries if 'elearning_base_notification' in query['sql']])
+
+    def test_profile_update_keeps_unread_count(self):
+        #The profile updates don't write the count back, it may change whilst they run
+        User.objects.filter(pk=self.user1.pk).update(unread_notifications=2)
+        self.client.force_authenticate(user=self.user1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('update_user_api', kwargs={'user_id': self.user1.pk}), {'first_name': 'First'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        updates = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "elearning_base_userprofile"')]
+        self.assertTrue(updates)
+        self.assertFalse([sql for sql in updates if 'unread_notifications' in sql])
+        self.user1.refresh_from_db()
+        self.assertEqual((self.user1.first_name, self.user1.unread_notifications), ('First', 2))
+
+class TestMarkNotificationsReadAPI(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', password='testpassword', email="user1@test.com", is_teacher=False)
+        self.user2 = User.objects.create_user(username='user2', password='testpassword', email="user2@test.com", is_teacher=False)
+        base = timezone.now()
+        self.notifications = Notification.objects.bulk_create([Notification(recipient=self.user1, title=f'Notification {i}', message='Message') for i in range(5)])
+        for i, notification in enumerate(self.notifications):
+            Notification.objects.filter(pk=notification.pk).update(created_at=base - timezone.timedelta(minutes=i))
+        self.other_notification = Notification.objects.create(recipient=self.user2, title='Other', message='Message')
+        User.objects.filter(pk=self.user1.pk).update(unread_notifications=5)
+        User.objects.filter(pk=self.user2.pk).update(unread_notifications=1)
+        self.url = reverse('mark_notifications_read')
+        self.client.force_authenticate(user=self.user1)
+
+    def unread(self, user):
+        return set(Notification.objects.filter(recipient=user, read=False).values_list('pk', flat=True))
+
+    def test_mark_notification_ids_read(self):
+        ids = [self.notifications[0].pk, self.notifications[1].pk, self.other_notification.pk]
+        response = self.client.post(self.url, {'notification_ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        #The other user's notification is left alone
+        self.assertEqual(response.json(), {'updated': 2, 'unread_count': 3})
+        self.assertEqual(self.unread(self.user1), {n.pk for n in self.notifications[2:]})
+        self.assertEqual(self.unread(self.user2), {self.other_notification.pk})
+        self.user2.refresh_from_db()
+        self.assertEqual(self.user2.unread_notifications, 1)
+
+    def test_mark_notifications_read_up_to_cursor(self):
+        self.notifications[2].refresh_from_db()
+        up_to = encode_cursor(self.notifications[2], 'created_at')
+        response = self.client.post(self.url, {'up_to': up_to}, format='json')
+        self.assertEqual(response.json(), {'updated': 3, 'unread_count': 2})
+        self.assertEqual(self.unread(self.user1), {n.pk for n in self.notifications[:2]})
+
+    def test_mark_all_notifications_read(self):
+        with self.assertNumQueries(5):
+            #One update of the notifications and one of the counter (in a savepoint), then the count read back
+            response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.json(), {'updated': 5, 'unread_count': 0})
+        self.assertEqual(self.unread(self.user1), set())
+        #Already read, nothing left to count
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.json(), {'updated': 0, 'unread_count': 0})
+
+    def test_mark_notifications_read_invalid(self):
+        response = self.client.post(self.url, {'notification_ids': [self.notifications[0].pk], 'up_to': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'up_to': 'invalid'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.unread(self.user1)), 5)
+
+    def test_notifications_page_mark_all_cursor(self):
+        #Shown on a later page, the cursor still covers the newest unread notification
+        newest, second = Notification.objects.filter(recipient=self.user1).order_by('-created_at')[:2]
+        self.client.force_login(self.user1)
+        response = self.client.get(reverse('notifications'), {'cursor': encode_cursor(second, 'created_at')})
+        self.assertNotIn(newest.pk, [notification['notification_id'] for notification in response.context['notifications']])
+        self.assertEqual(response.context['mark_read_cursor'], encode_cursor(newest, 'created_at'))
+
+    def test_mark_notifications_read_unauthenticated(self):
+        self.client.force_authenticate(user=None)
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 class TestGetStatusUpdateAPI(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
@@ -383,6 +709,17 @@ class TestGetStatusUpdateAPI(APITestCase):
         response = self.client.get(self.status_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_profile_pages_render_one_page(self):
+        StatusUpdate.objects.bulk_create([StatusUpdate(user=self.user, status=f'Status {i}') for i in range(12)])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('home'))
+        page = response.context['status_updates']
+        self.assertEqual(len(page.items), 10)
+        self.assertContains(response, f'?status_cursor={page.next_cursor}')
+        response = self.client.get(reverse('user_profile', kwargs={'user_id': self.user.user_id}), {'status_cursor': page.next_cursor})
+        self.assertEqual(len(response.context['status_updates'].items), 4)
+        self.assertIsNone(response.context['status_updates'].next_cursor)
+
 class TestGetEnrolledCoursesAPI(APITestCase):
     def setUp(self):
         self.student = User.objects.create_user(username='user', password='testpassword', email="user@test.com", is_teacher=False)
@@ -474,6 +811,70 @@ class TestGetSearchResultsAPI(APITestCase):
         response = self.client.get(self.course_search_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_search_results_ranked_by_relevance(self):
+        #A title match ranks above a match in the description only
+        Course.objects.create(course_title='Algebra', description='An introduction to python', teacher=self.teacher)
+        Course.objects.create(course_title='Python Basics', description='Description 3', teacher=self.teacher)
+        self.client.force_authenticate(user=self.student1)
+        response = self.client.get(reverse('get_search_results', kwargs={'search_query': 'python'}))
+        data = json.loads(response.content)
+        self.assertEqual([course['course_title'] for course in data['courses']], ['Python Basics', 'Algebra'])
+
+    def test_search_results_prefix_and_multiple_terms(self):
+        self.client.force_authenticate(user=self.student1)
+        response = self.client.get(reverse('get_search_results', kwargs={'search_query': 'cour 2'}))
+        data = json.loads(response.content)
+        self.assertEqual([course['course_title'] for course in data['courses']], ['Course 2'])
+
+    def test_search_query_syntax_characters(self):
+        #FTS5 operators and quotes in the query are matched literally rather than raising a syntax error
+        self.client.force_authenticate(user=self.student1)
+        for query in ['"Course', 'Course AND', 'Course*', 'NOT', '(', '-']:
+            response = self.client.get(reverse('get_search_results', kwargs={'search_query': query}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_search_results_paginated_and_capped(self):
+        Course.objects.bulk_create([Course(course_title=f'Paged {i}', description='Description', teacher=self.teacher) for i in range(60)])
+        search.rebuild_index()
+        self.client.force_authenticate(user=self.student1)
+        url = reverse('get_search_results', kwargs={'search_query': 'paged'})
+
+        data = json.loads(self.client.get(url).content)
+        self.assertEqual(len(data['courses']), search.SEARCH_PAGE_SIZE)
+        self.assertTrue(data['has_next']['courses'])
+        self.assertEqual(data['page'], 1)
+
+        data = json.loads(self.client.get(url, {'page': 2}).content)
+        self.assertEqual(data['courses'][0]['course_title'], 'Paged 10')
+
+        #Results stop at SEARCH_MAX_RESULTS even though there are more matches
+        last_page = search.SEARCH_MAX_RESULTS // search.SEARCH_PAGE_SIZE
+        data = json.loads(self.client.get(url, {'page': last_page}).content)
+        self.assertEqual(len(data['courses']), search.SEARCH_PAGE_SIZE)
+        self.assertFalse(data['has_next']['courses'])
+        data = json.loads(self.client.get(url, {'page': last_page + 1}).content)
+        self.assertEqual(data['courses'], [])
+
+    def test_search_index_follows_updates_and_deletes(self):
+        self.client.force_authenticate(user=self.student1)
+        self.course1.course_title = 'Renamed'
+        self.course1.save()
+        self.course2.delete()
+        data = json.loads(self.client.get(self.course_search_url).content)
+        self.assertEqual(data['courses'], [])
+        data = json.loads(self.client.get(reverse('get_search_results', kwargs={'search_query': 'renamed'})).content)
+        self.assertEqual(len(data['courses']), 1)
+
+    def test_search_index_skips_unindexed_updates(self):
+        self.student1.last_login = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            self.student1.save(update_fields=['last_login'])
+        self.assertFalse([query for query in queries if search.USER_FTS_TABLE in query['sql']])
+        self.student1.first_name = 'Renamed'
+        with CaptureQueriesContext(connection) as queries:
+            self.student1.save(update_fields=['first_name'])
+        self.assertTrue([query for query in queries if search.USER_FTS_TABLE in query['sql']])
+
 class TestGetCourseActivitiesWithMaterialsAPI(APITestCase):
     def setUp(self):
         self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
@@ -515,6 +916,80 @@ class TestGetCourseActivitiesWithMaterialsAPI(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+class TestCourseActivitiesCache(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.student = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        self.course = Course.objects.create(course_title='Course 1', description='Description 1', teacher=self.teacher)
+        self.other_course = Course.objects.create(course_title='Course 2', description='Description 2', teacher=self.teacher)
+        self.enrollment = Enrollments.objects.create(course=self.course, student=self.student, blocked=False)
+        self.activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+        self.material = CourseActivityMaterial.objects.create(course_activity=self.activity, material_title='Material 1', description='Description 1', video_link='https://example.com')
+        self.url = reverse('get_course_activities_with_materials', kwargs={'course_id': self.course.course_id})
+        self.other_url = reverse('get_course_activities_with_materials', kwargs={'course_id': self.other_course.course_id})
+        self.client.force_authenticate(user=self.teacher)
+
+    def get_activities(self, url=None):
+        response = self.client.get(url or self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_cache_hit(self):
+        first = self.get_activities()
+        #Only the course lookup
+        with self.assertNumQueries(1):
+            second = self.get_activities()
+        self.assertEqual(first, second)
+        self.assertEqual(activity_cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_one_entry_for_all_hosts(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            material = CourseActivityMaterial.objects.create(course_activity=self.activity, material_title='Slides', description='Description',
+                                                             file=SimpleUploadedFile('slides.pdf', b'slides'))
+            for host in ('testserver', 'other.example'):
+                response = self.client.get(self.url, HTTP_HOST=host)
+                files = [m['file'] for m in json.loads(response.content)[0]['activity_materials'] if m['material_id'] == material.pk]
+                self.assertEqual(files, [f'http://{host}{material.file.url}'])
+        self.assertEqual(activity_cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_invalidated_by_activity_changes(self):
+        self.get_activities()
+        CourseActivity.objects.create(course=self.course, activity_title='Activity 2', description='Description 2')
+        self.assertEqual([activity['activity_title'] for activity in self.get_activities()], ['Activity 2', 'Activity 1'])
+        self.activity.activity_title = 'Renamed'
+        self.activity.save()
+        self.assertEqual(self.get_activities()[1]['activity_title'], 'Renamed')
+        self.activity.delete()
+        self.assertEqual(len(self.get_activities()), 1)
+
+    def test_invalidated_by_material_changes(self):
+        self.get_activities()
+        CourseActivityMaterial.objects.create(course_activity=self.activity, material_title='Material 2', description='Description 2', video_link='https://example.com')
+        self.assertEqual(len(self.get_activities()[0]['activity_materials']), 2)
+        self.material.material_title = 'Renamed'
+        self.material.save()
+        self.assertIn('Renamed', [material['material_title'] for material in self.get_activities()[0]['activity_materials']])
+        self.material.delete()
+        self.assertEqual(len(self.get_activities()[0]['activity_materials']), 1)
+
+    def test_other_courses_stay_cached(self):
+        self.get_activities()
+        self.get_activities(self.other_url)
+        CourseActivity.objects.create(course=self.other_course, activity_title='Activity 2', description='Description 2')
+        activity_cache.reset_stats()
+        self.get_activities()
+        self.get_activities(self.other_url)
+        self.assertEqual(activity_cache.get_stats(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_access_checked_before_cache(self):
+        self.get_activities()
+        self.enrollment.blocked = True
+        self.enrollment.save()
+        self.client.force_authenticate(user=self.student)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 class TestGetCourseFeedbackAPI(APITestCase):
     def setUp(self):
         self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
@@ -602,8 +1077,54 @@ class TestGetNotificationsAPI(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def get_link(self, response, rel):
+        match = re.search(rf'<([^>]*)>; rel="{rel}"', response.get('Link', ''))
+        return match.group(1) if match else None
+
+    def test_get_notifications_cursor_pagination(self):
+        Notification.objects.bulk_create([Notification(recipient=self.user1, title=f'Notification {i}') for i in range(24)])
+        #Rows sharing a timestamp are ordered by primary key, so no row is skipped or repeated across pages
+        Notification.objects.filter(recipient=self.user1).update(created_at=timezone.now())
+        expected = list(Notification.objects.filter(recipient=self.user1).order_by('-notification_id').values_list('notification_id', flat=True))
+        self.client.force_authenticate(user=self.user1)
+
+        seen = []
+        url = f'{self.notification_url}?page_size=10'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = json.loads(response.content)
+            pages.append(data)
+            seen += [notification['notification_id'] for notification in data]
+            url = self.get_link(response, 'next')
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(seen, expected)
+
+        #Walking back from the last page returns the previous page
+        previous_url = self.get_link(response, 'prev')
+        data = json.loads(self.client.get(previous_url).content)
+        self.assertEqual(data, pages[1])
+
+    def test_get_notifications_page_size_capped(self):
+        Notification.objects.bulk_create([Notification(recipient=self.user1) for i in range(MAX_PAGE_SIZE + 5)])
+        self.client.force_authenticate(user=self.user1)
+        response = self.client.get(self.notification_url, {'page_size': 100000})
+        self.assertEqual(len(json.loads(response.content)), MAX_PAGE_SIZE)
+        self.assertIsNotNone(self.get_link(response, 'next'))
+        response = self.client.get(self.notification_url)
+        self.assertEqual(len(json.loads(response.content)), DEFAULT_PAGE_SIZE)
+
+    def test_get_notifications_invalid_cursor(self):
+        self.client.force_authenticate(user=self.user1)
+        for cursor in ['not-a-cursor', 'WzEsMl0=', '']:
+            response = self.client.get(self.notification_url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST if cursor else status.HTTP_200_OK)
+
 class TestGetLatestMessagesAPI(APITestCase):
     def setUp(self):
+        #The lobby history ring buffer is kept in the cache during tests
+        cache.clear()
         self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
         self.lobby_messages = [LobbyMessage.objects.create(message=f'Message {i}', user=self.user) for i in range(15)]
         self.messages_url = reverse('get_latest_lobby_messages')  # replace with your actual url name
@@ -620,6 +1141,109 @@ class TestGetLatestMessagesAPI(APITestCase):
         response = self.client.get(self.messages_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
+    def test_get_latest_lobby_messages_from_history(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(self.messages_url)
+        #Served from the ring buffer, new messages are pushed to it
+        LobbyMessage.objects.create(message='Message 15', user=self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.messages_url)
+        data = json.loads(response.content)
+        self.assertEqual([message['message'] for message in data], [f'Message {i}' for i in range(15, 5, -1)])
+        self.assertEqual(data[0]['user'], {'user_id': self.user.user_id, 'username': 'user', 'is_teacher': False})
+
+    def test_get_latest_lobby_messages_history_link(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.messages_url)
+        next_url = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+        self.assertIn(reverse('get_lobby_history'), next_url)
+        data = json.loads(self.client.get(next_url).content)
+        self.assertEqual([message['message'] for message in data], [f'Message {i}' for i in range(4, -1, -1)])
+
+    def test_get_latest_lobby_messages_history_link_shared_timestamp(self):
+        #The oldest message shown and an older one sent at the same time
+        LobbyMessage.objects.filter(pk=self.lobby_messages[4].pk).update(created_at=self.lobby_messages[5].created_at)
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.messages_url)
+        next_url = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+        data = json.loads(self.client.get(next_url).content)
+        self.assertEqual([message['message'] for message in data], [f'Message {i}' for i in range(4, -1, -1)])
+
+    def test_lobby_history_after_unwritten_messages(self):
+        sent_at = timezone.now()
+        LobbyMessage.objects.create(message='Earlier', user=self.user, created_at=sent_at)
+        #Shown from the lobby buffer before they were written, newest first
+        shown = [LobbyMessage(message=f'Buffered {i}', user=self.user, created_at=sent_at) for i in range(3)]
+        entries = [lobby_history.serialize(lobby_message) for lobby_message in reversed(shown)]
+        self.assertIsNone(entries[-1]['message_id'])
+        cursor = lobby_history.history_cursor(entries, 3)
+        LobbyMessage.objects.bulk_create(shown)
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('get_lobby_history'), {'cursor': cursor, 'page_size': 5})
+        self.assertEqual([message['message'] for message in json.loads(response.content)], ['Earlier', 'Message 14', 'Message 13', 'Message 12', 'Message 11'])
+        self.assertIn('rel="next"', response['Link'])
+
+class TestGetLobbyHistoryAPI(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
+        start = timezone.now() - timezone.timedelta(hours=1)
+        LobbyMessage.objects.bulk_create([LobbyMessage(message=f'Message {i}', user=self.user, created_at=start + timezone.timedelta(seconds=i)) for i in range(25)])
+        self.history_url = reverse('get_lobby_history')
+
+    def test_get_lobby_history_pages(self):
+        self.client.force_authenticate(user=self.user)
+        messages, url = [], self.history_url + '?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            messages += [message['message'] for message in json.loads(response.content)]
+            match = re.search(r'<([^>]+)>; rel="next"', response.get('Link', ''))
+            url = match.group(1) if match else None
+        self.assertEqual(messages, [f'Message {i}' for i in range(24, -1, -1)])
+
+    def test_get_lobby_history_invalid_cursor(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.history_url + '?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_lobby_history_unauthenticated(self):
+        response = self.client.get(self.history_url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+#The production ring buffer, in a Redis database of its own
+@override_settings(LOBBY_HISTORY_REDIS_URL='redis://127.0.0.1:6379/15', LOBBY_HISTORY_SIZE=5)
+class TestLobbyHistoryRedis(TestCase):
+    def setUp(self):
+        lobby_history.clear()
+        self.addCleanup(lobby_history.clear)
+        self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
+
+    def test_empty_lobby(self):
+        self.assertEqual(lobby_history.latest(10), [])
+        #The ring is filled even though there are no messages
+        with self.assertNumQueries(0):
+            self.assertEqual(lobby_history.latest(10), [])
+        LobbyMessage.objects.create(message='Message 0', user=self.user)
+        self.assertEqual([message['message'] for message in lobby_history.latest(10)], ['Message 0'])
+
+    def test_capped(self):
+        for i in range(3):
+            LobbyMessage.objects.create(message=f'Message {i}', user=self.user)
+        self.assertEqual([message['message'] for message in lobby_history.latest(10)], ['Message 2', 'Message 1', 'Message 0'])
+        for i in range(3, 10):
+            LobbyMessage.objects.create(message=f'Message {i}', user=self.user)
+        self.assertEqual([message['message'] for message in lobby_history.latest(3)], ['Message 9', 'Message 8', 'Message 7'])
+        self.assertLessEqual(len(lobby_history.latest(10)), 6)
+
+    def test_pushes_wait_for_fill(self):
+        #Messages sent while the ring is lost are loaded from the database rather than pushed to an incomplete ring
+        for i in range(3):
+            LobbyMessage.objects.create(message=f'Message {i}', user=self.user)
+        lobby_history.clear()
+        LobbyMessage.objects.create(message='Message 3', user=self.user)
+        self.assertEqual([message['message'] for message in lobby_history.latest(10)], ['Message 3', 'Message 2', 'Message 1', 'Message 0'])
+
 class TestDeleteStatusUpdateAPI(APITestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username='user1', password='testpassword', email="user1@test.com")
@@ -673,4 +1297,295 @@ class TestDeleteCourseActivityAPI(APITestCase):
         url = reverse('delete_course_activity', kwargs={'activity_id': 999})
         self.client.force_authenticate(user=self.teacher)
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class TestResumableUploadAPI(APITestCase):
+    def setUp(self):
+        #Uploaded files go to a temporary media directory, deleted after each test
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.student = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        self.course = Course.objects.create(course_title='Test Course', description='Test Description', teacher=self.teacher)
+        self.activity = CourseActivity.objects.create(activity_title='Test Activity', description='Test Description', activity_type='ASSIGNMENT', course=self.course)
+        Enrollments.objects.create(student=self.student, course=self.course)
+        self.content = os.urandom(200 * 1024)
+        self.material_data = {'target': Upload.MATERIAL, 'course_activity': self.activity.activity_id, 'filename': 'lecture.pdf', 'size': len(self.content),
+                              'checksum': hashlib.sha256(self.content).hexdigest(), 'material_title': 'Test Material', 'description': 'Test Description'}
+        self.submission_data = {'target': Upload.SUBMISSION, 'course_activity': self.activity.activity_id, 'filename': 'answer.pdf', 'size': len(self.content),
+                                'checksum': hashlib.sha256(self.content).hexdigest()}
+
+    def start(self, user, data):
+        self.client.force_authenticate(user=user)
+        response = self.client.post(reverse('create_upload'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['upload_id']
+
+    def send(self, upload_id, chunk, offset):
+        url = reverse('upload_chunk', kwargs={'upload_id': upload_id})
+        return self.client.patch(url, data=chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def finalize(self, upload_id):
+        return self.client.post(reverse('finalize_upload', kwargs={'upload_id': upload_id}))
+
+    def test_create_upload_reserves_file(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        upload = Upload.objects.get(pk=upload_id)
+        self.assertEqual(upload.offset, 0)
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, upload.name)))
+
+    def test_create_material_upload_as_student(self):
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post(reverse('create_upload'), self.material_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_submission_upload_not_enrolled(self):
+        Enrollments.objects.filter(student=self.student).update(blocked=True)
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post(reverse('create_upload'), self.submission_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_upload_too_large(self):
+        self.client.force_authenticate(user=self.teacher)
+        with self.settings(UPLOAD_MAX_SIZE=1024):
+            response = self.client.post(reverse('create_upload'), self.material_data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('size', response.data)
+
+    def test_upload_material_in_chunks(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        for offset in range(0, len(self.content), 64 * 1024):
+            response = self.send(upload_id, self.content[offset:offset + 64 * 1024], offset)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        material = CourseActivityMaterial.objects.get(course_activity=self.activity)
+        self.assertEqual(material.material_title, 'Test Material')
+        with material.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_upload_to_content_addressed_storage(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        staged = Upload.objects.get(pk=upload_id).name
+        self.send(upload_id, self.content, 0)
+        with self.settings(STORAGES={**settings.STORAGES, 'course_files': {'BACKEND': 'elearning_base.storage.ContentAddressedStorage'}}):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        digest = self.material_data['checksum']
+        self.assertEqual(CourseActivityMaterial.objects.get().file.name, f'blobs/{digest[:2]}/{digest}.pdf')
+        #Moved, not copied
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, staged)))
+
+    def test_upload_submission(self):
+        upload_id = self.start(self.student, self.submission_data)
+        self.send(upload_id, self.content, 0)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        submission = Submission.objects.get(student=self.student)
+        self.assertEqual(response.data['submission_id'], submission.submission_id)
+
+    def test_resume_after_conflicting_offset(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        self.send(upload_id, self.content[:1000], 0)
+        #The chunk is sent again from the start, the upload is already past it
+        response = self.send(upload_id, self.content[:1000], 0)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 1000)
+
+        response = self.client.get(reverse('upload_chunk', kwargs={'upload_id': upload_id}))
+        self.assertEqual(response.data['offset'], 1000)
+        self.send(upload_id, self.content[1000:], 1000)
+        self.assertEqual(self.finalize(upload_id).status_code, status.HTTP_201_CREATED)
+
+    def test_chunk_past_end_of_file(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        response = self.send(upload_id, self.content + b'extra', 0)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_without_offset(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        url = reverse('upload_chunk', kwargs={'upload_id': upload_id})
+        response = self.client.patch(url, data=self.content, content_type='application/offset+octet-stream')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_with_invalid_headers(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        url = reverse('upload_chunk', kwargs={'upload_id': upload_id})
+        for offset, length in [('0', 'abc'), ('0', '-10'), ('-10', '10'), ('abc', '10')]:
+            response = self.client.patch(url, data=self.content[:10], content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=offset, CONTENT_LENGTH=length)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Upload.objects.get(pk=upload_id).offset, 0)
+
+    def test_upload_of_other_user(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        self.client.force_authenticate(user=self.student)
+        response = self.send(upload_id, self.content, 0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_finalize_incomplete_upload(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        self.send(upload_id, self.content[:1000], 0)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['offset'], 1000)
+
+    def test_finalize_checksum_mismatch_restarts_upload(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        self.send(upload_id, bytes(len(self.content)), 0)
+        response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        upload = Upload.objects.get(pk=upload_id)
+        self.assertEqual(upload.offset, 0)
+        self.assertEqual(os.path.getsize(os.path.join(self.media_root, upload.name)), 0)
+        self.assertFalse(CourseActivityMaterial.objects.exists())
+
+    def test_finalize_title_taken_meanwhile(self):
+        upload_id = self.start(self.teacher, self.material_data)
+        self.send(upload_id, self.content, 0)
+        with mock.patch.object(CourseActivityMaterial, 'save', side_effect=IntegrityError):
+            response = self.finalize(upload_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('material_title', response.data)
+        self.assertTrue(Upload.objects.filter(pk=upload_id).exists())
+
+class TestProtectedMediaAPI(APITestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.student = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        self.other_student = User.objects.create_user(username='other', password='testpassword', email="other@test.com", is_teacher=False)
+        self.course = Course.objects.create(course_title='Test Course', description='Test Description', teacher=self.teacher)
+        self.activity = CourseActivity.objects.create(activity_title='Test Activity', description='Test Description', activity_type='ASSIGNMENT', course=self.course)
+        self.enrollment = Enrollments.objects.create(student=self.student, course=self.course)
+        self.content = b'0123456789' * 100
+        self.material = CourseActivityMaterial.objects.create(course_activity=self.activity, material_title='Slides', description='Description',
+                                                              file=SimpleUploadedFile('slides.pdf', self.content))
+        self.submission = Submission.objects.create(student=self.student, course_activity=self.activity, file=SimpleUploadedFile('answer.pdf', b'answer'))
+
+    def get(self, user, field_file, **headers):
+        if user:
+            self.client.force_login(user)
+        return self.client.get(field_file.url, **headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_course_file_readers(self):
+        response = self.get(self.student, self.material.file)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(self.get(self.teacher, self.material.file).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(self.other_student, self.material.file).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_blocked_student(self):
+        self.enrollment.blocked = True
+        self.enrollment.save()
+        self.assertEqual(self.get(self.student, self.material.file).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_anonymous_redirected_to_login(self):
+        response = self.get(None, self.material.file)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertTrue(response.url.startswith(reverse('login')))
+
+    def test_public_images(self):
+        course_img = SimpleUploadedFile('course.jpg', b'image', content_type='image/jpeg')
+        with mock.patch('elearning_base.signals.generate_image_derivatives.delay'):
+            self.course.course_img = course_img
+            self.course.save()
+        self.assertEqual(self.get(None, self.course.course_img).status_code, status.HTTP_200_OK)
+
+    def test_submission_readers(self):
+        self.assertEqual(self.get(self.student, self.submission.file).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(self.teacher, self.submission.file).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get(self.other_student, self.submission.file).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_content_addressed_file(self):
+        with self.settings(STORAGES={**settings.STORAGES, 'course_files': {'BACKEND': 'elearning_base.storage.ContentAddressedStorage'}}):
+            material = CourseActivityMaterial.objects.create(course_activity=self.activity, material_title='Blob', description='Description',
+                                                             file=SimpleUploadedFile('blob.pdf', b'blob'))
+            self.assertTrue(material.file.name.startswith('blobs/'))
+            response = self.get(self.student, material.file)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertEqual(self.get(self.other_student, material.file).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_range_requests(self):
+        response = self.get(self.student, self.material.file, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(self.body(response), self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        response = self.get(self.student, self.material.file, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.content[-5:])
+        response = self.get(self.student, self.material.file, HTTP_RANGE='bytes=990-')
+        self.assertEqual(self.body(response), self.content[990:])
+
+        response = self.get(self.student, self.material.file, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        #Several ranges are answered with the whole file
+        response = self.get(self.student, self.material.file, HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_if_range_of_older_version(self):
+        response = self.get(self.student, self.material.file, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_if_none_match(self):
+        etag = self.get(self.student, self.material.file)['ETag']
+        response = self.get(self.student, self.material.file, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        #Checked again, a student who lost access doesn't get a 304
+        self.enrollment.delete()
+        self.assertEqual(self.get(self.student, self.material.file, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_delivered_by_web_server(self):
+        with self.settings(MEDIA_DELIVERY='x-accel-redirect'):
+            response = self.get(self.student, self.material.file)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.material.file.name}')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_DELIVERY='x-sendfile'):
+            response = self.get(self.student, self.material.file)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, self.material.file.name))
+
+    def test_missing_file_and_path_outside_media(self):
+        self.client.force_login(self.student)
+        response = self.client.get(f'/media/course_files/course_{self.course.course_id}/missing.pdf')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(f'/media/course_files/course_{self.course.course_id}/%2E%2E/%2E%2E/%2E%2E/settings.py')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_path_traversal(self):
+        #Paths which would reach the submission through a directory the user may read
+        other_course = Course.objects.create(course_title='Other Course', description='Test Description', teacher=self.other_student)
+        name = self.submission.file.name
+        paths = [
+            f'profile_imgs/../{name}',
+            f'course_imgs/./../{name}',
+            f'course_files/course_{other_course.course_id}/../../{name}',
+            f'{other_course.course_id}/activity_1/images/../../../{name}',
+            f'profile_imgs//../{name}',
+        ]
+        for user in (None, self.other_student):
+            if user:
+                self.client.force_login(user)
+            for path in paths:
+                for url in (f'/media/{path}', f'/media/{path}'.replace('..', '%2e%2e')):
+                    self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND, url)
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(f'/media/course_files/../{name}').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(f'/media/{name}').status_code, status.HTTP_200_OK)
@@ -0,0 +1,179 @@
+import os, sqlite3, tempfile
+from io import StringIO
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth.models import Group
+from ..models import *
+from .. import search, activity_cache, image_derivatives
+from django.core.cache import cache
+from django.utils import timezone
+
+SMALL_DATASET = {
+    'users': 60, 'courses': 8, 'activities_per_course': 3, 'notifications_per_user': 2, 'status_updates_per_user': 1,
+    'lobby_messages': 10, 'stdout': StringIO(),
+}
+
+class TestSeedDataCommand(TestCase):
+    def seed(self, **options):
+        call_command('seed_data', '--end-date=2024-06-01', **{**SMALL_DATASET, **options})
+
+    def test_seed_data(self):
+        self.seed(prefix='seed')
+        self.assertEqual(UserProfile.objects.count(), 60)
+        self.assertEqual(UserProfile.objects.filter(is_teacher=True).count(), 3)
+        self.assertEqual(Course.objects.count(), 8)
+        self.assertTrue(Enrollments.objects.exists())
+        self.assertTrue(Notification.objects.exists())
+        self.assertEqual(LobbyMessage.objects.count(), 10)
+        #Group membership UserProfile.save would have added
+        self.assertEqual(Group.objects.get(name='Teachers').user_set.count(), 3)
+        self.assertEqual(Group.objects.get(name='Students').user_set.count(), 57)
+        #Generated timestamps are kept rather than replaced by auto_now_add
+        self.assertFalse(Notification.objects.filter(created_at__gt='2024-06-01T00:00:00Z').exists())
+        #Search index rebuilt after the bulk inserts
+        course = Course.objects.first()
+        self.assertIn(course.course_id, search.search_course_ids(course.course_title)[0])
+        #Unread counts recounted after the bulk inserts
+        user = Notification.objects.filter(read=False).first().recipient
+        self.assertEqual(user.unread_notifications, Notification.objects.filter(recipient=user, read=False).count())
+        #Gradebook summaries rebuilt after the bulk inserts
+        submission = Submission.objects.first()
+        summary = GradeSummary.objects.get(course_activity=submission.course_activity)
+        self.assertEqual(summary.submissions, Submission.objects.filter(course_activity=submission.course_activity).count())
+
+    def test_seed_data_deterministic(self):
+        def snapshot(prefix):
+            return (
+                list(Enrollments.objects.filter(student__username__startswith=f'{prefix}_').order_by('enrollment_id').values_list('student__username', 'course__course_title', 'enrolled_at', 'status')),
+                list(Notification.objects.filter(recipient__username__startswith=f'{prefix}_').order_by('notification_id').values_list('recipient__username', 'title', 'created_at', 'read')),
+            )
+        self.seed(prefix='first')
+        self.seed(prefix='second')
+        first, second = snapshot('first'), snapshot('second')
+        rename = lambda rows: [tuple(str(value).replace('second', 'first') for value in row) for row in rows]
+        self.assertEqual([rename(rows) for rows in second], [rename(rows) for rows in first])
+
+    def test_seed_data_existing_prefix(self):
+        self.seed(prefix='seed')
+        with self.assertRaises(CommandError):
+            self.seed(prefix='seed')
+
+class TestActivityCacheStatsCommand(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_activity_cache_stats(self):
+        activity_cache.count(activity_cache.HITS_KEY)
+        activity_cache.count(activity_cache.HITS_KEY)
+        activity_cache.count(activity_cache.HITS_KEY)
+        activity_cache.count(activity_cache.MISSES_KEY)
+        out = StringIO()
+        call_command('activity_cache_stats', '--reset', stdout=out)
+        self.assertIn('hits: 3  misses: 1  hit ratio: 75.0%', out.getvalue())
+        self.assertEqual(activity_cache.get_stats(), {'hits': 0, 'misses': 0, 'hit_ratio': None})
+
+class TestRecountUnreadNotificationsCommand(TestCase):
+    def test_recount_unread_notifications(self):
+        user = UserProfile.objects.create_user(username='user', password='testpassword', email='user@test.com')
+        other = UserProfile.objects.create_user(username='other', password='testpassword', email='other@test.com')
+        #Bulk inserts bypass the counters
+        Notification.objects.bulk_create([Notification(recipient=user, read=False), Notification(recipient=user, read=False), Notification(recipient=user, read=True)])
+        UserProfile.objects.filter(pk=other.pk).update(unread_notifications=4)
+        out = StringIO()
+        call_command('recount_unread_notifications', stdout=out)
+        self.assertIn('Recounted the unread notifications of 2 users.', out.getvalue())
+        self.assertEqual(dict(UserProfile.objects.values_list('username', 'unread_notifications')), {'user': 2, 'other': 0})
+
+class TestPurgeNotificationsCommand(TestCase):
+    def test_purge_notifications(self):
+        user = UserProfile.objects.create_user(username='user', password='testpassword', email='user@test.com')
+        Notification.objects.bulk_create([Notification(recipient=user, title='Read', message='Message', read=True) for i in range(3)] + [Notification(recipient=user, title='Unread', message='Message')])
+        Notification.objects.update(created_at=timezone.now() - timezone.timedelta(days=10))
+        out = StringIO()
+        call_command('purge_notifications', '--days=5', '--batch-size=2', stdout=out)
+        self.assertIn('Deleted 3 read notifications', out.getvalue())
+        self.assertIn('before: 4 rows', out.getvalue())
+        self.assertIn('after: 1 rows', out.getvalue())
+        self.assertEqual(list(Notification.objects.values_list('title', flat=True)), ['Unread'])
+
+class TestSyncReplicaCommand(TransactionTestCase):
+    #The backup waits for the open write transaction of a TestCase to end
+    def test_sync_replica(self):
+        UserProfile.objects.create_user(username='user', password='testpassword', email='user@test.com')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'replica.sqlite3')
+            out = StringIO()
+            call_command('sync_replica', f'--replica={path}', stdout=out)
+            self.assertIn('synced', out.getvalue())
+            replica = sqlite3.connect(path)
+            try:
+                rows = replica.execute(f'SELECT username FROM {UserProfile._meta.db_table}').fetchall()
+            finally:
+                replica.close()
+        self.assertEqual(rows, [('user',)])
+
+    def test_sync_replica_not_configured(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_replica', stdout=StringIO())
+
+class TestGenerateImageDerivativesCommand(TestCase):
+    def test_generate_image_derivatives(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            teacher = UserProfile.objects.create_user(username='teacher', password='testpassword', email='teacher@test.com', is_teacher=True)
+            with open(os.path.join(settings.BASE_DIR, 'elearning_base', 'test_files', 'course1.jpg'), 'rb') as f:
+                #Uploaded before the copies were made on upload, the on commit task never runs in a TestCase
+                course = Course.objects.create(course_title='Course', description='Description', teacher=teacher)
+                course.course_img = SimpleUploadedFile('course1.jpg', f.read(), content_type='image/jpeg')
+                course.save()
+            out = StringIO()
+            call_command('generate_image_derivatives', stdout=out)
+            self.assertIn('Generated the copies of 1 images, 0 failed.', out.getvalue())
+            self.assertTrue(image_derivatives.has_derivatives(course.course_img))
+            #Only the images without copies, unless --all
+            call_command('generate_image_derivatives', stdout=out)
+            self.assertIn('Generated the copies of 0 images', out.getvalue())
+            call_command('generate_image_derivatives', '--all', stdout=out)
+            self.assertIn('Generated the copies of 1 images', out.getvalue().splitlines()[-1])
+
+class TestDiskUsageCommand(TestCase):
+    def test_disk_usage(self):
+        course_files = {'BACKEND': 'elearning_base.storage.ContentAddressedStorage'}
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, STORAGES={**settings.STORAGES, 'course_files': course_files}):
+            teacher = UserProfile.objects.create_user(username='teacher', password='testpassword', email='teacher@test.com', is_teacher=True)
+            course = Course.objects.create(course_title='Course', description='Description', teacher=teacher)
+            for i in range(3):
+                activity = CourseActivity.objects.create(course=course, activity_title=f'Activity {i}', description='Description')
+                CourseActivityMaterial.objects.create(course_activity=activity, material_title='Slides', description='Description', file=SimpleUploadedFile('slides.pdf', bytes(2048)))
+            out = StringIO()
+            call_command('disk_usage', stdout=out)
+            self.assertIn('blobs: 1, 2.0 KiB on disk', out.getvalue())
+            self.assertIn('saved: 4.0 KiB', out.getvalue())
+
+    def test_disk_usage_without_content_addressed_storage(self):
+        out = StringIO()
+        call_command('disk_usage', stdout=out)
+        self.assertIn('not content-addressed', out.getvalue())
+
+class TestRebuildGradebookCommand(TestCase):
+    def test_rebuild_gradebook(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            teacher = UserProfile.objects.create_user(username='teacher', password='testpassword', email='teacher@test.com', is_teacher=True)
+            student = UserProfile.objects.create_user(username='student', password='testpassword', email='student@test.com')
+            course = Course.objects.create(course_title='Course', description='Description', teacher=teacher)
+            activity = CourseActivity.objects.create(course=course, activity_title='Exam', description='Description')
+            #Graded before the gradebook was kept, the on commit refresh never runs in a TestCase
+            Submission.objects.create(student=student, course_activity=activity, grade=70, file=SimpleUploadedFile('exam.pdf', b'exam'))
+            out = StringIO()
+            call_command('rebuild_gradebook', stdout=out)
+            self.assertIn('Rebuilt the gradebook of 1 courses, 2 rows.', out.getvalue())
+            self.assertEqual(GradeSummary.objects.get(course_activity=activity).grade_max, 70)
+            #Rebuilt again rather than added to
+            call_command('rebuild_gradebook', course.course_id, stdout=out)
+            self.assertEqual(GradeSummary.objects.filter(course=course).count(), 2)
+
+    def test_rebuild_gradebook_nonexistent_course(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_gradebook', '999', stdout=StringIO())
@@ -8,7 +8,14 @@ from elearning_base.models import Course, Enrollments
 from channels.layers import get_channel_layer
 from asgiref.sync import sync_to_async
 from elearning_base.models import LobbyMessage
+from elearning_base.lobby_buffer import lobby_buffer, lifespan
+from elearning_base import lobby_history
+from django.core.cache import cache
+from asgiref.testing import ApplicationCommunicator
+from django.test import override_settings
 import asyncio
+from unittest import mock
+from django.db import OperationalError
 
 User = get_user_model()
 
@@ -41,22 +48,30 @@ class TestNotificationConsumer(TransactionTestCase):
         # Test student subscription to course-specific notifications
         channel_layer = get_channel_layer()
         user_group = f"user_notifications_{self.student.user_id}"
-        material_group = f"new_material_notifications_{self.course.course_id}"
-        activity_group = f"new_activity_notifications_{self.course.course_id}"
+        new_course = await sync_to_async(Course.objects.create)(course_title="New Course", teacher=self.teacher)
+        course_group = f"course_notifications_{new_course.course_id}"
         title = "Test Course"
         message = f"Test welcome message"
 
         await channel_layer.group_send(user_group, {
             "type": "dynamic.subscription", 
-            "material_group": material_group, 
-            "activity_group": activity_group,
+            "course_id": new_course.course_id,
             "title": title,
             "message": message
         })
 
         response = await communicator.receive_json_from()
-        self.assertEqual(response["material_group"], material_group)
-        self.assertEqual(response["activity_group"], activity_group)
+        self.assertEqual(response["course_group"], course_group)
+
+        # Now subscribed to the new course's broadcast group
+        await channel_layer.group_send(course_group, {
+            "type": "course.notification",
+            "course_id": new_course.course_id,
+            "message": "New activity added",
+            "title": "New Activity"
+        })
+        response = await communicator.receive_json_from()
+        self.assertEqual(response["message"], "New activity added")
 
         await communicator.disconnect()
 
@@ -69,9 +84,10 @@ class TestNotificationConsumer(TransactionTestCase):
         self.assertTrue(connected)
 
         channel_layer = get_channel_layer()
-        material_group = f"new_material_notifications_{self.course.course_id}_{self.student.user_id}"
-        await channel_layer.group_send(material_group, {
-            "type": "new.notification",
+        course_group = f"course_notifications_{self.course.course_id}"
+        await channel_layer.group_send(course_group, {
+            "type": "course.notification",
+            "course_id": self.course.course_id,
             "message": "New material added",
             "title": "New Material"
         })
@@ -79,6 +95,9 @@ class TestNotificationConsumer(TransactionTestCase):
         response = await communicator.receive_json_from()
         self.assertEqual(response["message"], "New material added")
         self.assertEqual(response["title"], "New Material")
+        # Followed by the unread count, counted by the consumer
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {"unread_count": 1})
 
         await communicator.disconnect()
     
@@ -91,9 +110,10 @@ class TestNotificationConsumer(TransactionTestCase):
         self.assertTrue(connected)
 
         channel_layer = get_channel_layer()
-        activity_group = f"new_activity_notifications_{self.course.course_id}_{self.student.user_id}"
-        await channel_layer.group_send(activity_group, {
-            "type": "new.notification",
+        course_group = f"course_notifications_{self.course.course_id}"
+        await channel_layer.group_send(course_group, {
+            "type": "course.notification",
+            "course_id": self.course.course_id,
             "message": "New activity added",
             "title": "New Activity"
         })
@@ -104,6 +124,66 @@ class TestNotificationConsumer(TransactionTestCase):
 
         await communicator.disconnect()
 
+    async def test_unread_count(self):
+        await self.asyncSetUp()
+        await sync_to_async(User.objects.filter(pk=self.student.pk).update)(unread_notifications=2)
+        # As loaded by the auth middleware
+        await sync_to_async(self.student.refresh_from_db)()
+        communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), f"ws/notifications/")
+        communicator.scope["user"] = self.student
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send(f"course_notifications_{self.course.course_id}", {
+            "type": "course.notification",
+            "course_id": self.course.course_id,
+            "message": "New activity added",
+            "title": "New Activity"
+        })
+        await communicator.receive_json_from()
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {"unread_count": 3})
+
+        # Notifications read elsewhere, the new count is sent to the user's group
+        await channel_layer.group_send(f"user_notifications_{self.student.user_id}", {"type": "unread.count", "count": 0})
+        response = await communicator.receive_json_from()
+        self.assertEqual(response, {"unread_count": 0})
+
+        await communicator.disconnect()
+
+    async def test_course_notification_filtered_for_blocked_student(self):
+        await self.asyncSetUp()
+        communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), f"ws/notifications/")
+        communicator.scope["user"] = self.student
+
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        # Blocking the enrollment whilst connected updates the consumer through the student's personal group
+        self.enrollment.blocked = True
+        await sync_to_async(self.enrollment.save)()
+
+        channel_layer = get_channel_layer()
+        course_group = f"course_notifications_{self.course.course_id}"
+        event = {
+            "type": "course.notification",
+            "course_id": self.course.course_id,
+            "message": "New activity added",
+            "title": "New Activity"
+        }
+        await channel_layer.group_send(course_group, event)
+        self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+
+        self.enrollment.blocked = False
+        await sync_to_async(self.enrollment.save)()
+        await channel_layer.group_send(course_group, event)
+        response = await communicator.receive_json_from()
+        self.assertEqual(response["message"], "New activity added")
+
+        await communicator.disconnect()
+
 class TestChatConsumer(TransactionTestCase):
     async def asyncSetUp(self):
         self.student = await sync_to_async(User.objects.create_user)(username="test_student", password="test_password", email="test_student@test.com", is_teacher=False)
@@ -275,3 +355,114 @@ class TestChatConsumer(TransactionTestCase):
 
 
 
+class TestLobbyMessageBuffer(TransactionTestCase):
+    async def asyncSetUp(self):
+        #Messages and retries left behind by a failed test
+        lobby_buffer.take()
+        lobby_buffer.retries = 0
+        await sync_to_async(cache.clear)()
+        self.student = await sync_to_async(User.objects.create_user)(username="test_student", password="test_password", email="test_student@test.com", is_teacher=False)
+        self.lobby_communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), f"ws/lobby/")
+        self.lobby_communicator.scope["user"] = self.student
+        self.notifications_communicator = WebsocketCommunicator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)), f"ws/notifications/")
+        self.notifications_communicator.scope["user"] = self.student
+        await self.lobby_communicator.connect()
+        await self.notifications_communicator.connect()
+
+    async def asyncTearDown(self):
+        await self.lobby_communicator.disconnect()
+        await self.notifications_communicator.disconnect()
+
+    async def send_messages(self, *messages):
+        for message in messages:
+            await self.lobby_communicator.send_json_to({"message": message})
+            response = await self.lobby_communicator.receive_json_from()
+            self.assertEqual(response["message"], message)
+
+    def saved_messages(self):
+        return sync_to_async(lambda: list(LobbyMessage.objects.order_by('created_at').values_list('message', flat=True)))()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_FLUSH_INTERVAL=60)
+    async def test_broadcast_before_write(self):
+        await self.asyncSetUp()
+        #Lobby history loaded, pushes to a history which has not been loaded yet are dropped
+        await sync_to_async(lobby_history.latest)(2)
+        await self.send_messages("First", "Second")
+        #Broadcast and in the lobby history, but not written yet
+        self.assertEqual(await self.saved_messages(), [])
+        self.assertEqual(lobby_buffer.depth, 2)
+        latest = await sync_to_async(lobby_history.latest)(2)
+        self.assertEqual([message["message"] for message in latest], ["Second", "First"])
+
+        await lobby_buffer.flush()
+        self.assertEqual(await self.saved_messages(), ["First", "Second"])
+        self.assertEqual(lobby_buffer.depth, 0)
+        #One ping for the batch
+        response = await self.notifications_communicator.receive_json_from()
+        self.assertEqual(response["message"], "New message in the public lobby")
+        self.assertTrue(await self.notifications_communicator.receive_nothing())
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_MAX_SIZE=3, LOBBY_BUFFER_FLUSH_INTERVAL=60)
+    async def test_flush_on_size(self):
+        await self.asyncSetUp()
+        await self.send_messages("First", "Second", "Third")
+        await self.notifications_communicator.receive_json_from()
+        self.assertEqual(await self.saved_messages(), ["First", "Second", "Third"])
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_FLUSH_INTERVAL=0.1)
+    async def test_flush_on_interval(self):
+        await self.asyncSetUp()
+        await self.send_messages("First")
+        await self.notifications_communicator.receive_json_from(timeout=2)
+        self.assertEqual(await self.saved_messages(), ["First"])
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_FLUSH_INTERVAL=60)
+    async def test_flush_on_shutdown(self):
+        await self.asyncSetUp()
+        await self.send_messages("First")
+        lifespan_communicator = ApplicationCommunicator(lifespan, {"type": "lifespan"})
+        await lifespan_communicator.send_input({"type": "lifespan.startup"})
+        self.assertEqual(await lifespan_communicator.receive_output(), {"type": "lifespan.startup.complete"})
+        await lifespan_communicator.send_input({"type": "lifespan.shutdown"})
+        self.assertEqual(await lifespan_communicator.receive_output(), {"type": "lifespan.shutdown.complete"})
+        self.assertEqual(await self.saved_messages(), ["First"])
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_FLUSH_INTERVAL=0.05)
+    async def test_failed_write_retried(self):
+        await self.asyncSetUp()
+        write, calls = lobby_buffer.write, []
+        def fail_once(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            write(batch)
+        with mock.patch.object(lobby_buffer, 'write', side_effect=fail_once):
+            await self.send_messages("First")
+            #No other message arrives, the retry timer writes it
+            await self.notifications_communicator.receive_json_from(timeout=2)
+        self.assertEqual(await self.saved_messages(), ["First"])
+        self.assertEqual((lobby_buffer.depth, lobby_buffer.retries), (0, 0))
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=True, LOBBY_BUFFER_FLUSH_INTERVAL=60, LOBBY_BUFFER_MAX_PENDING=2)
+    async def test_pending_capped(self):
+        await self.asyncSetUp()
+        await self.send_messages("First", "Second", "Third")
+        with mock.patch.object(lobby_buffer, 'write', side_effect=OperationalError('database is locked')):
+            await lobby_buffer.flush()
+        #The oldest dropped
+        self.assertEqual([lobby_message.message for lobby_message in lobby_buffer.pending], ["Second", "Third"])
+        lobby_buffer.timer.cancel()
+        await self.asyncTearDown()
+
+    @override_settings(LOBBY_WRITE_BEHIND=False)
+    async def test_write_through(self):
+        await self.asyncSetUp()
+        await self.send_messages("First")
+        self.assertEqual(await self.saved_messages(), ["First"])
+        self.assertEqual(lobby_buffer.depth, 0)
+        await self.asyncTearDown()
@@ -0,0 +1,114 @@
+import json
+import re
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+from django.contrib.auth import get_user_model
+from ..models import Notification, StatusUpdate
+from ..db_router import STICKY_COOKIE
+
+User = get_user_model()
+
+def parse_server_timing(header):
+    #{'db': {'dur': '1.2', 'desc': '"3 queries"'}, ...}
+    metrics = {}
+    for metric in header.split(', '):
+        name, *params = metric.split(';')
+        metrics[name] = dict(param.split('=', 1) for param in params)
+    return metrics
+
+class TestServerTimingMiddleware(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        Notification.objects.create(recipient=self.user, title='Notification', message='Message')
+        self.client.force_authenticate(user=self.user)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_api_request_timings(self):
+        with self.assertLogs('elearning_base.middleware', level='INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_notifications', kwargs={'user_id': self.user.user_id}))
+        self.assertEqual(response.status_code, 200)
+        metrics = parse_server_timing(response['Server-Timing'])
+        self.assertEqual(set(metrics), {'total', 'db', 'service', 'serializer'})
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries)} queries"')
+        self.assertLessEqual(float(metrics['service']['dur']), float(metrics['total']['dur']))
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], reverse('get_notifications', kwargs={'user_id': self.user.user_id}))
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], len(queries))
+        self.assertIn('serializer_ms', line)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+    def test_view_request_timings(self):
+        self.client.login(username='student', password='testpassword')
+        with self.assertLogs('elearning_base.middleware', level='INFO'):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(re.search(r'template;dur=[\d.]+', response['Server-Timing']))
+        self.assertIn('service', parse_server_timing(response['Server-Timing']))
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0)
+    def test_unsampled_request(self):
+        with self.assertNoLogs('elearning_base.middleware', level='INFO'):
+            response = self.client.get(reverse('get_notifications', kwargs={'user_id': self.user.user_id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+@override_settings(DATABASE_REPLICA='replica')
+class TestReplicaRouting(APITransactionTestCase):
+    #The replica mirrors the test database, the queries are told apart by the connection they are sent to. Without the
+    #transaction of a TestCase, which the mirror connection can't read past on SQLite
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        StatusUpdate.objects.create(user=self.user, status='Status')
+        self.client.force_login(self.user)
+        self.url = reverse('get_status_updates', kwargs={'user_id': self.user.user_id})
+
+    def capture(self, method, url, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            response = getattr(self.client, method)(url, **kwargs)
+        tables = lambda queries: {table for query in queries.captured_queries for table in re.findall(r'FROM "(\w+)"', query['sql'])}
+        return response, tables(primary), tables(replica)
+
+    def test_reads_go_to_replica(self):
+        response, primary, replica = self.capture('get', self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('elearning_base_statusupdate', replica)
+        self.assertNotIn('elearning_base_statusupdate', primary)
+        #Sessions are always read from the primary
+        self.assertIn('django_session', primary)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_sticky_to_primary_after_write(self):
+        response, primary, replica = self.capture('post', reverse('create_status_update'), data={'status': 'New status'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(replica)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        #The client's next read is served by the primary, which has its write
+        response, primary, replica = self.capture('get', self.url)
+        self.assertIn('elearning_base_statusupdate', primary)
+        self.assertFalse(replica)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_reads_after_write_in_request_go_to_primary(self):
+        #mark_notifications_read is not a replica view, the router is used directly
+        from ..db_router import PrimaryReplicaRouter, replica_reads
+        router = PrimaryReplicaRouter()
+        token = replica_reads.set(True)
+        try:
+            self.assertEqual(router.db_for_read(StatusUpdate), 'replica')
+            self.assertEqual(router.db_for_write(StatusUpdate), 'default')
+            self.assertEqual(router.db_for_read(StatusUpdate), 'default')
+        finally:
+            replica_reads.reset(token)
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_without_replica(self):
+        response, primary, replica = self.capture('get', self.url)
+        self.assertIn('elearning_base_statusupdate', primary)
+        self.assertFalse(replica)
@@ -1,5 +1,5 @@
-from django.test import TestCase
-from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.db import IntegrityError, connection, transaction
 from ..models import *
 from datetime import date, datetime
 from django.core.files.uploadedfile import SimpleUploadedFile
@@ -9,6 +9,11 @@ from django.utils import timezone
 from django.conf import settings
 import os
 import shutil
+import hashlib
+import tempfile
+from decimal import Decimal
+from unittest import mock
+from .. import gradebook
 
 # Create common objects for testing
 def create_common_objects():
@@ -351,6 +356,113 @@ class TestCourseActivityMaterial(TestCase):
             #full_clean enforces field level validation and not only custom implemented clean methods
             self.material.full_clean()
 
+#Test for the content-addressed course files storage
+@override_settings(STORAGES={**settings.STORAGES, 'course_files': {'BACKEND': 'elearning_base.storage.ContentAddressedStorage'}})
+class TestContentAddressedStorage(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        teacher, _ = create_common_objects()
+        course = Course.objects.create(course_title='Course1', description='This is course 1', teacher=teacher)
+        self.lecture1 = CourseActivity.objects.create(course=course, activity_title='Lecture 1', description='This is lecture 1')
+        self.lecture2 = CourseActivity.objects.create(course=course, activity_title='Lecture 2', description='This is lecture 2')
+
+    def create_material(self, activity, name, content):
+        return CourseActivityMaterial.objects.create(material_title=name, description='Description', course_activity=activity,
+                                                     file=SimpleUploadedFile(name, content, content_type='application/pdf'))
+
+    def test_same_content_stored_once(self):
+        material1 = self.create_material(self.lecture1, 'slides.pdf', b'slides')
+        material2 = self.create_material(self.lecture2, 'Slides copy.PDF', b'slides')
+        digest = hashlib.sha256(b'slides').hexdigest()
+        self.assertEqual(material1.file.name, f'blobs/{digest[:2]}/{digest}.pdf')
+        self.assertEqual(material2.file.name, material1.file.name)
+        self.assertEqual(os.listdir(os.path.join(self.media_root.name, 'blobs', digest[:2])), [f'{digest}.pdf'])
+        with material2.file.open('rb') as f:
+            self.assertEqual(f.read(), b'slides')
+
+    def test_different_content_stored_separately(self):
+        material1 = self.create_material(self.lecture1, 'slides.pdf', b'slides')
+        material2 = self.create_material(self.lecture1, 'notes.pdf', b'notes')
+        self.assertNotEqual(material1.file.name, material2.file.name)
+        #No temporary files are left behind
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root.name, 'blobs'))), sorted({material1.file.name[6:8], material2.file.name[6:8]}))
+
+#Test for the gradebook summaries kept from the submissions
+class TestGradeSummary(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.teacher, self.student = create_common_objects()
+        self.other_student = UserProfile.objects.create(username='student2', email='student2@gmail.com', is_teacher=False)
+        self.course = Course.objects.create(course_title='Course1', description='This is course 1', teacher=self.teacher)
+        self.exam = CourseActivity.objects.create(course=self.course, activity_title='Exam', description='Exam', activity_type='ASSIGNMENT')
+        self.essay = CourseActivity.objects.create(course=self.course, activity_title='Essay', description='Essay', activity_type='ASSIGNMENT')
+
+    def submit(self, student, activity, grade=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Submission.objects.create(student=student, course_activity=activity, grade=grade, file=SimpleUploadedFile('answer.pdf', b'answer'))
+
+    def summary(self, **kwargs):
+        return GradeSummary.objects.get(course=self.course, **kwargs)
+
+    def test_summaries_follow_submissions(self):
+        self.submit(self.student, self.exam, 80)
+        self.submit(self.other_student, self.exam, 61)
+        self.submit(self.student, self.essay)
+        exam = self.summary(course_activity=self.exam)
+        self.assertEqual((exam.submissions, exam.graded, exam.grade_min, exam.grade_max, exam.grade_average), (2, 2, 61, 80, Decimal('70.5')))
+        student = self.summary(student=self.student)
+        self.assertEqual((student.submissions, student.graded, student.grade_average), (2, 1, 80))
+        self.assertEqual(self.summary(course_activity=self.essay).grade_average, None)
+
+    def test_regrade_and_delete(self):
+        best = self.submit(self.student, self.exam, 90)
+        self.submit(self.other_student, self.exam, 50)
+        with self.captureOnCommitCallbacks(execute=True):
+            best.grade = 40
+            best.save()
+        self.assertEqual(self.summary(course_activity=self.exam).grade_max, 50)
+        with self.captureOnCommitCallbacks(execute=True):
+            best.delete()
+        self.assertEqual(self.summary(course_activity=self.exam).grade_min, 50)
+        self.assertFalse(GradeSummary.objects.filter(student=self.student).exists())
+
+    def test_one_refresh_per_transaction(self):
+        with mock.patch('elearning_base.gradebook.refresh', wraps=gradebook.refresh) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for grade in (10, 20, 30):
+                        Submission.objects.create(student=self.student, course_activity=self.exam, grade=grade, file=SimpleUploadedFile('answer.pdf', b'answer'))
+        refresh.assert_called_once_with(self.course.course_id, {self.exam.activity_id}, {self.student.user_id})
+        self.assertEqual(self.summary(course_activity=self.exam).grade_average, 20)
+        #Left over by a rolled back transaction, refreshed with the next one
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Submission.objects.create(student=self.other_student, course_activity=self.essay, grade=50, file=SimpleUploadedFile('answer.pdf', b'answer'))
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            Submission.objects.create(student=self.student, course_activity=self.essay, grade=70, file=SimpleUploadedFile('answer.pdf', b'answer'))
+        self.assertEqual(self.summary(course_activity=self.essay).grade_average, 70)
+        self.assertFalse(GradeSummary.objects.filter(student=self.other_student).exists())
+
+    def test_activity_deleted(self):
+        self.submit(self.student, self.exam, 80)
+        self.submit(self.student, self.essay, 60)
+        exam_id = self.exam.activity_id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.exam.delete()
+        self.assertFalse(GradeSummary.objects.filter(course_activity_id=exam_id).exists())
+        self.assertEqual(self.summary(student=self.student).grade_average, 60)
+
 #Test for Submission
 class TestSubmission(TestCase):
     @classmethod
@@ -448,4 +560,16 @@ class TestStatusUpdate(TestCase):
         self.assertEqual(str(self.status_update), str(self.status_update.status_id))
 
     def test_auto_set_timestamps(self):
-        self.assertTrue(self.status_update.created_at <= timezone.now())
\ No newline at end of file
+        self.assertTrue(self.status_update.created_at <= timezone.now())
+
+class TestSQLitePragmas(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        #journal_mode is not checked, the test database is in memory
+        self.assertEqual(self.pragma('synchronous'), 1)
+        self.assertEqual(self.pragma('busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma('cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
@@ -0,0 +1,88 @@
+import itertools
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from django.contrib.auth import get_user_model
+from ..models import StatusUpdate, Course, CourseActivity, CourseActivityMaterial, Enrollments, Notification, Feedback, LobbyMessage
+from .. import search
+
+User = get_user_model()
+
+#Regression tests for N+1 queries in the list endpoints.
+#Each endpoint is requested with a small and a larger data set, the number of queries must be the same for both
+#(the nested serializers must not query per row) and stay under the endpoint's ceiling.
+class TestListEndpointQueryCounts(APITestCase):
+    def setUp(self):
+        self.counter = itertools.count()
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.student = User.objects.create_user(username='student', password='testpassword', email="student@test.com", is_teacher=False)
+        self.course = Course.objects.create(course_title='Course 1', description='Description 1', teacher=self.teacher)
+        Enrollments.objects.bulk_create([Enrollments(course=self.course, student=self.student)])
+
+    def add_rows(self, n):
+        #Rows are bulk created so no signals (notifications, search indexing) fire, each row gets its own related objects
+        ids = [next(self.counter) for _ in range(n)]
+        teachers = User.objects.bulk_create([User(username=f'searchable_teacher_{i}', email=f'teacher_{i}@test.com', is_teacher=True) for i in ids])
+        students = User.objects.bulk_create([User(username=f'searchable_student_{i}', email=f'student_{i}@test.com') for i in ids])
+        courses = Course.objects.bulk_create([Course(course_title=f'Searchable {i}', description='Description', teacher=teacher) for i, teacher in zip(ids, teachers)])
+        Course.objects.bulk_create([Course(course_title=f'Taught {i}', description='Description', teacher=self.teacher) for i in ids])
+        Enrollments.objects.bulk_create(
+            [Enrollments(course=course, student=self.student) for course in courses] +
+            [Enrollments(course=self.course, student=student) for student in students]
+        )
+        Feedback.objects.bulk_create([Feedback(course=self.course, student=student, feedback='Feedback') for student in students])
+        StatusUpdate.objects.bulk_create([StatusUpdate(user=self.student, status=f'Status {i}') for i in ids])
+        Notification.objects.bulk_create([Notification(recipient=self.student, title=f'Notification {i}', message='Message') for i in ids])
+        LobbyMessage.objects.bulk_create([LobbyMessage(user=student, message='Message') for student in students])
+        activities = CourseActivity.objects.bulk_create([CourseActivity(course=self.course, activity_title=f'Activity {i}', description='Description') for i in ids])
+        CourseActivityMaterial.objects.bulk_create([
+            CourseActivityMaterial(course_activity=activity, material_title=f'Material {j}', description='Description', video_link='https://example.com')
+            for activity in activities for j in range(2)
+        ])
+        search.rebuild_index()
+
+    def assertQueryCountConstant(self, url, user, ceiling):
+        self.client.force_authenticate(user=user)
+        self.add_rows(2)
+        #Bulk created rows don't invalidate cached data (activity_cache.py), each request builds its payload
+        cache.clear()
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.add_rows(25)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(small), len(large), [query['sql'] for query in large.captured_queries])
+        self.assertLessEqual(len(large), ceiling)
+
+    def test_get_status_updates(self):
+        self.assertQueryCountConstant(reverse('get_status_updates', kwargs={'user_id': self.student.user_id}), self.student, 2)
+
+    def test_get_enrolled_courses(self):
+        self.assertQueryCountConstant(reverse('get_enrolled_courses', kwargs={'user_id': self.student.user_id}), self.student, 2)
+
+    def test_get_courses_taught(self):
+        self.assertQueryCountConstant(reverse('get_courses_taught', kwargs={'user_id': self.teacher.user_id}), self.teacher, 2)
+
+    def test_get_search_results(self):
+        #Search then load of the ranked ids, per category
+        self.assertQueryCountConstant(reverse('get_search_results', kwargs={'search_query': 'searchable'}), self.teacher, 6)
+
+    def test_get_course_activities(self):
+        self.assertQueryCountConstant(reverse('get_course_activities_with_materials', kwargs={'course_id': self.course.course_id}), self.teacher, 3)
+
+    def test_get_course_feedback(self):
+        self.assertQueryCountConstant(reverse('get_course_feedback', kwargs={'course_id': self.course.course_id}), self.student, 2)
+
+    def test_get_enrolled_students(self):
+        self.assertQueryCountConstant(reverse('get_enrolled_students', kwargs={'course_id': self.course.course_id}), self.teacher, 2)
+
+    def test_get_notifications(self):
+        self.assertQueryCountConstant(reverse('get_notifications', kwargs={'user_id': self.student.user_id}), self.student, 2)
+
+    def test_get_latest_lobby_messages(self):
+        self.assertQueryCountConstant(reverse('get_latest_lobby_messages'), self.student, 1)
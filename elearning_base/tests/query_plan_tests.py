@@ -0,0 +1,226 @@
+import json
+import re
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from ..models import Course, CourseActivity, CourseActivityMaterial, Enrollments, LobbyMessage, Notification, StatusUpdate
+from ..consumers import NotificationConsumer
+from ..pagination import encode_cursor
+from ..tasks import send_enrollment_notification, send_new_activity_notification, send_new_material_notification, trim_lobby_messages, purge_notifications, expire_uploads, send_bulk_enrollment_notification, push_enrollment_notification, push_course_subscriptions
+from .. import media, grading, gradebook, enrollment_import
+
+User = get_user_model()
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+#Regression tests for the query plans of the hot queries.
+#The pages, endpoints, tasks and consumer queries are run against a seeded data set, and every statement they send to the
+#database is explained (EXPLAIN QUERY PLAN on SQLite, EXPLAIN with sequential scans and sorts disabled on PostgreSQL, so
+#the plan shows whether an index could be used rather than what is cheapest for a small table).
+#A statement fails the test when it reads a whole table (other than through an index, in its order) or sorts its rows -
+#a missing index, which goes unnoticed on a small database and grows with the table.
+#The full-text search statements (search.py) are not checked, ranking the FTS matches is a sort by design.
+
+SEEDED_DATASET = {
+    'users': 200, 'courses': 20, 'activities_per_course': 3, 'notifications_per_user': 5, 'status_updates_per_user': 2,
+    'lobby_messages': 50, 'stdout': StringIO(),
+}
+
+#Statements of these tables are not checked - sessions, auth and contenttypes are looked up by key, the FTS tables by MATCH,
+#the schema and dbstat are read for the table size report of the notification retention (notification_retention.py)
+IGNORED_TABLES = re.compile(r'^(django_|auth_|sqlite_|dbstat$|elearning_base_\w*_fts)')
+STATEMENT = re.compile(r'^\s*(SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+def explain(sql):
+    #The steps of the statement's plan as text
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            steps, nodes = [], [plan[0]['Plan']]
+            while nodes:
+                node = nodes.pop()
+                steps.append(f"{node['Node Type']} {node.get('Relation Name', '')}".strip())
+                nodes.extend(node.get('Plans', []))
+            return steps
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+def plan_problems(steps):
+    if connection.vendor == 'postgresql':
+        return [step for step in steps if step.startswith(('Seq Scan', 'Sort', 'Incremental Sort'))]
+    #SCAN <table> reads the whole table, SCAN <table> USING INDEX reads it in index order (a LIMIT stops it early)
+    return [step for step in steps if (step.startswith('SCAN ') and ' USING ' not in step) or 'TEMP B-TREE' in step]
+
+def checked_statement(sql):
+    if not STATEMENT.match(sql):
+        return False
+    tables = re.findall(r'(?:FROM|JOIN|UPDATE)\s+"?(\w+)"?', sql, re.IGNORECASE)
+    return any(not IGNORED_TABLES.match(table) for table in tables)
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestQueryPlans(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', '--end-date=2024-06-01', prefix='plan', **SEEDED_DATASET)
+        #The most popular course, one of its students and its teacher
+        cls.course = Course.objects.annotate(enrollment_count=Count('enrollments')).order_by('-enrollment_count', 'course_id').first()
+        cls.enrollment = Enrollments.objects.filter(course=cls.course).order_by('enrollment_id').first()
+        cls.student = cls.enrollment.student
+        cls.teacher = cls.course.teacher
+        cls.activity = CourseActivity.objects.filter(course=cls.course).order_by('activity_id').first()
+        cls.material = CourseActivityMaterial.objects.filter(course_activity=cls.activity).order_by('material_id').first()
+        cls.notification = Notification.objects.filter(recipient=cls.student).order_by('notification_id').first()
+
+    def setUp(self):
+        cache.clear()
+
+    def assertPlansUseIndexes(self, queries):
+        checked = 0
+        for query in queries.captured_queries:
+            if not checked_statement(query['sql']):
+                continue
+            checked += 1
+            steps = explain(query['sql'])
+            with self.subTest(sql=query['sql']):
+                self.assertEqual(plan_problems(steps), [], steps)
+        self.assertGreater(checked, 0)
+
+    def capture_requests(self, user, urls):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            for url in urls:
+                response = self.client.get(url)
+                self.assertLess(response.status_code, 400, url)
+        return queries
+
+    def test_student_pages(self):
+        student, course = self.student, self.course
+        queries = self.capture_requests(student, [
+            reverse('home'),
+            reverse('user_profile', kwargs={'user_id': self.teacher.user_id}),
+            reverse('course_page', kwargs={'course_id': course.course_id}),
+            reverse('enrolled_taught_courses'),
+            reverse('notifications'),
+            reverse('lobby'),
+            reverse('get_available_courses'),
+        ])
+        self.assertPlansUseIndexes(queries)
+
+    def test_teacher_pages(self):
+        queries = self.capture_requests(self.teacher, [
+            reverse('home'),
+            reverse('course_page', kwargs={'course_id': self.course.course_id}),
+            reverse('enrolled_taught_courses'),
+            reverse('enrolled_students', kwargs={'course_id': self.course.course_id}),
+        ])
+        self.assertPlansUseIndexes(queries)
+
+    def test_student_endpoints(self):
+        student, course = self.student, self.course
+        urls = [
+            reverse('get_user_api', kwargs={'user_id': student.user_id}),
+            reverse('get_status_updates', kwargs={'user_id': student.user_id}),
+            reverse('get_enrolled_courses', kwargs={'user_id': student.user_id}),
+            reverse('get_course_activities_with_materials', kwargs={'course_id': course.course_id}),
+            reverse('get_course_feedback', kwargs={'course_id': course.course_id}),
+            reverse('get_notifications', kwargs={'user_id': student.user_id}),
+            reverse('get_latest_lobby_messages'),
+            reverse('get_lobby_history'),
+        ]
+        #Second pages, fetched from a cursor
+        status_update = StatusUpdate.objects.filter(user=student).order_by('-created_at', '-pk').first()
+        urls.append(reverse('get_status_updates', kwargs={'user_id': student.user_id}) + f"?cursor={encode_cursor(status_update, 'created_at')}")
+        lobby_message = LobbyMessage.objects.order_by('-created_at', '-pk')[10]
+        urls.append(reverse('get_lobby_history') + f"?cursor={encode_cursor(lobby_message, 'created_at')}")
+        self.assertPlansUseIndexes(self.capture_requests(student, urls))
+
+    def test_teacher_endpoints(self):
+        teacher, course = self.teacher, self.course
+        queries = self.capture_requests(teacher, [
+            reverse('get_courses_taught', kwargs={'user_id': teacher.user_id}),
+            reverse('get_enrolled_students', kwargs={'course_id': course.course_id}),
+            reverse('get_course_feedback', kwargs={'course_id': course.course_id}),
+            reverse('get_gradebook', kwargs={'course_id': course.course_id}),
+        ])
+        self.assertPlansUseIndexes(queries)
+
+    def test_notification_updates(self):
+        self.client.force_login(self.student)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.patch(reverse('update_notification_read', kwargs={'notification_id': self.notification.notification_id}))
+            self.client.post(reverse('mark_notifications_read'), {'notification_ids': [self.notification.notification_id]}, content_type='application/json')
+            self.client.post(reverse('mark_notifications_read'), {}, content_type='application/json')
+        self.assertPlansUseIndexes(queries)
+
+    def test_media_access(self):
+        activity, digest = self.activity, '3f' * 32
+        with CaptureQueriesContext(connection) as queries:
+            for user in (self.student, self.teacher):
+                media.can_access(user, f'course_files/course_{self.course.course_id}/activity_{activity.activity_id}/files/slides.pdf')
+                media.can_access(user, f'submissions/user_{self.student.user_id}/activity_{activity.activity_id}/answer.pdf')
+                media.can_access(user, f'blobs/3f/{digest}.thumbnail.webp')
+        self.assertPlansUseIndexes(queries)
+
+    def test_bulk_grading(self):
+        rows = [{'student': enrollment.student.username, 'grade': 80} for enrollment in Enrollments.objects.filter(course=self.course)]
+        rows.append({'submission_id': 1, 'grade': 80})
+        with CaptureQueriesContext(connection) as queries:
+            grading.apply_grades(self.activity, rows)
+        self.assertPlansUseIndexes(queries)
+
+    def test_gradebook_refresh(self):
+        with CaptureQueriesContext(connection) as queries:
+            gradebook.refresh(self.course.course_id, {self.activity.activity_id}, {self.student.user_id})
+            pending = gradebook.PendingRefresh()
+            pending.activities[self.activity.activity_id].add(self.student.user_id)
+            pending()
+        self.assertPlansUseIndexes(queries)
+
+    def test_enrollment_import(self):
+        usernames = list(User.objects.filter(is_teacher=False).order_by('user_id').values_list('username', flat=True)[:600]) + ['missing']
+        with mock.patch('elearning_base.enrollment_import.send_bulk_enrollment_notification.delay'), CaptureQueriesContext(connection) as queries:
+            enrollment_import.enroll(self.course, usernames)
+        self.assertPlansUseIndexes(queries)
+
+    def test_tasks(self):
+        with CaptureQueriesContext(connection) as queries:
+            send_enrollment_notification(self.enrollment.enrollment_id)
+            send_bulk_enrollment_notification(self.course.course_id, [self.student.user_id])
+            push_enrollment_notification(self.teacher.user_id, 'Title', 'Message')
+            push_course_subscriptions(self.course.course_id, [self.student.user_id])
+            send_new_activity_notification(self.activity.activity_id)
+            send_new_material_notification(self.material.material_id)
+            trim_lobby_messages()
+            purge_notifications()
+            expire_uploads()
+        self.assertPlansUseIndexes(queries)
+
+    def test_signals(self):
+        #The notification tasks are run directly in test_tasks
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'), mock.patch('elearning_base.signals.send_enrollment_notification.delay'):
+            with CaptureQueriesContext(connection) as queries:
+                activity = CourseActivity.objects.create(course=self.course, activity_title='Plan activity', description='Description')
+                activity.delete()
+                self.enrollment.blocked = True
+                self.enrollment.save()
+                LobbyMessage.objects.create(user=self.student, message='Plan message')
+        self.assertPlansUseIndexes(queries)
+
+    def test_consumers(self):
+        consumer = NotificationConsumer()
+        consumer.scope = {'user': self.student}
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(consumer.get_users_and_courses)()
+        self.assertPlansUseIndexes(queries)
@@ -0,0 +1,366 @@
+import json, os, tempfile
+from unittest import mock
+from celery.exceptions import Retry
+from django.test import TestCase, override_settings
+from django.db import connection
+from django.contrib.auth import get_user_model
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from ..models import Course, Enrollments, CourseActivity, CourseActivityMaterial, Notification, LobbyMessage, Upload
+from ..serializers import UserProfileSerializer
+from .. import uploads, storage
+from ..tasks import broadcast_course_notification, send_enrollment_notification, send_bulk_enrollment_notification, push_enrollment_notification, push_course_subscriptions, send_new_activity_notification, send_new_material_notification, trim_lobby_messages, purge_notifications, generate_image_derivatives, expire_uploads, collect_blobs
+
+User = get_user_model()
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class TestCourseNotificationFanOut(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        self.course = Course.objects.create(course_title='Course 1', description='Description 1', teacher=self.teacher)
+        self.students = User.objects.bulk_create([
+            User(username=f'student{i}', email=f'student{i}@test.com') for i in range(5)
+        ])
+        #Bulk created so that no enrollment notification tasks are enqueued
+        Enrollments.objects.bulk_create([Enrollments(course=self.course, student=student) for student in self.students])
+
+    def test_one_task_enqueued_per_new_activity(self):
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay') as delay:
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+        delay.assert_called_once_with(activity.activity_id)
+
+    def test_one_task_enqueued_per_new_material(self):
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+        with mock.patch('elearning_base.signals.send_new_material_notification.delay') as delay:
+            material = CourseActivityMaterial.objects.create(course_activity=activity, material_title='Material 1', description='Description 1', video_link='https://example.com')
+        delay.assert_called_once_with(material.material_id)
+
+    def test_activity_notification_fan_out(self):
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+
+        channel_layer = get_channel_layer()
+        student = self.students[0]
+        group_name = f"course_notifications_{self.course.course_id}"
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(group_name, channel_name)
+
+        with mock.patch('elearning_base.tasks.broadcast_course_notification.delay') as delay:
+            notified = send_new_activity_notification(activity.activity_id)
+
+        self.assertEqual(notified, len(self.students))
+        self.assertEqual(Notification.objects.filter(title='New Activity').count(), len(self.students))
+        self.assertEqual(Notification.objects.get(recipient=student).message, "New activity Activity 1 added course 'Course 1'")
+        #A single broadcast to the course group, by its own task
+        delay.assert_called_once_with(self.course.course_id, 'New Activity', "New activity Activity 1 added course 'Course 1'")
+        broadcast_course_notification(*delay.call_args.args)
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual(event['type'], 'course.notification')
+        self.assertEqual(event['course_id'], self.course.course_id)
+        self.assertEqual(event['title'], 'New Activity')
+
+    def test_failed_broadcast_not_fanned_out_again(self):
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+
+        with mock.patch('elearning_base.tasks.broadcast_course_notification.delay'):
+            send_new_activity_notification(activity.activity_id)
+        #The broadcast task retries on its own, the rows were inserted and counted once
+        with mock.patch('elearning_base.tasks.get_channel_layer', side_effect=ConnectionError), self.assertRaises(Retry):
+            broadcast_course_notification.apply(args=(self.course.course_id, 'New Activity', 'Message'), throw=True)
+        self.assertEqual(Notification.objects.filter(title='New Activity').count(), len(self.students))
+        self.assertEqual(User.objects.get(pk=self.students[0].pk).unread_notifications, 1)
+
+    def test_fan_out_unread_counts(self):
+        Enrollments.objects.filter(student=self.students[0]).update(blocked=True)
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+
+        send_new_activity_notification(activity.activity_id)
+        counts = dict(User.objects.filter(pk__in=[student.pk for student in self.students]).values_list('pk', 'unread_notifications'))
+        self.assertEqual(counts, {student.pk: 0 if student == self.students[0] else 1 for student in self.students})
+
+    def test_enrollment_notification_unread_count(self):
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"user_notifications_{self.teacher.user_id}", channel_name)
+        enrollment = Enrollments.objects.get(student=self.students[0])
+
+        with mock.patch('elearning_base.tasks.push_enrollment_notification.delay') as push_notification, \
+             mock.patch('elearning_base.tasks.push_course_subscriptions.delay') as push_subscriptions:
+            send_enrollment_notification(enrollment.enrollment_id)
+        self.teacher.refresh_from_db()
+        self.assertEqual(self.teacher.unread_notifications, 1)
+        push_subscriptions.assert_called_once_with(self.course.course_id, [self.students[0].user_id])
+        #A failed push retries on its own, the notification was created and counted once
+        with mock.patch('elearning_base.tasks.get_channel_layer', side_effect=ConnectionError), self.assertRaises(Retry):
+            push_enrollment_notification.apply(args=push_notification.call_args.args, throw=True)
+        self.assertEqual(Notification.objects.filter(recipient=self.teacher).count(), 1)
+        push_enrollment_notification(*push_notification.call_args.args)
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual(event, {'type': 'unread.count', 'count': 1})
+
+    def test_bulk_enrollment_notification(self):
+        channel_layer = get_channel_layer()
+        teacher_channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f"enrollment_notifications_{self.teacher.user_id}", teacher_channel)
+        student_channels = [async_to_sync(channel_layer.new_channel)() for student in self.students]
+        for student, channel_name in zip(self.students, student_channels):
+            async_to_sync(channel_layer.group_add)(f"user_notifications_{student.user_id}", channel_name)
+
+        student_ids = [student.user_id for student in self.students]
+        #The course, the named students, the notification and the teacher's count (in a savepoint)
+        with self.assertNumQueries(6), \
+             mock.patch('elearning_base.tasks.push_enrollment_notification.delay') as push_notification, \
+             mock.patch('elearning_base.tasks.push_course_subscriptions.delay') as push_subscriptions:
+            send_bulk_enrollment_notification(self.course.course_id, student_ids)
+        #One notification for all of the students
+        notification = Notification.objects.get(recipient=self.teacher)
+        self.assertEqual(notification.message, "5 new enrollments for course Course 1 - student0, student1, student2, student3, student4")
+        self.teacher.refresh_from_db()
+        self.assertEqual(self.teacher.unread_notifications, 1)
+        #The pushes, by their own tasks
+        push_notification.assert_called_once_with(self.teacher.user_id, 'New Enrollments', notification.message)
+        push_subscriptions.assert_called_once_with(self.course.course_id, student_ids)
+        push_enrollment_notification(*push_notification.call_args.args)
+        push_course_subscriptions(*push_subscriptions.call_args.args)
+        self.assertEqual(async_to_sync(channel_layer.receive)(teacher_channel)['title'], 'New Enrollments')
+        for channel_name in student_channels:
+            event = async_to_sync(channel_layer.receive)(channel_name)
+            self.assertEqual((event['type'], event['course_id']), ('dynamic.subscription', self.course.course_id))
+
+    def test_failed_enrollment_push_not_notified_again(self):
+        with mock.patch('elearning_base.tasks.push_enrollment_notification.delay'), mock.patch('elearning_base.tasks.push_course_subscriptions.delay'):
+            send_bulk_enrollment_notification(self.course.course_id, [student.user_id for student in self.students])
+        #The push tasks retry on their own, the notification was created and counted once
+        with mock.patch('elearning_base.tasks.get_channel_layer', side_effect=ConnectionError), self.assertRaises(Retry):
+            push_enrollment_notification.apply(args=(self.teacher.user_id, 'New Enrollments', 'Message'), throw=True)
+        with mock.patch('elearning_base.tasks.get_channel_layer', side_effect=ConnectionError), self.assertRaises(Retry):
+            push_course_subscriptions.apply(args=(self.course.course_id, [self.students[0].user_id]), throw=True)
+        self.assertEqual(Notification.objects.filter(recipient=self.teacher).count(), 1)
+        self.assertEqual(User.objects.get(pk=self.teacher.pk).unread_notifications, 1)
+
+    def test_blocked_students_not_notified(self):
+        Enrollments.objects.filter(student=self.students[0]).update(blocked=True)
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+
+        notified = send_new_activity_notification(activity.activity_id)
+        self.assertEqual(notified, len(self.students) - 1)
+        self.assertFalse(Notification.objects.filter(recipient=self.students[0]).exists())
+
+    def test_material_notification_fan_out_query_count(self):
+        with mock.patch('elearning_base.signals.send_new_activity_notification.delay'):
+            activity = CourseActivity.objects.create(course=self.course, activity_title='Activity 1', description='Description 1')
+        with mock.patch('elearning_base.signals.send_new_material_notification.delay'):
+            material = CourseActivityMaterial.objects.create(course_activity=activity, material_title='Material 1', description='Description 1', video_link='https://example.com')
+
+        #Material lookup, enrolled students, one bulk insert and one unread count update (plus savepoint) regardless of enrollment size
+        with self.assertNumQueries(6):
+            notified = send_new_material_notification(material.material_id)
+        self.assertEqual(notified, len(self.students))
+        self.assertEqual(Notification.objects.filter(title='New Material').count(), len(self.students))
+
+@override_settings(LOBBY_MESSAGE_RETENTION_DAYS=30, LOBBY_RETENTION_BATCH_SIZE=4)
+class TestTrimLobbyMessages(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
+        now = timezone.now()
+        LobbyMessage.objects.bulk_create(
+            [LobbyMessage(user=self.user, message=f'Old {i}', created_at=now - timezone.timedelta(days=31 + i)) for i in range(10)] +
+            [LobbyMessage(user=self.user, message=f'Recent {i}', created_at=now - timezone.timedelta(days=29 - i)) for i in range(3)]
+        )
+
+    def test_old_messages_deleted_in_batches(self):
+        #3 batches of deletes, each a select of the ids and a delete
+        with self.assertNumQueries(7):
+            self.assertEqual(trim_lobby_messages(), 10)
+        self.assertEqual(sorted(LobbyMessage.objects.values_list('message', flat=True)), ['Recent 0', 'Recent 1', 'Recent 2'])
+
+@override_settings(NOTIFICATION_RETENTION_DAYS=30, NOTIFICATION_RETENTION_BATCH_SIZE=4, NOTIFICATION_ARCHIVE_PATH=None)
+class TestPurgeNotifications(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
+        now = timezone.now()
+        notifications = Notification.objects.bulk_create(
+            [Notification(recipient=self.user, title=f'Old read {i}', message='Message', read=True) for i in range(10)] +
+            [Notification(recipient=self.user, title='Old unread', message='Message'), Notification(recipient=self.user, title='Recent read', message='Message', read=True)]
+        )
+        #created_at is auto_now_add, set afterwards
+        Notification.objects.filter(pk__in=[n.pk for n in notifications[:11]]).update(created_at=now - timezone.timedelta(days=31))
+
+    def test_old_read_notifications_deleted_in_batches(self):
+        self.assertEqual(purge_notifications(), 10)
+        self.assertEqual(sorted(Notification.objects.values_list('title', flat=True)), ['Old unread', 'Recent read'])
+
+    def test_deleted_notifications_archived(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'notifications.jsonl')
+            with override_settings(NOTIFICATION_ARCHIVE_PATH=path):
+                purge_notifications()
+            with open(path) as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertEqual(sorted(row['title'] for row in rows), sorted(f'Old read {i}' for i in range(10)))
+        self.assertEqual(rows[0]['recipient_id'], self.user.pk)
+
+    def test_notification_marked_unread_during_purge_kept(self):
+        marked = Notification.objects.filter(title='Old read 3')
+        def mark_unread_before_delete(execute, sql, params, many, context):
+            #As update_notification_read, between the select of the batch and its delete
+            if sql.startswith('DELETE') and marked.filter(read=True).exists():
+                marked.update(read=False)
+            return execute(sql, params, many, context)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'notifications.jsonl')
+            with override_settings(NOTIFICATION_ARCHIVE_PATH=path), connection.execute_wrapper(mark_unread_before_delete):
+                self.assertEqual(purge_notifications(), 9)
+            with open(path) as archive:
+                titles = [json.loads(line)['title'] for line in archive]
+        self.assertTrue(marked.exists())
+        self.assertEqual(sorted(titles), sorted(f'Old read {i}' for i in range(10) if i != 3))
+
+class TestExpireUploads(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        course = Course.objects.create(course_title='Course', description='Description', teacher=teacher)
+        activity = CourseActivity.objects.create(course=course, activity_title='Activity', description='Description')
+        self.old = uploads.start(teacher, activity, Upload.MATERIAL, 'old.pdf', size=10, checksum='0' * 64, material_title='Old', description='Description')
+        self.recent = uploads.start(teacher, activity, Upload.MATERIAL, 'recent.pdf', size=10, checksum='0' * 64, material_title='Recent', description='Description')
+        #updated_at is auto_now, set afterwards
+        Upload.objects.filter(pk=self.old.pk).update(updated_at=timezone.now() - timezone.timedelta(hours=settings.UPLOAD_EXPIRY_HOURS + 1))
+
+    def test_expired_uploads_deleted_with_files(self):
+        self.assertEqual(expire_uploads(), 1)
+        self.assertEqual(list(Upload.objects.all()), [self.recent])
+        self.assertFalse(default_storage.exists(self.old.name))
+        self.assertTrue(default_storage.exists(self.recent.name))
+
+@override_settings(STORAGES={**settings.STORAGES, 'course_files': {'BACKEND': 'elearning_base.storage.ContentAddressedStorage'}})
+class TestCollectBlobs(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        teacher = User.objects.create_user(username='teacher', password='testpassword', email="teacher@test.com", is_teacher=True)
+        course = Course.objects.create(course_title='Course', description='Description', teacher=teacher)
+        activity = CourseActivity.objects.create(course=course, activity_title='Activity', description='Description')
+        self.kept = CourseActivityMaterial.objects.create(course_activity=activity, material_title='Kept', description='Description', file=SimpleUploadedFile('kept.pdf', b'kept'))
+        self.shared = [CourseActivityMaterial.objects.create(course_activity=activity, material_title=f'Shared {i}', description='Description', file=SimpleUploadedFile('shared.pdf', b'shared')) for i in range(2)]
+        self.removed = CourseActivityMaterial.objects.create(course_activity=activity, material_title='Removed', description='Description', file=SimpleUploadedFile('removed.pdf', b'removed'))
+        #A resized copy of the kept blob, referenced through it
+        self.derived = storage.blob_storage().save(self.kept.file.name.replace('.pdf', '.thumbnail.pdf'), SimpleUploadedFile('thumbnail.pdf', b'thumbnail'))
+
+    def age(self, *names):
+        old = timezone.now().timestamp() - (settings.BLOB_GC_GRACE_HOURS + 1) * 60 * 60
+        for name in names:
+            os.utime(storage.blob_storage().path(name), (old, old))
+
+    def test_unreferenced_blobs_deleted(self):
+        self.shared[0].delete()
+        self.removed.delete()
+        self.age(self.kept.file.name, self.derived, self.shared[1].file.name, self.removed.file.name)
+        self.assertEqual(collect_blobs(), {'files': 1, 'bytes': len(b'removed')})
+        blob_storage = storage.blob_storage()
+        self.assertFalse(blob_storage.exists(self.removed.file.name))
+        for name in (self.kept.file.name, self.derived, self.shared[1].file.name):
+            self.assertTrue(blob_storage.exists(name))
+
+    def test_recent_blobs_kept(self):
+        self.removed.delete()
+        self.assertEqual(collect_blobs(), {'files': 0, 'bytes': 0})
+        self.assertTrue(storage.blob_storage().exists(self.removed.file.name))
+
+    def test_usage(self):
+        self.removed.delete()
+        usage = storage.usage()
+        self.assertEqual(usage['blobs'], 4)
+        self.assertEqual(usage['stored_bytes'], len(b'kept') + len(b'thumbnail') + len(b'shared') + len(b'removed'))
+        self.assertEqual(usage['saved_bytes'], len(b'shared'))
+        self.assertEqual((usage['unreferenced_blobs'], usage['unreferenced_bytes']), (1, len(b'removed')))
+
+class TestImageDerivatives(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        media_root = override_settings(MEDIA_ROOT=self.media_root.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = User.objects.create_user(username='user', password='testpassword', email="user@test.com")
+        with open(os.path.join(settings.BASE_DIR, 'elearning_base', 'test_files', 'profile1.jpg'), 'rb') as f:
+            self.image = SimpleUploadedFile('profile1.jpg', f.read(), content_type='image/jpeg')
+
+    def upload(self):
+        with mock.patch('elearning_base.signals.generate_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.profile_img = self.image
+                self.user.save()
+        return delay
+
+    def test_upload_queues_derivatives(self):
+        delay = self.upload()
+        delay.assert_called_once_with('elearning_base.userprofile', self.user.pk, 'profile_img', self.user.profile_img.name)
+        #Saves which don't change the image queue nothing
+        with mock.patch('elearning_base.signals.generate_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.bio = 'Bio'
+                self.user.save(update_fields=['bio'])
+        delay.assert_not_called()
+
+    def test_derivatives_generated(self):
+        self.upload()
+        names = generate_image_derivatives('elearning_base.userprofile', self.user.pk, 'profile_img', self.user.profile_img.name)
+        self.assertEqual(len(names), 4)
+        widths = {}
+        for name in names:
+            with default_storage.open(name) as f, Image.open(f) as image:
+                widths[name] = image.width
+                self.assertEqual(image.format, 'WEBP' if name.endswith('.webp') else 'JPEG')
+        root = self.user.profile_img.name[:-len('.jpg')]
+        #The 500px wide image is resized to the thumbnail width, but not enlarged to the medium one
+        self.assertEqual(widths[f'{root}.thumbnail.webp'], settings.IMAGE_DERIVATIVE_WIDTHS['thumbnail'])
+        self.assertEqual(widths[f'{root}.medium.jpg'], 500)
+        #Saving the user again doesn't queue them again
+        with mock.patch('elearning_base.signals.generate_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+        delay.assert_not_called()
+
+    def test_serializer_urls(self):
+        self.upload()
+        data = UserProfileSerializer(self.user, context={'request': None}).data
+        #The original's until the copies are made
+        self.assertEqual(data['thumbnail_url'], self.user.profile_img.url)
+        generate_image_derivatives('elearning_base.userprofile', self.user.pk, 'profile_img', self.user.profile_img.name)
+        storage = self.user.profile_img.storage
+        #One stat for the image's four URLs
+        with mock.patch.object(storage, 'exists', wraps=storage.exists) as exists:
+            data = UserProfileSerializer(self.user, context={'request': None}).data
+        self.assertEqual(exists.call_count, 1)
+        self.assertTrue(data['thumbnail_url'].endswith('.thumbnail.jpg'))
+        self.assertTrue(data['thumbnail_webp_url'].endswith('.thumbnail.webp'))
+        self.assertTrue(data['medium_webp_url'].endswith('.medium.webp'))
+
+    def test_replaced_image_skipped(self):
+        self.upload()
+        self.assertEqual(generate_image_derivatives('elearning_base.userprofile', self.user.pk, 'profile_img', 'profile_imgs/old.jpg'), [])
+
+    def test_unreadable_image(self):
+        self.image = SimpleUploadedFile('profile1.jpg', b'not an image', content_type='image/jpeg')
+        self.upload()
+        with self.assertLogs('elearning_base.tasks', level='WARNING'):
+            self.assertEqual(generate_image_derivatives('elearning_base.userprofile', self.user.pk, 'profile_img', self.user.profile_img.name), [])
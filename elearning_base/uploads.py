@@ -0,0 +1,98 @@
+import hashlib
+from datetime import timedelta
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import CourseActivityMaterial, Submission, Upload
+from . import storage
+
+#Resumable chunked uploads of large material and submission files, a protocol along the lines of tus (tus.io), in place
+#of a single multipart request which is lost whole when the connection drops:
+#  1. POST api/uploads/ with the file's name, size and SHA-256 checksum (api.create_upload) - an empty file is created at
+#     its final storage path, the path the material's or submission's FileField would have given it
+#  2. PATCH api/uploads/<upload_id>/ with a chunk of the file as the body and its position in the Upload-Offset header
+#     (api.upload_chunk), until the whole file has been sent. A chunk cut short by the connection is kept up to where it
+#     stopped, GET api/uploads/<upload_id>/ returns the offset to resume from
+#  3. POST api/uploads/<upload_id>/finalize/ (api.finalize_upload) - the checksum is verified and the file is attached to
+#     a new material or submission, without being copied
+#Chunks are streamed from the request to the file READ_SIZE bytes at a time, memory use doesn't depend on the chunk or file
+#size. Needs a storage with local paths (FileSystemStorage). With the content-addressed course_files storage (storage.py)
+#the file is written to the default storage and moved into the blobs when finished, its checksum is the blob's digest.
+#Uploads not finished within UPLOAD_EXPIRY_HOURS are deleted along with their partial files (tasks.expire_uploads).
+
+READ_SIZE = 64 * 1024
+
+def start(user, course_activity, target, filename, **details):
+    #Reserves the file's final path by creating it empty
+    if target == Upload.MATERIAL:
+        instance, field = CourseActivityMaterial(course_activity=course_activity), CourseActivityMaterial._meta.get_field('file')
+    else:
+        instance, field = Submission(student=user, course_activity=course_activity), Submission._meta.get_field('file')
+    name = default_storage.save(field.generate_filename(instance, filename), ContentFile(b''))
+    return Upload.objects.create(user=user, course_activity=course_activity, target=target, name=name, **details)
+
+def append(upload, stream, offset, length):
+    #Writes up to length bytes of the stream to the file at offset, returns the new offset or None if the upload is no
+    #longer at offset (a chunk sent twice, or by two clients at once)
+    if offset != upload.offset:
+        return None
+    written = 0
+    with open(default_storage.path(upload.name), 'r+b') as f:
+        f.seek(offset)
+        while written < length:
+            try:
+                data = stream.read(min(READ_SIZE, length - written))
+            except OSError:
+                #The connection dropped, what has been written is kept
+                break
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+    #Only moves the offset on from where this chunk started, a concurrent chunk at the same offset which got there first
+    #wins (and the checksum catches differing bytes)
+    if not Upload.objects.filter(pk=upload.pk, offset=offset).update(offset=F('offset') + written, updated_at=timezone.now()):
+        return None
+    upload.offset = offset + written
+    return upload.offset
+
+def verify(upload):
+    #Whether the file matches the checksum, read READ_SIZE bytes at a time
+    digest = hashlib.sha256()
+    with default_storage.open(upload.name, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest() == upload.checksum.lower()
+
+def restart(upload):
+    #Empties the file, for the whole file to be sent again
+    with open(default_storage.path(upload.name), 'r+b') as f:
+        f.truncate(0)
+    upload.offset = 0
+    upload.save(update_fields=['offset', 'updated_at'])
+
+def finish(upload):
+    #Creates the material or submission with the uploaded file, returns it
+    with transaction.atomic():
+        if upload.target == Upload.MATERIAL:
+            instance = CourseActivityMaterial(course_activity=upload.course_activity, material_title=upload.material_title, description=upload.description)
+        else:
+            instance = Submission(student=upload.user, course_activity=upload.course_activity)
+        if storage.is_content_addressed():
+            instance.file.name = storage.blob_storage().adopt(default_storage.path(upload.name), upload.checksum, upload.name)
+        else:
+            instance.file.name = upload.name
+        instance.save()
+        upload.delete()
+    return instance
+
+def expire(hours):
+    #Deletes the uploads not written to for hours, and their files. Returns the number deleted.
+    expired = Upload.objects.filter(updated_at__lt=timezone.now() - timedelta(hours=hours))
+    deleted = 0
+    for upload in expired.iterator():
+        default_storage.delete(upload.name)
+        deleted += Upload.objects.filter(pk=upload.pk).delete()[0]
+    return deleted
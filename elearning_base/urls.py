@@ -4,7 +4,6 @@ from django.contrib.auth.views import LogoutView
 from . import views
 from . import api
 from django.conf import settings
-from django.conf.urls.static import static
 
 urlpatterns = [
     #Traditional views
@@ -31,12 +30,20 @@ urlpatterns = [
     path('api/create_course/', api.create_course, name='create_course_api'),
     path('api/create_feedback/<int:course_id>/', api.create_feedback, name='create_feedback'),
     path('api/create_enrollment/<int:course_id>', api.create_enrollment, name='create_enrollment'),
+    path('api/create_enrollments/<int:course_id>/', api.create_enrollments, name='create_enrollments'),
     path('api/create_course_activity/<int:course_id>/', api.create_course_activity, name='create_course_activity'),
     path('api/create_course_activity_material/<int:activity_id>/', api.create_course_activity_material, name='create_course_activity_material'),
 
+    #Resumable uploads
+    path('api/uploads/', api.create_upload, name='create_upload'),
+    path('api/uploads/<uuid:upload_id>/', api.upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/finalize/', api.finalize_upload, name='finalize_upload'),
+
     #Update
     path('api/update_blocked_status/<int:enrollment_id>/', api.update_blocked_status, name='update_blocked_status'),
+    path('api/update_submission_grades/<int:activity_id>/', api.update_submission_grades, name='update_submission_grades'),
     path('api/update_notification_read/<int:notification_id>/', api.update_notification_read, name='update_notification_read'),
+    path('api/mark_notifications_read/', api.mark_notifications_read, name='mark_notifications_read'),
     path('api/update_user/<int:user_id>/', api.update_user_api, name='update_user_api'),
 
     #Get
@@ -47,9 +54,11 @@ urlpatterns = [
     path('api/get_available_courses/', api.GetAvailableCourses.as_view(), name='get_available_courses'),
     path('api/get_enrolled_students/<int:course_id>/', api.get_enrolled_students, name='get_enrolled_students'),    
     path('api/get_course_feedback/<int:course_id>/', api.get_course_feedback, name='get_course_feedback'),
+    path('api/get_gradebook/<int:course_id>/', api.get_gradebook, name='get_gradebook'),
     path('api/get_course_activities/<int:course_id>/', api.get_course_activities_with_materials, name='get_course_activities_with_materials'),
     path('api/get_notifications/<int:user_id>/', api.get_notifications, name='get_notifications'),
     path('api/get_latest_lobby_messages/', api.get_latest_lobby_messages, name='get_latest_lobby_messages'),
+    path('api/get_lobby_history/', api.get_lobby_history, name='get_lobby_history'),
     path('api/get_user/<int:user_id>/', api.get_user_api, name='get_user_api'),
 
     #Delete
@@ -58,5 +67,5 @@ urlpatterns = [
     path('api/delete_user/<int:user_id>/', api.delete_user_api, name='delete_user_api'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+#Uploaded files, served to the users allowed to read them (media.py)
+urlpatterns += [path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', views.protected_media, name='protected_media')]
\ No newline at end of file
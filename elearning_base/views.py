@@ -4,16 +4,36 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.views import LogoutView
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-import json
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.views.decorators.http import require_safe
 from .models import *
 from .forms import *
-from .api import *
+from .services import *
+from . import search, media
+from .db_router import use_replica
+from .pagination import InvalidCursor, encode_cursor
+
 #redirect when successful action that modifies data to prevent duplicate submissions if the user refreshes
 #render when displaying data or template with context directly to user without changing URL in browser
 
 # Traditional django views which handle the rendering of templates, processing of forms, 
-#and calling of api functions to retrieve data from the backend to be unified in the template context object and displayed in the frontend.
+#and calling of the service layer (services.py) to retrieve data from the backend to be unified in the template context object and displayed in the frontend.
+#The service layer is shared with the api functions, so the views get the same data without the api response round trip.
+
+#Lists shown per page of the profile and course pages
+PROFILE_PAGE_SIZE = 10
+COURSES_PAGE_SIZE = 12
+FEEDBACK_PAGE_SIZE = 10
+
+def get_cursor_page(get_page, request, *args, page_size, param='cursor'):
+    #Only the rendered page is fetched, an invalid cursor falls back to the first page. A page with several lists gives
+    #each its own query parameter.
+    try:
+        return get_page(request, *args, cursor=request.GET.get(param), page_size=page_size)
+    except InvalidCursor:
+        return get_page(request, *args, page_size=page_size)
 
 def login_view(request):
     if request.method == 'POST':
@@ -53,21 +73,13 @@ def swagger_logout_view(request):
 
 @login_required
 def home_view(request):
-    #In the users own profile, we are not retrieving the user profile via api call as we are in user_profile_view
+    #In the users own profile, we are not retrieving the user profile via the service layer as we are in user_profile_view
     #But instead we are using the user object already available in the request
     status_update_form = StatusUpdateForm()
-    status_update_response = get_status_updates(request, request.user.user_id)
-    if status_update_response.status_code == 200:
-        status_updates = json.loads(status_update_response.content)
-    else:
-        status_updates = {}
+    status_updates = get_cursor_page(get_status_updates_page, request, request.user, page_size=PROFILE_PAGE_SIZE, param='status_cursor')
     
     if request.user.is_teacher:
-        courses_taught_response = get_courses_taught(request, request.user.user_id)
-        if courses_taught_response.status_code == 200:
-            courses_taught = json.loads(courses_taught_response.content)
-        else:
-            courses_taught = {}
+        courses_taught = get_cursor_page(get_courses_taught_page, request, request.user, page_size=PROFILE_PAGE_SIZE, param='courses_cursor')
         
         context = {
         'is_own_profile': True,
@@ -77,11 +89,7 @@ def home_view(request):
         'courses_taught': courses_taught
     }
     else:
-        enrollments_response = get_enrolled_courses(request, request.user.user_id)
-        if enrollments_response.status_code == 200:
-            enrolled_courses = json.loads(enrollments_response.content)
-        else:
-            enrolled_courses = {}
+        enrolled_courses = get_cursor_page(get_enrolled_courses_page, request, request.user, page_size=PROFILE_PAGE_SIZE, param='courses_cursor')
 
         context = {
         'is_own_profile': True,
@@ -101,16 +109,12 @@ def user_profile_view(request, user_id):
 
     is_own_profile = request.user.user_id == user_id
 
-    profile_user_response=get_user_api(request, user_id)
-    profile_user = json.loads(profile_user_response.content) if profile_user_response.status_code == 200 else {}
-    print(profile_user)
-
-    status_update_response = get_status_updates(request, user_id)
-    status_updates = json.loads(status_update_response.content) if status_update_response.status_code == 200 else {}
+    user = UserProfile.objects.filter(user_id=user_id).first()
+    profile_user = get_user_data(request, user) if user and can_view_user(request.user, user) else {}
+    status_updates = get_cursor_page(get_status_updates_page, request, user, page_size=PROFILE_PAGE_SIZE, param='status_cursor') if user else None
     
     if profile_user.get('is_teacher'):
-        courses_taught_response = get_courses_taught(request, user_id)
-        courses_taught = json.loads(courses_taught_response.content) if courses_taught_response.status_code == 200 else {}
+        courses_taught = get_cursor_page(get_courses_taught_page, request, user, page_size=PROFILE_PAGE_SIZE, param='courses_cursor')
         
         context = {
             'is_own_profile': is_own_profile,
@@ -120,8 +124,7 @@ def user_profile_view(request, user_id):
             'form': status_update_form
         }
     else:    
-        enrollments_response = get_enrolled_courses(request, user_id)
-        enrolled_courses = json.loads(enrollments_response.content) if enrollments_response.status_code == 200 else {}
+        enrolled_courses = get_cursor_page(get_enrolled_courses_page, request, user, page_size=PROFILE_PAGE_SIZE, param='courses_cursor') if user else None
 
         context = {
             'is_own_profile': is_own_profile,
@@ -135,27 +138,32 @@ def user_profile_view(request, user_id):
 
 @login_required
 def update_profile_view(request):
+    #Saved without the unread count, which is only written by atomic updates (notification_counts.py)
+    user = UserProfile.objects.defer('unread_notifications').get(pk=request.user.pk)
     if request.method == 'POST':
-        form = UserProfileUpdateForm(request.POST, request.FILES, instance=request.user)
+        form = UserProfileUpdateForm(request.POST, request.FILES, instance=user)
         if form.is_valid():
             form.save()
             return redirect('home')
     else:
-        form = UserProfileUpdateForm(instance=request.user)
+        form = UserProfileUpdateForm(instance=user)
     
     return render(request, 'elearning_base/update_profile.html', {'form': form})
 
+@use_replica
 @login_required
 def search_view(request):
     query = request.GET.get('query', '')
-    search_results_response = get_search_results(request, query)
-    search_results = json.loads(search_results_response.content) if search_results_response.status_code == 200 else {}
+    page = search.parse_page(request.GET.get('page'))
+    search_results = get_search_results_data(request, query, page)
 
     context = {
         'courses': search_results.get('courses', []),
         'teachers': search_results.get('teachers', []),
         'students': search_results.get('students', []),
-        'query': query
+        'query': query,
+        'page': page,
+        'has_next': any(search_results['has_next'].values()),
     }
 
     return render(request, 'elearning_base/search.html', context)
@@ -171,15 +179,13 @@ def create_course_view(request):
 @login_required
 def enrolled_taught_courses_view(request):
     if request.user.is_teacher:
-        courses_taught_response = get_courses_taught(request, request.user.user_id)
-        courses_taught = json.loads(courses_taught_response.content) if courses_taught_response.status_code == 200 else {}
+        courses_taught = get_cursor_page(get_courses_taught_page, request, request.user, page_size=COURSES_PAGE_SIZE)
 
         context = {
             'courses_taught': courses_taught
         }
     else:
-        enrolled_courses_response = get_enrolled_courses(request, request.user.user_id)
-        enrolled_courses = json.loads(enrolled_courses_response.content) if enrolled_courses_response.status_code == 200 else {}
+        enrolled_courses = get_cursor_page(get_enrolled_courses_page, request, request.user, page_size=COURSES_PAGE_SIZE)
 
         context = {
             'enrolled_courses': enrolled_courses
@@ -193,19 +199,14 @@ def course_view(request, course_id):
     course_activity_material_form = CourseActivityMaterialForm()
 
     course = get_object_or_404(Course, pk=course_id)
-    feedback_response = get_course_feedback(request, course_id)
-    course_feedback = json.loads(feedback_response.content) if feedback_response.status_code == 200 else {}
-    course_activities_response = get_course_activities_with_materials(request, course_id)
-    course_activities = json.loads(course_activities_response.content) if course_activities_response.status_code == 200 else {}
+    course_feedback = get_cursor_page(get_course_feedback_page, request, course, page_size=FEEDBACK_PAGE_SIZE)
+    course_activities = get_course_activities_data(request, course) if can_view_course_activities(request.user, course) else {}
 
-    is_creator = request.user.user_id == course.teacher.user_id
-    is_enrolled = Enrollments.objects.filter(student=request.user, course=course).exists()
+    is_creator = request.user.user_id == course.teacher_id
+    enrollment = Enrollments.objects.filter(student=request.user, course=course).first()
+    is_enrolled = enrollment is not None
     is_teacher_viewer = request.user.is_teacher and not is_creator
-
-    is_blocked = False
-    if is_enrolled:
-        enrollment = Enrollments.objects.get(student=request.user, course=course)
-        is_blocked = enrollment.blocked
+    is_blocked = enrollment.blocked if is_enrolled else False
 
     context = {
         'course': course,
@@ -224,40 +225,49 @@ def course_view(request, course_id):
 
 @login_required
 def enrolled_students_view(request, course_id):
-    enrollments_response = get_enrolled_students(request, course_id)
-    enrollments = json.loads(enrollments_response.content) if enrollments_response.status_code == 200 else {}
-
-    paginator = Paginator(enrollments, 10)  # Show 10 enrollments per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    course = Course.objects.filter(course_id=course_id).first()
+    #Enrolled students are only viewable by the teacher of the course
+    page = None
+    if course and request.user.user_id == course.teacher_id:
+        page = get_cursor_page(get_enrolled_students_page, request, course, page_size=10) # Show 10 enrollments per page
 
     context = {
-        'page_obj': page_obj,
+        'page': page,
         'course_id': course_id    
     }
     return render(request, 'elearning_base/enrolled_students.html', context)
 
 @login_required
 def notifications_view(request):
-    notifications_response = get_notifications(request, request.user.user_id)
-    notifications = json.loads(notifications_response.content) if notifications_response.status_code == 200 else {}
-
-    paginator = Paginator(notifications, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page = get_cursor_page(get_notifications_page, request, request.user, page_size=20)
+    #Mark all as read covers the user's notifications up to the newest unread one when the page was loaded, whichever page
+    #is shown, not ones which arrived after
+    newest = notifications_queryset(request.user).select_related(None).order_by('-created_at', '-pk').only('pk', 'created_at').first()
 
     context = {
-        'page_obj': page_obj,
-        'notifications': notifications
+        'page': page,
+        'notifications': page.items,
+        'mark_read_cursor': encode_cursor(newest, 'created_at') if newest else None
     }
     return render(request, 'elearning_base/notifications.html', context)
 
 @login_required
 def lobby_view(request):
-    latest_messages_response = get_latest_lobby_messages(request)
-    latest_messages = json.loads(latest_messages_response.content) if latest_messages_response.status_code == 200 else []
+    latest_messages = get_latest_lobby_messages_page(request).items
 
     context = {
         'latest_messages': latest_messages
     }
-    return render(request, 'elearning_base/lobby.html', context)
\ No newline at end of file
+    return render(request, 'elearning_base/lobby.html', context)
+
+#Uploaded files (MEDIA_URL), sent once the user is found to be allowed to read them (media.py)
+@require_safe
+def protected_media(request, path):
+    name = media.media_name(path)
+    if name is None:
+        raise Http404('File not found')
+    if not media.is_public(name) and not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    if not media.can_access(request.user, name):
+        raise PermissionDenied
+    return media.serve(request, name)
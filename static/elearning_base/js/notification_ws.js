@@ -9,18 +9,17 @@ notificationSocket.onmessage = function (event) {
     const data = JSON.parse(event.data);
     console.log('Notification received:', data)
 
-    if (data.message === 'New message in the public lobby'){
+    if (data.unread_count !== undefined) {
+        // Unread notifications count, sent whenever it changes
+        const newNotificationsIndicator = document.getElementById('newNotificationsIndicator');
+        newNotificationsIndicator.textContent = data.unread_count;
+        newNotificationsIndicator.classList.toggle('hidden', data.unread_count === 0);
+    } else if (data.message === 'New message in the public lobby'){
         const newMessageIndicator = document.getElementById('newMessagesIndicator');
         if (newMessageIndicator.classList.contains('hidden')) {
             newMessageIndicator.classList.remove('hidden');
         }
     } else{
-        const newNotificationsIndicator = document.getElementById('newNotificationsIndicator'); 
-        // Check if the indicator 'NEW' is hidden on left panel, if so, remove the hidden class
-        if (newNotificationsIndicator.classList.contains('hidden')) {
-            newNotificationsIndicator.classList.remove('hidden');
-        }
-
         var newNotification = document.createElement('div');
         newNotification.className = "bg-green-500 text-white p-4 rounded-lg shadow-lg transition-opacity duration-1000 opacity-100";
         newNotification.style.position = "relative";
@@ -48,24 +47,3 @@ notificationSocket.onclose = function (event) {
 notificationSocket.onerror = function (event) {
     console.error('Notification WebSocket error:', event);
 }
-
-document.addEventListener('DOMContentLoaded', function() {
-    const userId = document.querySelector('button[data-user-id]').getAttribute('data-user-id');
-    fetch(`/api/get_notifications/${userId}/`, {
-        method: 'GET',
-        headers: {
-            'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
-            'Content-Type': 'application/json',
-        },
-    })
-    .then(response => response.json())
-    .then(data => {
-        const newNotification = document.getElementById('newNotificationsIndicator');
-        if (data.length > 0) {
-            newNotification.classList.remove('hidden');
-        } else {
-            newNotification.classList.add('hidden');
-        }
-    })
-    .catch(error => console.error('Error:', error));
-})
\ No newline at end of file
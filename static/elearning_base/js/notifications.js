@@ -18,3 +18,26 @@ document.querySelectorAll('.toggle-read-status').forEach(button => {
         .catch(error => console.error('Error:', error));
     });
 });
+
+// Marks every notification up to the newest one shown read with a single request
+const markAllRead = document.getElementById('markAllRead');
+if (markAllRead) {
+    markAllRead.addEventListener('click', function() {
+        fetch('/api/mark_notifications_read/', {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': document.querySelector('[name=csrfmiddlewaretoken]').value,
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({up_to: this.getAttribute('data-up-to')}),
+        })
+        .then(response => {
+            if (response.ok) {
+                window.location.href = window.location.pathname;
+            } else {
+                alert('Failed to mark the notifications as read.');
+            }
+        })
+        .catch(error => console.error('Error:', error));
+    });
+}